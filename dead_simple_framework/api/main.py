@@ -9,7 +9,10 @@ from ..config import App_Settings, Sentry_Settings, Slack_Settings
 from .errors import API_Error
 
 # Database
-from ..database import Database
+from ..database import Database, Query_Shapes
+
+# Cache
+from ..cache import Document_Cache, Id_Filter
 
 # Route object
 from ..config import Route
@@ -123,14 +126,27 @@ class RouteHandler:
         '''
         
         try:
-            # Use the query string to send a database query
-            data_cursor = fetch_and_filter_data(payload, collection, lazy=True)
-            # Sort the data if one was specified in the query string
-            sorted_data = sort_data(data_cursor, payload)
-            # Limit the data if a limit was specified in the payload
-            limited_data = limit_data(sorted_data, payload)
-
-            data = list(limited_data)
+            # Answer lookups for records that definitely don't exist without querying the database
+            _id = get_id_lookup(payload) if Document_Cache.is_enabled(collection) or Id_Filter.is_enabled(collection) else None
+            if _id and Id_Filter.is_enabled(collection) and not Id_Filter.might_exist(collection, _id):
+                return JsonResponse({'data': []}, 404)
+
+            # Serve single record lookups from the document cache if it's enabled for the collection
+            if _id and Document_Cache.is_enabled(collection):
+                document = Document_Cache.get(collection, _id)
+                return JsonResponse({'data': [document] if document else []}, 200 if document else 404)
+
+            # Record the shape of the query if it is sampled
+            with Query_Shapes.track(collection) as sample:
+                # Use the query string to send a database query
+                data_cursor = fetch_and_filter_data(payload, collection, lazy=True, sample=sample)
+                # Sort the data if one was specified in the query string
+                sorted_data = sort_data(data_cursor, payload)
+                # Limit the data if a limit was specified in the payload
+                limited_data = limit_data(sorted_data, payload)
+
+                data = list(limited_data)
+                sample.returned = len(data)
             
             return JsonResponse({'data': data}, 200 if len(data) > 0 else 404)
             
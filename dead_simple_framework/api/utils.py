@@ -8,6 +8,15 @@ from .errors import API_Error
 from pymongo.collection import Collection
 from pymongo.cursor import Cursor
 from bson import ObjectId
+from ..database.shapes import Query_Shapes, Query_Sample
+
+# Cache
+from ..cache import Document_Cache, Id_Filter
+from ..cache.versions import Collection_Versions
+from ..database.watcher import Change_Watcher
+
+# Settings
+from ..config import MongoDB_Settings
 
 # Typing
 from typing import Union
@@ -17,7 +26,7 @@ from json import dumps
 import re
 
 # Encoding
-from ..encoder import JSON_Encoder
+from ..encoder import JSON_Encoder, BSON_JSON_Encoder
 
 # Debug
 import logging
@@ -33,7 +42,7 @@ def JsonResponse(content: dict = {}, code: int = 200) -> Response:
     '''
 
 
-    return Response(dumps(content, cls=JSON_Encoder), code, mimetype='application/json')
+    return Response(dumps(content, cls=BSON_JSON_Encoder), code, mimetype='application/json')
 
 
 def JsonError(content: Union[dict, str] = {}, code: int = 500) -> Response:
@@ -170,12 +179,13 @@ def create_query_string(query_params:dict) -> str:
     return '?' + '&'.join([f"{k}={v}" for k,v in query_params.items()]) if query_params else ''
 
 
-def fetch_and_filter_data(request_params: dict, collection:Collection, lazy=False) -> list:
+def fetch_and_filter_data(request_params: dict, collection:Collection, lazy=False, sample:Query_Sample=None) -> list:
     ''' Fetch records from the database matching a filter supplied in an HTTP request.
         Ensure fields supplied in the filter exist for the model. If no filter is supplied
         all objects are retrived.
     
         --> request_params : The parameters sent with the request (in querystring or body).
+        --> sample : A `Query_Shapes.track()` sample to record the query shape in if the caller is timing a lazy query. Optional.
         <-- A list containing the MongoDB data matching the supplied filter or all objects in a collection.
     '''
 
@@ -194,13 +204,37 @@ def fetch_and_filter_data(request_params: dict, collection:Collection, lazy=Fals
         else:
             mongo_filter['_id'] = op
 
+    mongo_sort = [(x, int(y)) for x,y in request_params.get('sort', {}).items()] if request_params.get('sort') else None
     if request_params.get('sort'):
         [mongo_filter.update({s: {'$exists': True}}) for s in request_params.pop('sort').keys() if s != '_id']
 
-    res = collection.find(mongo_filter)
-    return list(res) if not lazy else res
+    if sample is not None:
+        sample.filter, sample.sort = mongo_filter, mongo_sort
+
+    if lazy:
+        return collection.find(mongo_filter)
+
+    with Query_Shapes.track(collection, mongo_filter) as sample:
+        res = list(collection.find(mongo_filter))
+        sample.returned = len(res)
+
+    return res
     
 
+def get_id_lookup(request_params: dict) -> ObjectId:
+    ''' Get the ObjectId if the parameters sent in an HTTP request only look up a single record by `_id`.
+        --> request_params : The parameters sent with the request (in querystring or body).
+        <-- The ObjectId to look up or None if the request filters on anything else.
+    '''
+
+    mongo_filter = request_params.get('filter') or {k:v for k,v in request_params.items() if k != 'limit'}
+    if list(mongo_filter.keys()) != ['_id'] or (request_params.get('filter') and set(request_params) - {'filter', 'limit'}):
+        return None
+
+    _id = mongo_filter['_id']
+    return ObjectId(_id) if isinstance(_id, (str, ObjectId)) and ObjectId.is_valid(_id) else None
+
+
 def sort_data(data: Cursor, request_params: dict) -> list:
     ''' Sorts a data according to the parameters sent in an HTTP request.
         --> data : The cursor of data to apply the sort to.
@@ -229,6 +263,18 @@ def limit_data(data: Cursor, request_params: dict) -> list:
     return data
 
 
+def invalidate_cached(collection:Collection, _id:ObjectId):
+    ''' Invalidate cached copies of a record after it is written. Also bumps the collection version if
+        it is watched but the server doesn't support change streams (so the watcher can't)
+    '''
+
+    if Document_Cache.is_enabled(collection): 
+        Document_Cache.invalidate(collection, _id)
+
+    if Change_Watcher.SUPPORTED == False and collection.name in MongoDB_Settings.MONGODB_WATCH_COLLECTIONS:
+        Collection_Versions.bump(collection.database.name, collection.name)
+
+
 def insert_data(request_params: dict, collection:Collection) -> str:
     ''' Add data to the collection with the parameters sent in an HTTP request.
         --> request_params [dict] : The parameters sent with the request (in querystring or body).
@@ -238,7 +284,13 @@ def insert_data(request_params: dict, collection:Collection) -> str:
     if collection is None: raise API_Error('No collection was specified to insert data for this route! Check your Route configuration', 500)
 
     mongo_fields = request_params.copy()
-    return str(collection.insert_one(mongo_fields).inserted_id)
+    inserted_id = collection.insert_one(mongo_fields).inserted_id
+
+    # Clear any cached miss for the ID
+    invalidate_cached(collection, inserted_id)
+    if Id_Filter.is_enabled(collection): Id_Filter.add(collection, inserted_id)
+
+    return str(inserted_id)
 
 
 def update_data(request_params: dict, collection:Collection, upsert:bool=False) -> bool:
@@ -253,7 +305,10 @@ def update_data(request_params: dict, collection:Collection, upsert:bool=False)
     mongo_fields = request_params.copy()
     _id = mongo_fields.pop('_id', None)
     if _id:
-        return collection.update_one({'_id': ObjectId(_id)}, {'$set': mongo_fields}, upsert=upsert).acknowledged
+        result = collection.update_one({'_id': ObjectId(_id)}, {'$set': mongo_fields}, upsert=upsert).acknowledged
+        invalidate_cached(collection, ObjectId(_id))
+        if upsert and Id_Filter.is_enabled(collection): Id_Filter.add(collection, ObjectId(_id))
+        return result
     else:
         raise API_Error('No ID supplied', 400)
 
@@ -270,6 +325,9 @@ def delete_data(request_params: dict, collection:Collection, delete_all:bool=Fal
     mongo_fields = request_params.copy()
     func = collection.delete_many if delete_all else collection.delete_one
     if mongo_fields.get('_id'):
-        return func({'_id': ObjectId(mongo_fields.pop('_id'))}).deleted_count > 0
+        _id = ObjectId(mongo_fields.pop('_id'))
+        result = func({'_id': _id}).deleted_count > 0
+        invalidate_cached(collection, _id)
+        return result
     else:
         raise API_Error('No ID supplied', 400)
@@ -1 +1,10 @@
-from .main import Cache
\ No newline at end of file
+from .main import Cache
+from .local import Local_Cache
+from .codec import Cache_Codec
+from .metrics import Cache_Metrics
+from .backends import Redis_Backend, Memory_Backend
+from .sharding import Hash_Ring, Sharded_Backend, Cluster_Backend
+from .documents import Document_Cache
+from .invalidation import Invalidation_Bus
+from .versions import Collection_Versions
+from .bloom import Bloom_Filter, Id_Filter
\ No newline at end of file
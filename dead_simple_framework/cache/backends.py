@@ -0,0 +1,573 @@
+# Redis
+import redis
+
+# Redis Errors
+from redis.exceptions import ResponseError, DataError
+
+# Utilities
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+import queue, threading, time, types
+
+# Typing
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+
+class Redis_Backend(redis.Redis):
+    ''' Backend used by `Cache` when `USE_REDIS` is set and Redis responds to a ping '''
+
+    IN_MEMORY = False
+
+    # Lua scripts for commands that compare and write atomically
+    DELETE_IF_EQUAL = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+    EXPIRE_IF_EQUAL = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+    SET_IF_EQUAL = "if (redis.call('get', KEYS[1]) or '') == ARGV[2] then redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[3]) return 1 end return 0"
+    SET_IF_NEWER = (
+        "local stored = redis.call('get', KEYS[1]) "
+        "if not stored or string.sub(stored, 1, #ARGV[1]) <= ARGV[1] then redis.call('set', KEYS[1], ARGV[1] .. ARGV[2], 'EX', ARGV[3]) return 1 end return 0"
+    )
+    HSET_IF_GREATER = (
+        "local set = {} for i = 1, #ARGV, 2 do local stored = redis.call('hget', KEYS[1], ARGV[i]) "
+        "if not stored or stored <= ARGV[i + 1] then redis.call('hset', KEYS[1], ARGV[i], ARGV[i + 1]) table.insert(set, ARGV[i]) end "
+        "end return set"
+    )
+
+    SCRIPTED = ('delete_if_equal', 'expire_if_equal', 'set_if_equal', 'set_if_newer', 'hset_if_greater')   # Commands run as the scripts above
+
+    def pipeline(self, transaction:bool=True, shard_hint=None):
+        return Redis_Backend.with_scripts(super().pipeline(transaction, shard_hint))
+
+
+    @staticmethod
+    def with_scripts(pipe):
+        ''' Let a pipeline queue the scripted commands (sent as EVAL) '''
+
+        for name in Redis_Backend.SCRIPTED:
+            setattr(pipe, name, types.MethodType(getattr(Redis_Backend, name), pipe))
+
+        return pipe
+
+
+    def delete_if_equal(self, name, value) -> int:
+        ''' Delete a string key only if it holds `value`. Returns the number of keys deleted '''
+
+        return self.eval(Redis_Backend.DELETE_IF_EQUAL, 1, name, value)
+
+
+    def expire_if_equal(self, name, value, ex:int) -> int:
+        ''' Set a string key to expire after `ex` seconds only if it holds `value`. Returns 1 if its TTL was set '''
+
+        return self.eval(Redis_Backend.EXPIRE_IF_EQUAL, 1, name, value, ex)
+
+
+    def set_if_equal(self, name, value, expected, ex:int) -> int:
+        ''' Set a string key expiring after `ex` seconds only if it holds `expected` (or doesn't exist if `expected` is empty). Returns 1 if set '''
+
+        return self.eval(Redis_Backend.SET_IF_EQUAL, 1, name, value, expected, ex)
+
+
+    def set_if_newer(self, name, order, value, ex:int) -> int:
+        ''' Set a string key expiring after `ex` seconds to `order` followed by `value` unless the order it starts with sorts after `order`. Returns 1 if set '''
+
+        return self.eval(Redis_Backend.SET_IF_NEWER, 1, name, order, value, ex)
+
+
+    def hset_if_greater(self, name, mapping:dict) -> List[bytes]:
+        ''' Set each hash field whose stored value doesn't sort after the new one. Returns the fields set '''
+
+        return self.eval(Redis_Backend.HSET_IF_GREATER, 1, name, *(item for field in mapping.items() for item in field))
+
+
+class Memory_Backend:
+    ''' Thread-safe in-process stand-in for Redis. Used by `Cache` when `USE_REDIS` is off or Redis can't be reached
+
+        Implements the subset of the `redis.Redis` API that `Cache` uses (strings, bitmaps, hashes, sets, TTLs, SCAN, pipelines and pub/sub)
+        with the same return types and errors. The least recently used keys are evicted once the stored keys and values
+        take up more than `max_bytes`. Data is only visible to the current process
+    '''
+
+    IN_MEMORY = True
+
+    _WRONGTYPE = 'WRONGTYPE Operation against a key holding the wrong kind of value'
+
+    def __init__(self, max_bytes:int=None):
+        self.max_bytes = max_bytes
+
+        self._data:OrderedDict = OrderedDict()          # key -> value (bytes for strings, dict of bytes for hashes, set of bytes for sets)
+        self._expires:Dict[bytes, float] = {}           # key -> time.monotonic() it expires at
+        self._sizes:Dict[bytes, int] = {}               # key -> approximate size in bytes
+        self._bytes = 0
+        self._subscribers:Dict[bytes, set] = {}         # channel -> queues of subscribed `Memory_PubSub`s
+        self._lock = threading.RLock()
+
+
+    # Encoding (same rules as redis-py)
+
+    @staticmethod
+    def _encode(value:Any) -> bytes:
+        if isinstance(value, bytes): return value
+        if isinstance(value, str): return value.encode()
+        if isinstance(value, (int, float)) and not isinstance(value, bool): return repr(value).encode()
+
+        raise DataError(f"Invalid input of type: '{type(value).__name__}'. Convert to a bytes, string, int or float first.")
+
+
+    # Storage
+
+    def _get(self, key:Union[str, bytes], kind:type=None) -> Any:
+        ''' Get an unexpired value (lock must be held), checking it's the expected kind '''
+
+        key = self._encode(key)
+        if key in self._expires and self._expires[key] <= time.monotonic():
+            self._delete(key)
+
+        value = self._data.get(key)
+        if value is None:
+            return None
+
+        if kind and not isinstance(value, kind):
+            raise ResponseError(self._WRONGTYPE)
+
+        self._data.move_to_end(key)
+        return value
+
+
+    def _store(self, key:bytes, value:Union[bytes, dict, set], keep_ttl:bool=False):
+        ''' Store a value (lock must be held) and evict the least recently used keys if over the memory limit '''
+
+        if not keep_ttl: self._expires.pop(key, None)
+        self._bytes -= self._sizes.get(key, 0)
+        if isinstance(value, dict):  size = sum(len(k) + len(v) for k, v in value.items())
+        elif isinstance(value, set): size = sum(len(v) for v in value)
+        else:                        size = len(value)
+
+        self._sizes[key] = len(key) + size
+        self._bytes += self._sizes[key]
+        self._data[key] = value
+        self._data.move_to_end(key)
+
+        while self.max_bytes and self._bytes > self.max_bytes and len(self._data) > 1:
+            self._delete(next(iter(self._data)))
+
+
+    def _delete(self, key:bytes) -> bool:
+        ''' Remove a key (lock must be held) '''
+
+        if key not in self._data:
+            return False
+
+        del self._data[key]
+        self._expires.pop(key, None)
+        self._bytes -= self._sizes.pop(key, 0)
+        return True
+
+
+    # Server
+
+    def ping(self) -> bool:
+        return True
+
+
+    def flushall(self, asynchronous:bool=False) -> bool:
+        with self._lock:
+            self._data.clear(); self._expires.clear(); self._sizes.clear()
+            self._bytes = 0
+
+        return True
+
+
+    def save(self) -> bool:
+        return True
+
+
+    # Keys
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            return sum(self._delete(self._encode(key)) for key in keys if self._get(key) is not None)
+
+    unlink = delete
+
+
+    def exists(self, *keys) -> int:
+        with self._lock:
+            return sum(1 for key in keys if self._get(key) is not None)
+
+
+    def type(self, key) -> bytes:
+        with self._lock:
+            value = self._get(key)
+
+        if value is None: return b'none'
+        return b'hash' if isinstance(value, dict) else b'set' if isinstance(value, set) else b'string'
+
+
+    def expire(self, key, time_seconds:int) -> bool:
+        with self._lock:
+            if self._get(key) is None:
+                return False
+
+            self._expires[self._encode(key)] = time.monotonic() + time_seconds
+            return True
+
+
+    def persist(self, key) -> bool:
+        with self._lock:
+            return self._get(key) is not None and self._expires.pop(self._encode(key), None) is not None
+
+
+    def ttl(self, key) -> int:
+        with self._lock:
+            if self._get(key) is None:
+                return -2
+
+            expires = self._expires.get(self._encode(key))
+            return -1 if expires is None else max(0, round(expires - time.monotonic()))
+
+
+    def scan_iter(self, match:str=None, count:int=None, _type:str=None) -> Iterator[bytes]:
+        with self._lock:
+            keys = list(self._data)
+
+        for key in keys:
+            with self._lock:
+                exists = self._get(key) is not None
+
+            if exists and (not match or fnmatchcase(key.decode(errors='replace'), match)):
+                yield key
+
+
+    # Strings
+
+    def set(self, name, value, ex:int=None, px:int=None, nx:bool=False, xx:bool=False, keepttl:bool=False) -> Optional[bool]:
+        with self._lock:
+            exists = self._get(name) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+
+            key = self._encode(name)
+            self._store(key, self._encode(value), keep_ttl=keepttl)
+            if ex is not None or px is not None:
+                self._expires[key] = time.monotonic() + (ex if ex is not None else px / 1000.0)
+
+            return True
+
+
+    def get(self, name) -> Optional[bytes]:
+        with self._lock:
+            return self._get(name, bytes)
+
+
+    def delete_if_equal(self, name, value) -> int:
+        with self._lock:
+            if self._get(name, bytes) != self._encode(value):
+                return 0
+
+            return int(self._delete(self._encode(name)))
+
+
+    def expire_if_equal(self, name, value, ex:int) -> int:
+        with self._lock:
+            if self._get(name, bytes) != self._encode(value):
+                return 0
+
+            self._expires[self._encode(name)] = time.monotonic() + ex
+            return 1
+
+
+    def set_if_equal(self, name, value, expected, ex:int) -> int:
+        with self._lock:
+            if (self._get(name, bytes) or b'') != self._encode(expected):
+                return 0
+
+            key = self._encode(name)
+            self._store(key, self._encode(value))
+            self._expires[key] = time.monotonic() + ex
+            return 1
+
+
+    def set_if_newer(self, name, order, value, ex:int) -> int:
+        order = self._encode(order)
+        with self._lock:
+            stored = self._get(name, bytes)
+            if stored is not None and stored[:len(order)] > order:
+                return 0
+
+            key = self._encode(name)
+            self._store(key, order + self._encode(value))
+            self._expires[key] = time.monotonic() + ex
+            return 1
+
+
+    def mset(self, mapping:dict) -> bool:
+        with self._lock:
+            for key, value in mapping.items():
+                self._store(self._encode(key), self._encode(value))
+
+        return True
+
+
+    def mget(self, keys, *args) -> List[Optional[bytes]]:
+        keys = (list(keys) if not isinstance(keys, (str, bytes)) else [keys]) + list(args)
+        with self._lock:
+            return [value if isinstance(value, bytes) else None for value in (self._get(key) for key in keys)]
+
+
+    def incrby(self, name, amount:int=1) -> int:
+        with self._lock:
+            try:
+                value = int(self._get(name, bytes) or 0) + amount
+            except ValueError:
+                raise ResponseError('value is not an integer or out of range')
+
+            self._store(self._encode(name), str(value).encode(), keep_ttl=True)
+            return value
+
+
+    # Bitmaps
+
+    def setbit(self, name, offset:int, value:int) -> int:
+        with self._lock:
+            stored = bytearray(self._get(name, bytes) or b'')
+            byte, bit = offset >> 3, 0x80 >> (offset & 7)
+            if len(stored) <= byte:
+                stored.extend(bytes(byte + 1 - len(stored)))
+
+            previous = int(bool(stored[byte] & bit))
+            stored[byte] = stored[byte] | bit if value else stored[byte] & ~bit & 0xFF
+            self._store(self._encode(name), bytes(stored), keep_ttl=True)
+            return previous
+
+
+    def getbit(self, name, offset:int) -> int:
+        with self._lock:
+            stored = self._get(name, bytes) or b''
+
+        byte = offset >> 3
+        return int(byte < len(stored) and bool(stored[byte] & (0x80 >> (offset & 7))))
+
+
+    # Hashes
+
+    def hset(self, name, key=None, value=None, mapping:dict=None, items:list=None) -> int:
+        fields = dict(mapping or {})
+        if key is not None: fields[key] = value
+        if not fields:
+            raise DataError("'hset' with no key value pairs")
+
+        fields = {self._encode(k): self._encode(v) for k, v in fields.items()}
+        with self._lock:
+            stored = dict(self._get(name, dict) or {})
+            added = len(set(fields) - set(stored))
+            stored.update(fields)
+            self._store(self._encode(name), stored, keep_ttl=True)
+            return added
+
+
+    def hset_if_greater(self, name, mapping:dict) -> List[bytes]:
+        fields = {self._encode(k): self._encode(v) for k, v in mapping.items()}
+        with self._lock:
+            stored = dict(self._get(name, dict) or {})
+            updated = [field for field, value in fields.items() if stored.get(field) is None or stored[field] <= value]
+            if updated:
+                stored.update({field: fields[field] for field in updated})
+                self._store(self._encode(name), stored, keep_ttl=True)
+
+            return updated
+
+
+    def hget(self, name, key) -> Optional[bytes]:
+        with self._lock:
+            return (self._get(name, dict) or {}).get(self._encode(key))
+
+
+    def hgetall(self, name) -> dict:
+        with self._lock:
+            return dict(self._get(name, dict) or {})
+
+
+    def hdel(self, name, *keys) -> int:
+        with self._lock:
+            stored = self._get(name, dict)
+            if not stored:
+                return 0
+
+            stored = dict(stored)
+            removed = sum(1 for key in keys if stored.pop(self._encode(key), None) is not None)
+            if stored:
+                self._store(self._encode(name), stored, keep_ttl=True)
+            else:
+                self._delete(self._encode(name))
+
+            return removed
+
+
+    def hincrby(self, name, key, amount:int=1) -> int:
+        with self._lock:
+            stored = dict(self._get(name, dict) or {})
+            try:
+                value = int(stored.get(self._encode(key), 0)) + amount
+            except ValueError:
+                raise ResponseError('hash value is not an integer')
+
+            stored[self._encode(key)] = str(value).encode()
+            self._store(self._encode(name), stored, keep_ttl=True)
+            return value
+
+
+    # Sets
+
+    def sadd(self, name, *values) -> int:
+        members = {self._encode(value) for value in values}
+        with self._lock:
+            stored = set(self._get(name, set) or ())
+            added = len(members - stored)
+            self._store(self._encode(name), stored | members, keep_ttl=True)
+            return added
+
+
+    def srem(self, name, *values) -> int:
+        with self._lock:
+            stored = set(self._get(name, set) or ())
+            removed = len(stored & {self._encode(value) for value in values})
+            stored -= {self._encode(value) for value in values}
+            if stored:
+                self._store(self._encode(name), stored, keep_ttl=True)
+            else:
+                self._delete(self._encode(name))
+
+            return removed
+
+
+    def smembers(self, name) -> set:
+        with self._lock:
+            return set(self._get(name, set) or ())
+
+
+    def scard(self, name) -> int:
+        with self._lock:
+            return len(self._get(name, set) or ())
+
+
+    # Pub/Sub
+
+    def publish(self, channel, message) -> int:
+        with self._lock:
+            subscribers = list(self._subscribers.get(self._encode(channel), ()))
+
+        for subscriber in subscribers:
+            subscriber.put({'type': 'message', 'pattern': None, 'channel': self._encode(channel), 'data': self._encode(message)})
+
+        return len(subscribers)
+
+
+    def pubsub(self, ignore_subscribe_messages:bool=False) -> 'Memory_PubSub':
+        return Memory_PubSub(self)
+
+
+    # Pipelines
+
+    def pipeline(self, transaction:bool=True, shard_hint=None) -> 'Memory_Pipeline':
+        return Memory_Pipeline(self)
+
+
+class Memory_Pipeline:
+    ''' Queues commands for a `Memory_Backend` and runs them together (atomically) on `execute()` '''
+
+    IN_MEMORY = True
+
+    def __init__(self, backend:Memory_Backend):
+        self._backend = backend
+        self._commands = []
+
+
+    def __getattr__(self, name:str):
+        command = getattr(self._backend, name)
+
+        def queue_command(*args, **kwargs) -> 'Memory_Pipeline':
+            self._commands.append((command, args, kwargs)); return self
+
+        return queue_command
+
+
+    def execute(self, raise_on_error:bool=True) -> list:
+        results = []
+        with self._backend._lock:
+            for command, args, kwargs in self._commands:
+                try:
+                    results.append(command(*args, **kwargs))
+                except (ResponseError, DataError) as e:
+                    results.append(e)
+
+        self._commands = []
+        errors = [result for result in results if isinstance(result, Exception)]
+        if raise_on_error and errors:
+            raise errors[0]
+
+        return results
+
+
+    def reset(self):
+        self._commands = []
+
+
+    def __enter__(self) -> 'Memory_Pipeline':
+        return self
+
+
+    def __exit__(self, *args):
+        self.reset()
+
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+
+class Memory_PubSub:
+    ''' Subscription to channels on a `Memory_Backend`. Mirrors the parts of `redis.client.PubSub` used by the framework '''
+
+    def __init__(self, backend:Memory_Backend):
+        self._backend = backend
+        self._channels = set()
+        self._queue = queue.Queue()
+
+
+    def subscribe(self, *channels):
+        with self._backend._lock:
+            for channel in channels:
+                channel = Memory_Backend._encode(channel)
+                self._channels.add(channel)
+                self._backend._subscribers.setdefault(channel, set()).add(self._queue)
+
+
+    def unsubscribe(self, *channels):
+        with self._backend._lock:
+            for channel in [Memory_Backend._encode(channel) for channel in channels] or list(self._channels):
+                self._channels.discard(channel)
+                self._backend._subscribers.get(channel, set()).discard(self._queue)
+
+
+    def get_message(self, ignore_subscribe_messages:bool=False, timeout:float=0.0) -> Optional[dict]:
+        try:
+            return self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+    def listen(self) -> Iterator[dict]:
+        while self._channels:
+            yield self._queue.get()
+
+
+    def close(self):
+        self.unsubscribe()
+
+    reset = close
+
+
+    def __enter__(self) -> 'Memory_PubSub':
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
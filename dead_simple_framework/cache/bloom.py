@@ -0,0 +1,237 @@
+# Cache
+from .main import Cache
+
+# Redis Settings
+from ..config import Redis_Settings
+
+# Redis Errors
+from redis.exceptions import RedisError
+
+# MongoDB
+from pymongo.collection import Collection
+from bson import ObjectId
+
+# Utilities
+from datetime import datetime, timedelta, timezone
+import hashlib, math, threading, time
+
+# Typing
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Debug
+import logging
+
+
+class Bloom_Filter:
+    ''' Bloom filter stored as a bitmap in Redis so every worker shares it
+
+        Only answered from Redis. Without it each process would have its own bitmap that misses items added by other
+        processes, so the filter reads as not built. Sized for `capacity` items at a false positive rate of `error_rate`. Items are hashed once with BLAKE2b and
+        the bit positions are derived with double hashing. The bit after the filter is a sentinel set when the filter
+        is built, so a filter that was never built (or was evicted) reads as unknown instead of as empty
+    '''
+
+    def __init__(self, key:str, capacity:int, error_rate:float):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.key = f'{key}:{self.size}:{self.hashes}'     # Filters built with other parameters are never read
+
+
+    @staticmethod
+    def _encode(item:Any) -> bytes:
+        if isinstance(item, ObjectId): return item.binary
+        if isinstance(item, bytes):    return item
+        return str(item).encode()
+
+
+    def positions(self, item:Any) -> List[int]:
+        ''' The bits set for an item '''
+
+        digest = hashlib.blake2b(self._encode(item), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return [(first + num * second) % self.size for num in range(self.hashes)]
+
+
+    def add(self, *items:Any):
+        ''' Add items to the filter in one round trip '''
+
+        Cache(shared=True).set_bits(self.key, [position for item in items for position in self.positions(item)])
+
+
+    def might_contain(self, item:Any) -> Optional[bool]:
+        ''' False if the item was definitely never added, True if it may have been and None if the filter isn't built (or Redis isn't used) '''
+
+        cache = Cache(shared=True)
+        if cache.in_memory:
+            return None
+
+        bits = cache.get_bits(self.key, [self.size] + self.positions(item))
+        if not bits[0]:
+            return None
+
+        return all(bits[1:])
+
+
+    def build(self, items:Iterable[Any]) -> int:
+        ''' Replace the filter with one containing `items`. The bitmap is built in-process and stored with a single
+            write so readers never see a partially built filter. Returns the number of items added
+        '''
+
+        bitmap, count = bytearray(self.size // 8 + 1), 0
+        for item in items:
+            for position in self.positions(item):
+                bitmap[position >> 3] |= 0x80 >> (position & 7)
+            count += 1
+
+        # Mark the filter as built
+        bitmap[self.size >> 3] |= 0x80 >> (self.size & 7)
+        Cache(shared=True).cache_string(self.key, bytes(bitmap))
+        return count
+
+
+class Id_Filter:
+    ''' Bloom filters of the `_id`s that exist in collections, used to answer lookups for missing records without querying MongoDB
+
+        Filters are built from the collection in the background the first time they are needed and rebuilt every
+        `REDIS_BLOOM_REBUILD_SECONDS` to drop deleted `_id`s (which a Bloom filter can't remove, so they are false
+        positives until then). Records inserted through `insert_data()`/`update_data()` or seen by the `Change_Watcher`
+        are added as they are written. Records inserted any other way are only picked up by the next rebuild, so
+        collections written to outside the framework should be tailed by the watcher before enabling a filter.
+        Every lookup might exist if Redis can't be reached
+    '''
+
+    _prefix = '_bloom_'                                 # Prefix for filter keys
+    CHECK_SECONDS = 60                                  # How often each worker checks if a filter needs to be (re)built
+    BUILD_LOCK_SECONDS = 600                            # Longest a build can hold the lock that stops other workers building
+    CATCH_UP_SECONDS = 60                               # Records with `_id`s generated this long before a build started are re-added after it
+
+    ENABLED:Dict[Tuple[str, str], Tuple[int, float]] = {}   # (database, collection) -> (capacity, error rate)
+    _filters:Dict[Tuple[str, str], Bloom_Filter] = {}
+    _checked:Dict[Tuple[str, str], float] = {}          # (database, collection) -> time.monotonic() the filter was last checked
+    _lock = threading.Lock()
+
+
+    @classmethod
+    def enable(cls, database:str, collection:str, capacity:int=None, error_rate:float=None):
+        ''' Keep a filter of the `_id`s in a collection. If `database` is None the collection is filtered in any database.
+            `capacity` and `error_rate` default to `REDIS_BLOOM_CAPACITY` and `REDIS_BLOOM_ERROR_RATE`
+        '''
+
+        cls.ENABLED[(database, collection)] = (capacity or Redis_Settings.REDIS_BLOOM_CAPACITY, error_rate or Redis_Settings.REDIS_BLOOM_ERROR_RATE)
+
+
+    @classmethod
+    def is_enabled(cls, collection:Collection) -> bool:
+        ''' Check if `_id`s are filtered for a collection '''
+
+        return cls._settings(collection.database.name, collection.name) is not None
+
+
+    @classmethod
+    def _settings(cls, database:str, collection:str) -> Tuple[int, float]:
+        return cls.ENABLED.get((database, collection)) or cls.ENABLED.get((None, collection))
+
+
+    @classmethod
+    def filter_for(cls, database:str, collection:str) -> Bloom_Filter:
+        ''' The filter for a collection '''
+
+        key = (database, collection)
+        if key not in cls._filters:
+            cls._filters[key] = Bloom_Filter(f'{cls._prefix}:{database}:{collection}', *cls._settings(database, collection))
+
+        return cls._filters[key]
+
+
+    @classmethod
+    def might_exist(cls, collection:Collection, _id:Any) -> bool:
+        ''' False only if a record with the `_id` definitely doesn't exist. True if the filter isn't built yet or can't be read '''
+
+        try:
+            cls._check(collection)
+            return cls.filter_for(collection.database.name, collection.name).might_contain(_id) != False
+        except RedisError as e:
+            logging.warning(f'Bloom filter for [{collection.name}] unavailable: {e}')
+            return True
+
+
+    @classmethod
+    def add(cls, collection:Collection, _id:Any):
+        ''' Add a written `_id` to a collection's filter if it has one '''
+
+        cls.add_for(collection.database.name, collection.name, _id)
+
+
+    @classmethod
+    def add_for(cls, database:str, collection:str, _id:Any):
+        ''' Add a written `_id` to a collection's filter by database and collection name if it has one '''
+
+        if cls._settings(database, collection) is None:
+            return
+
+        try:
+            cls.filter_for(database, collection).add(_id)
+        except RedisError as e:
+            logging.warning(f'Failed to add [{_id}] to the Bloom filter for [{collection}]: {e}')
+
+
+    @classmethod
+    def build(cls, collection:Collection) -> int:
+        ''' Build (or rebuild) a collection's filter from the `_id`s in the collection. Returns the number of `_id`s added '''
+
+        database, name = collection.database.name, collection.name
+        bloom = cls.filter_for(database, name)
+        started = ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(seconds=cls.CATCH_UP_SECONDS))
+
+        count = bloom.build(document['_id'] for document in collection.find({}, {'_id': 1}).batch_size(10000))
+
+        # Records inserted while the filter was built were added to the old filter. Add them to the new one
+        recent = [document['_id'] for document in collection.find({'_id': {'$gte': started}}, {'_id': 1})]
+        if recent: bloom.add(*recent)
+
+        Cache(shared=True).cache_string(f'{cls._prefix}:{database}:{name}:built', str(time.time()))
+        capacity = cls._settings(database, name)[0]
+        if count > capacity:
+            logging.warning(f'Bloom filter for [{name}] holds [{count}] _ids but was sized for [{capacity}]. Raise `REDIS_BLOOM_CAPACITY` to keep false positives down')
+
+        return count
+
+
+    @classmethod
+    def _check(cls, collection:Collection):
+        ''' Start building a collection's filter in the background if it was never built or is due for a rebuild. Checked once a minute per worker '''
+
+        key = (collection.database.name, collection.name)
+        now = time.monotonic()
+        with cls._lock:
+            if cls._checked.get(key, -cls.CHECK_SECONDS) > now - cls.CHECK_SECONDS:
+                return
+            cls._checked[key] = now
+
+        # Filters are only read from Redis (see `Bloom_Filter`), so there's nothing to build without it
+        cache = Cache(shared=True)
+        if cache.in_memory:
+            return
+
+        built = cache.get_raw(f'{cls._prefix}:{key[0]}:{key[1]}:built')
+        if built and float(built) > time.time() - Redis_Settings.REDIS_BLOOM_REBUILD_SECONDS:
+            return
+
+        # Only one worker builds at a time
+        lock_key = f'{cls._prefix}:{key[0]}:{key[1]}:_lock_'
+        if cache.add(lock_key, '1', cls.BUILD_LOCK_SECONDS):
+            threading.Thread(target=cls._build_in_background, args=(collection, lock_key), name=f'bloom-filter-{collection.name}', daemon=True).start()
+
+
+    @classmethod
+    def _build_in_background(cls, collection:Collection, lock_key:str):
+        try:
+            count = cls.build(collection)
+            logging.info(f'Built Bloom filter for [{collection.name}] with [{count}] _ids')
+        except Exception as e:
+            logging.warning(f'Failed to build Bloom filter for [{collection.name}]: {e}')
+        finally:
+            try:
+                Cache(shared=True).remove(lock_key)
+            except RedisError:
+                pass
@@ -0,0 +1,85 @@
+# Redis Settings
+from ..config import Redis_Settings
+
+# Encoding
+from ..encoder import JSON_Encoder
+from bson import encode, decode
+from bson.errors import InvalidDocument
+import json, zlib
+
+# Typing
+from typing import Any
+
+
+class Cache_Codec:
+    ''' Binary encoding for cached values that keeps their types
+
+        Values are stored with a 4 byte header: a 2 byte marker, the kind of value and whether it's compressed.
+        Strings and bytes are stored as-is. Other values are stored as BSON so datetimes, ObjectIds, bytes and nested
+        documents/lists come back as the same types (datetimes with millisecond precision, tuples as lists). Values BSON
+        can't represent (sets, non-string keys, big integers, etc) fall back to JSON via `JSON_Encoder`.
+        Payloads larger than `REDIS_COMPRESS_THRESHOLD` bytes are compressed with zlib
+    '''
+
+    MARKER = b'\xfe\xdf'        # Never valid at the start of UTF-8 text so typed values can't be mistaken for plain strings
+
+    STR = b'S'
+    BYTES = b'R'
+    BSON = b'B'
+    JSON = b'J'
+
+    COMPRESSED = b'z'
+    UNCOMPRESSED = b'-'
+    COMPRESSION_LEVEL = 1       # Favor speed. Most of the size reduction for cached JSON-like data comes at low levels
+
+
+    @classmethod
+    def encode(cls, value:Any, compress_over:int=None) -> bytes:
+        ''' Encode a value for storage. Compresses payloads over `compress_over` bytes (`REDIS_COMPRESS_THRESHOLD` by default, 0 disables) '''
+
+        if isinstance(value, bytes):
+            kind, data = cls.BYTES, value
+        elif isinstance(value, str):
+            kind, data = cls.STR, value.encode()
+        else:
+            try:
+                kind, data = cls.BSON, encode({'v': value})
+            except (InvalidDocument, TypeError, OverflowError):
+                kind, data = cls.JSON, json.dumps(value, cls=JSON_Encoder).encode()
+
+        threshold = Redis_Settings.REDIS_COMPRESS_THRESHOLD if compress_over is None else compress_over
+        if threshold and len(data) > threshold:
+            compressed = zlib.compress(data, cls.COMPRESSION_LEVEL)
+            if len(compressed) < len(data):
+                return cls.MARKER + kind + cls.COMPRESSED + compressed
+
+        return cls.MARKER + kind + cls.UNCOMPRESSED + data
+
+
+    @classmethod
+    def is_encoded(cls, raw:bytes) -> bool:
+        ''' Check if stored bytes were encoded by `encode()` '''
+
+        return raw[:2] == cls.MARKER and len(raw) >= 4
+
+
+    @classmethod
+    def decode(cls, raw:bytes) -> Any:
+        ''' Decode a value stored with `encode()`. Anything else is returned as a string (or bytes if it isn't valid UTF-8) '''
+
+        if not cls.is_encoded(raw):
+            try:
+                return raw.decode()
+            except UnicodeDecodeError:
+                return raw
+
+        kind, data = raw[2:3], raw[4:]
+        if raw[3:4] == cls.COMPRESSED:
+            data = zlib.decompress(data)
+
+        if kind == cls.STR:   return data.decode()
+        if kind == cls.BYTES: return data
+        if kind == cls.BSON:  return decode(data)['v']
+        if kind == cls.JSON:  return json.loads(data)
+
+        raise ValueError(f'Unknown cached value kind [{kind}]')
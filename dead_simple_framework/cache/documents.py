@@ -0,0 +1,234 @@
+# Cache
+from .main import Cache
+from .invalidation import Invalidation_Bus
+
+# Redis Settings
+from ..config import Redis_Settings
+
+# Redis Errors
+from redis.exceptions import RedisError
+
+# MongoDB
+from pymongo.collection import Collection
+from bson import ObjectId, encode, decode
+
+# Utilities
+from collections import OrderedDict
+import threading, time, uuid
+
+# Typing
+from typing import Optional, Union
+
+# Debug
+import logging
+
+
+class Document_Cache:
+    ''' Read-through cache for MongoDB documents looked up by `_id`
+
+        Documents are cached under (database, collection, _id) in a bounded in-process LRU in front of Redis.
+        Lookups for missing documents are cached for a short time too so repeated misses don't hit MongoDB.
+        Writes made through `insert_data()`, `update_data()` and `delete_data()` invalidate the cached copy in every
+        worker, as do writes made anywhere else if the collection is tailed by the `Change_Watcher`
+
+        Invalidated documents are replaced by a tombstone in Redis. A document read from MongoDB is only stored if the
+        key still holds what the reader saw, so a reader racing a write can't put the old document back. Without
+        Redis, documents aren't cached as invalidations can't reach other processes
+    '''
+
+    _prefix = '_documents_'                             # Prefix for cached document keys
+    _miss = b'\x00'                                     # Stored for missing documents (not valid BSON)
+    _tombstone = b'\x00'                                # Followed by 16 random bytes for invalidated documents (BSON this short can't start with 0)
+
+    ENABLED = set()                                     # (database, collection) pairs documents are cached for
+    _local:OrderedDict = OrderedDict()                  # In-process LRU of key -> (expires at, encoded document)
+    _evictions = 0                                      # Times the in-process tier was evicted from (entries read before one aren't stored)
+    _lock = threading.Lock()
+
+
+    @classmethod
+    def enable(cls, database:str, collection:str):
+        ''' Cache documents for a collection. If `database` is None the collection is cached in any database '''
+
+        cls.ENABLED.add((database, collection))
+
+
+    @classmethod
+    def is_enabled(cls, collection:Collection) -> bool:
+        ''' Check if documents are cached for a collection '''
+
+        return (collection.database.name, collection.name) in cls.ENABLED or (None, collection.name) in cls.ENABLED
+
+
+    @classmethod
+    def key(cls, collection:Collection, _id:Union[ObjectId, str]) -> str:
+        ''' The cache key for a document '''
+
+        return cls.key_for(collection.database.name, collection.name, _id)
+
+
+    @classmethod
+    def key_for(cls, database:str, collection:str, _id:Union[ObjectId, str]) -> str:
+        ''' The cache key for a document by database and collection name '''
+
+        return f'{cls._prefix}:{database}:{collection}:{_id}'
+
+
+    @classmethod
+    def get(cls, collection:Collection, _id:Union[ObjectId, str]) -> dict:
+        ''' Get a document by `_id` from the in-process cache, then Redis, then MongoDB. Returns None if it doesn't exist '''
+
+        key = cls.key(collection, _id)
+        cache = cls._remote()
+
+        raw = cls._get_local(key)
+        seen = b''                                      # What Redis held for the key before reading MongoDB
+        if raw is None and cache:
+            evictions = cls._evictions
+            try:
+                raw = cache.get_raw(key)
+            except RedisError as e:
+                logging.warning(f'Document cache unavailable, reading [{key}] from MongoDB: {e}'); cache = None
+
+            if raw is not None and cls._is_tombstone(raw):
+                seen, raw = raw, None
+            elif raw is not None:
+                cls._set_local(key, raw, evictions)
+
+        if raw is None:
+            evictions = cls._evictions
+            document = collection.find_one({'_id': _id})
+            raw = encode(document) if document else cls._miss
+
+            if cache:
+                try:
+                    if cache.cache_string_if_equal(key, raw, seen, Redis_Settings.REDIS_DOCUMENT_TTL if document else Redis_Settings.REDIS_DOCUMENT_MISS_TTL):
+                        cls._set_local(key, raw, evictions)
+                except RedisError as e:
+                    logging.warning(f'Document cache unavailable, failed to store [{key}]: {e}')
+
+        # Decode on every hit so callers can't modify the cached copy
+        return decode(raw) if raw != cls._miss else None
+
+
+    @classmethod
+    def invalidate(cls, collection:Collection, _id:Union[ObjectId, str]):
+        ''' Remove a cached document (or cached miss) '''
+
+        cls.invalidate_key(cls.key(collection, _id))
+
+
+    @classmethod
+    def invalidate_key(cls, key:str):
+        ''' Remove a cached document by key from Redis and the in-process tier of every worker '''
+
+        cls._evict_local(key)
+
+        if Redis_Settings.USE_REDIS:
+            try:
+                Cache().cache_string(key, cls._tombstone + uuid.uuid4().bytes, Redis_Settings.REDIS_DOCUMENT_TTL)
+            except RedisError as e:
+                logging.warning(f'Document cache unavailable, failed to invalidate [{key}]: {e}')
+
+            Invalidation_Bus.publish('documents', key)
+
+
+    @classmethod
+    def invalidate_collection(cls, database:str, collection:str):
+        ''' Remove every cached document for a collection (e.g. after it is dropped) '''
+
+        prefix = cls.key_for(database, collection, '')
+        cls._evict_local(prefix)
+
+        if Redis_Settings.USE_REDIS:
+            try:
+                Cache().remove_matching(prefix + '*')
+            except RedisError as e:
+                logging.warning(f'Document cache unavailable, failed to invalidate collection [{database}.{collection}]: {e}')
+
+            Invalidation_Bus.publish('documents', prefix)
+
+
+    @classmethod
+    def _evict_local(cls, key:str):
+        ''' Remove a key from the in-process tier. Keys ending in `:` remove every key with that prefix '''
+
+        with cls._lock:
+            cls._evictions += 1
+            if not key.endswith(':'):
+                cls._local.pop(key, None); return
+
+            for local_key in [k for k in cls._local if k.startswith(key)]:
+                del cls._local[local_key]
+
+
+    @classmethod
+    def clear_local(cls):
+        ''' Clear the in-process tier '''
+
+        with cls._lock:
+            cls._local.clear()
+
+
+    @staticmethod
+    def _remote() -> Optional[Cache]:
+        ''' A cache client if documents are cached in Redis (`USE_REDIS` is set and Redis can be reached), otherwise None '''
+
+        if not Redis_Settings.USE_REDIS:
+            return None
+
+        cache = Cache()
+        return cache if not cache.in_memory else None
+
+
+    @classmethod
+    def _is_tombstone(cls, raw:bytes) -> bool:
+        ''' Check if a cached value marks an invalidated document '''
+
+        return len(raw) == len(cls._tombstone) + 16 and raw.startswith(cls._tombstone)
+
+
+    @classmethod
+    def _get_local(cls, key:str) -> bytes:
+        ''' Get an unexpired entry from the in-process tier and mark it as recently used '''
+
+        if not Redis_Settings.REDIS_DOCUMENT_LOCAL_SIZE or not Redis_Settings.USE_REDIS:
+            return None
+
+        with cls._lock:
+            entry = cls._local.get(key)
+            if not entry:
+                return None
+
+            if entry[0] < time.monotonic():
+                del cls._local[key]; return None
+
+            cls._local.move_to_end(key)
+            return entry[1]
+
+
+    @classmethod
+    def _set_local(cls, key:str, raw:bytes, evictions:int):
+        ''' Store an entry read while the tier had been evicted from `evictions` times, evicting the least recently used
+            entries when full. Not stored if an entry was evicted since (it may have been this one)
+        '''
+
+        if not Redis_Settings.REDIS_DOCUMENT_LOCAL_SIZE or not Redis_Settings.USE_REDIS:
+            return
+
+        # Make sure writes in other workers evict this entry
+        Invalidation_Bus.ensure_listening()
+
+        ttl = Redis_Settings.REDIS_DOCUMENT_LOCAL_TTL if raw != cls._miss else min(Redis_Settings.REDIS_DOCUMENT_LOCAL_TTL, Redis_Settings.REDIS_DOCUMENT_MISS_TTL)
+        with cls._lock:
+            if cls._evictions != evictions:
+                return
+
+            cls._local[key] = (time.monotonic() + ttl, raw)
+            cls._local.move_to_end(key)
+            while len(cls._local) > Redis_Settings.REDIS_DOCUMENT_LOCAL_SIZE:
+                cls._local.popitem(last=False)
+
+
+# Evict documents from this worker's in-process tier when other workers invalidate them
+Invalidation_Bus.register('documents', Document_Cache._evict_local)
@@ -0,0 +1,94 @@
+# Cache
+from .main import Cache
+
+# Redis Settings
+from ..config import Redis_Settings
+
+# Redis Errors
+from redis.exceptions import RedisError
+
+# Utilities
+import json, os, threading, time, uuid
+
+# Typing
+from typing import Callable, Dict
+
+# Debug
+import logging
+
+
+class Invalidation_Bus:
+    ''' Broadcasts cache invalidations to every worker over Redis pub/sub
+
+        In-process caches register a handler for a namespace. When any worker publishes an invalidation
+        for that namespace, the handler is called with the invalidated key in every other worker
+    '''
+
+    CHANNEL = '_cache_invalidations_'               # Redis channel invalidations are sent over
+    RETRY_SECONDS = 5                               # Time to wait before resubscribing if Redis goes away
+
+    _handlers:Dict[str, Callable[[str], None]] = {}
+    _origin = None                                  # Unique ID of this process so it can skip its own messages
+    _pid = None                                     # PID the listener was started in (threads don't survive a fork)
+    _lock = threading.Lock()
+
+
+    @classmethod
+    def register(cls, namespace:str, handler:Callable[[str], None]):
+        ''' Call `handler` with the key whenever another worker publishes an invalidation for `namespace` '''
+
+        cls._handlers[namespace] = handler
+
+
+    @classmethod
+    def publish(cls, namespace:str, key:str):
+        ''' Tell every other worker to drop `key` from their in-process cache for `namespace` '''
+
+        if not Redis_Settings.USE_REDIS:
+            return
+
+        cls.ensure_listening()
+        try:
+            Cache().publish(cls.CHANNEL, json.dumps({'namespace': namespace, 'key': key, 'origin': cls._origin}))
+        except RedisError as e:
+            logging.warning(f'Failed to publish cache invalidation for [{namespace}:{key}]: {e}')
+
+
+    @classmethod
+    def ensure_listening(cls):
+        ''' Start listening for invalidations in this process if not already listening '''
+
+        if cls._pid == os.getpid() or not Redis_Settings.USE_REDIS:
+            return
+
+        with cls._lock:
+            if cls._pid == os.getpid():
+                return
+
+            cls._pid, cls._origin = os.getpid(), uuid.uuid4().hex
+            threading.Thread(target=cls._listen, name='cache-invalidation-listener', daemon=True).start()
+
+
+    @classmethod
+    def _listen(cls):
+        ''' Dispatch invalidations published by other workers to the registered handlers '''
+
+        while True:
+            try:
+                for message in Cache().subscribe(cls.CHANNEL).listen():
+                    data = json.loads(message['data'])
+                    handler = cls._handlers.get(data['namespace'])
+                    if handler and data['origin'] != cls._origin:
+                        handler(data['key'])
+
+            except RedisError as e:
+                logging.warning(f'Cache invalidation listener disconnected, retrying in {cls.RETRY_SECONDS} seconds: {e}')
+                time.sleep(cls.RETRY_SECONDS)
+
+            except Exception as e:
+                logging.warning(f'Cache invalidation listener failed to handle a message: {e}')
+
+
+# Evict keys from this worker's in-process `Cache` tier when other workers write them
+Invalidation_Bus.register('cache', Cache._evict_local)
+Cache._bus = Invalidation_Bus
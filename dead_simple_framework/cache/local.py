@@ -0,0 +1,104 @@
+# Utilities
+from collections import OrderedDict
+import threading, time
+
+# Typing
+from typing import Any, Dict
+
+
+class Local_Cache:
+    ''' Bounded in-process LRU with per-entry expiry and hit-rate statistics. Safe to share between threads
+
+        Evicts the least recently used entries once there are more than `max_entries` entries or their total
+        size is over `max_bytes`. Entries expire `ttl` seconds after they are stored. `None` is never stored so
+        it can be returned for misses
+    '''
+
+    def __init__(self, max_entries:int, max_bytes:int=None, ttl:float=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries:OrderedDict = OrderedDict()       # key -> (expires at, size, value)
+        self._bytes = 0
+        self._stats:Dict[str, list] = {}                # namespace -> [hits, misses, evictions]
+        self._lock = threading.Lock()
+
+
+    def get(self, key:str, namespace:str=None) -> Any:
+        ''' Get an unexpired entry and mark it as recently used. Returns None on a miss '''
+
+        with self._lock:
+            stats = self._stats.setdefault(namespace, [0, 0, 0])
+            entry = self._entries.get(key)
+            if entry and entry[0] < time.monotonic():
+                self._remove(key); entry = None
+
+            if not entry:
+                stats[1] += 1; return None
+
+            stats[0] += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+
+
+    def set(self, key:str, value:Any, size:int=1, ttl:float=None, namespace:str=None):
+        ''' Store an entry, evicting the least recently used entries if the cache is full '''
+
+        if value is None or not self.max_entries or (self.max_bytes and size > self.max_bytes):
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl or float('inf')), size, value)
+            self._bytes += size
+
+            stats = self._stats.setdefault(namespace, [0, 0, 0])
+            while len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries))); stats[2] += 1
+
+
+    def evict(self, key:str):
+        ''' Remove an entry if it's stored '''
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+
+    def evict_prefix(self, prefix:str):
+        ''' Remove every entry with a key starting with `prefix` '''
+
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self._remove(key)
+
+
+    def clear(self):
+        ''' Remove every entry '''
+
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+    def stats(self) -> dict:
+        ''' Hits, misses, evictions and hit rate per namespace plus the current size of the cache '''
+
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'namespaces': {
+                    namespace: {'hits': hits, 'misses': misses, 'evictions': evictions, 'hit_rate': hits / (hits + misses) if hits + misses else None}
+                    for namespace, (hits, misses, evictions) in self._stats.items()
+                }
+            }
+
+
+    def _remove(self, key:str):
+        ''' Remove an entry (lock must be held) '''
+
+        self._bytes -= self._entries.pop(key)[1]
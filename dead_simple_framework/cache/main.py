@@ -5,53 +5,579 @@ import redis
 from ..config import Redis_Settings
 
 # Redis Errors
-from redis.exceptions import ResponseError, DataError
+from redis.exceptions import ResponseError, DataError, RedisError
+
+# Backends
+from .backends import Redis_Backend, Memory_Backend, Memory_PubSub
+from .sharding import Sharded_Backend, Cluster_Backend
+
+# In-Process Cache
+from .local import Local_Cache
+
+# Typed Values
+from .codec import Cache_Codec
+
+# Instrumentation
+from .metrics import Cache_Metrics, instrumented
 
 # Encoding
 from ..encoder import JSON_Encoder
 import json
 
+# Flask
+from flask import Response
+
 # Utilities
-import os
+from contextlib import contextmanager
+from functools import wraps
+import hashlib, math, os, random, threading, time, uuid
 
 # Typing
-from typing import Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+# Debug
+import logging
 
-# TODO - [Stability]     | Dummy cache if Redis not running
 # TODO - [Stability]     | Timeouts + Automatic retries
-# TODO - [Useability]    | Allow serialization/deserialization and storage of typed data
 # TODO - [Useability]    | Support for lists (queues)
 
 class Cache:
-    ''' Client for caching task results or database queries '''
+    ''' Client for caching task results or database queries
+
+        Stores data in Redis if `USE_REDIS` is set and Redis responds to a ping. Otherwise falls back to a
+        `Memory_Backend` shared by every `Cache` in the process. If `REDIS_NODES` lists several nodes, keys are
+        spread across them with consistent hashing (`Sharded_Backend`). A Redis Cluster is detected and used natively
+    '''
+
+    _pool = None                    # Connection pool shared by every `Cache` in this process
+    _pool_key = None                # (PID, host, port, db) the pool was created for. Rebuilt after a fork or settings change
+    _pool_lock = threading.Lock()
+    _remote = None                  # Client for the configured Redis deployment (single node, sharded or cluster)
+    _remote_key = None              # PID and settings `_remote` was created for
+    _remote_lock = threading.Lock()
+    _available = {}                 # Remote key -> whether Redis answered a ping for it and when it was checked (time.monotonic())
+    RETRY_SECONDS = 5               # Seconds before Redis is pinged again after a failed ping
+    _memory:Memory_Backend = None   # In-process backend used when Redis isn't
+
+    LOCAL_NAMESPACES = {'_namespace_'}  # Namespaces (key prefix before the first `:`) kept in the in-process tier
+    _local:Local_Cache = None       # In-process tier in front of Redis, created on first use
+    _bus = None                     # Broadcasts in-process tier evictions to other workers. Set by `Invalidation_Bus`
+    _pending:List[str] = None       # Keys written inside a `batch()`, invalidated once it's sent
+    _metrics:Cache_Metrics = None   # Instrumentation for every `Cache` in this process, created on first use
+
+    _memoize_prefix = '_memoize_'   # Prefix for the keys of results cached with `memoize()`
+    _response_field = '_response_'  # Marks a Flask `Response` memoized as its body, status and headers
+    _namespace_prefix = '_namespace_'   # Prefix for namespace version counters
+    _tag_prefix = '_tag_'           # Prefix for the sets of keys added to each tag
+
+    # Commands used to fetch each Redis type in `view()`
+    _FETCH = {
+        'string': lambda pipe, key: pipe.get(key),
+        'hash':   lambda pipe, key: pipe.hgetall(key),
+        'list':   lambda pipe, key: pipe.lrange(key, 0, -1),
+        'set':    lambda pipe, key: pipe.smembers(key),
+        'zset':   lambda pipe, key: pipe.zrange(key, 0, -1, withscores=True)
+    }
+
+    def __init__(self, shared:bool=False):
+        ''' Create a cache client. If `shared` is True, Redis is used whenever it can be reached even if `USE_REDIS` is off.
+            Used for data that must be visible to other processes (e.g. task results written by Celery workers)
+        '''
+
+        # Connect to the backend (Redis clients borrow connections from the shared pool instead of opening new ones)
+        self._redis = self.get_backend(shared)
+
+
+    @classmethod
+    def get_backend(cls, shared:bool=False) -> Union[Redis_Backend, Sharded_Backend, Cluster_Backend, Memory_Backend]:
+        ''' Get a Redis client if Redis should be used and is reachable, otherwise the in-process backend '''
+
+        if (Redis_Settings.USE_REDIS or shared) and cls.is_redis_available():
+            return cls.get_remote()
+
+        return cls.memory()
+
+
+    @classmethod
+    def is_redis_available(cls) -> bool:
+        ''' Check if Redis (every node if sharded) responds to a ping. Checked once per process and connection settings
+            if it does. A failed ping is retried after `RETRY_SECONDS` so a blip at startup doesn't keep the process in memory
+        '''
+
+        remote_key = cls._get_remote_key()
+        available, checked = cls._available.get(remote_key, (None, 0))
+        if available is None or (not available and time.monotonic() - checked > cls.RETRY_SECONDS):
+            try:
+                cls._available[remote_key] = (bool(cls.get_remote().ping()), time.monotonic())
+                if available == False: logging.warning('Redis is reachable again, no longer caching in memory')
+            except RedisError as e:
+                if available is None: logging.warning(f'Redis ping failed, caching in memory until it responds: {e}')
+                cls._available[remote_key] = (False, time.monotonic())
+
+        return cls._available[remote_key][0]
+
+
+    @staticmethod
+    def _get_remote_key() -> tuple:
+        return (os.getpid(), Redis_Settings.REDIS_HOST, Redis_Settings.REDIS_PORT, Redis_Settings.REDIS_DB, tuple(Redis_Settings.REDIS_NODES),
+            tuple(Redis_Settings.REDIS_REPLICAS), Redis_Settings.REDIS_VIRTUAL_NODES, Redis_Settings.REDIS_READ_FROM_REPLICAS)
+
+
+    @classmethod
+    def get_remote(cls) -> Union[Redis_Backend, Sharded_Backend, Cluster_Backend]:
+        ''' Get the client for the configured Redis deployment, creating it if necessary:
+
+            - A `Cluster_Backend` if the (first) node has cluster mode enabled
+            - A `Sharded_Backend` if `REDIS_NODES` lists several nodes or `REDIS_REPLICAS` lists replicas
+            - A client for the single node otherwise
+        '''
+
+        remote_key = cls._get_remote_key()
+        if cls._remote_key != remote_key:
+            with cls._remote_lock:
+                if cls._remote_key != remote_key:
+                    cls._remote, cls._remote_key = cls._connect(), remote_key
+
+        return cls._remote
+
+
+    @classmethod
+    def _connect(cls) -> Union[Redis_Backend, Sharded_Backend, Cluster_Backend]:
+        ''' Create the client for the configured Redis deployment '''
+
+        nodes = [cls._node_name(node) for node in Redis_Settings.REDIS_NODES] or [cls._node_name(f'{Redis_Settings.REDIS_HOST}:{Redis_Settings.REDIS_PORT}')]
+
+        replicas = {}
+        for entry in Redis_Settings.REDIS_REPLICAS:
+            primary, replica = entry.split('=', 1)
+            replicas.setdefault(cls._node_name(primary), []).append(cls._node_name(replica))
+
+        first = cls._connect_node(nodes[0])
+        if Cluster_Backend.is_cluster(first):
+            host, port, _ = cls._parse_node(nodes[0])
+            return Cluster_Backend(host=host, port=port, max_connections=Redis_Settings.REDIS_MAX_CONNECTIONS, socket_timeout=Redis_Settings.REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=Redis_Settings.REDIS_SOCKET_CONNECT_TIMEOUT, socket_keepalive=Redis_Settings.REDIS_SOCKET_KEEPALIVE,
+                health_check_interval=Redis_Settings.REDIS_HEALTH_CHECK_INTERVAL)
+
+        if len(nodes) > 1 or replicas:
+            return Sharded_Backend(nodes, cls._connect_node, replicas, Redis_Settings.REDIS_VIRTUAL_NODES, Redis_Settings.REDIS_READ_FROM_REPLICAS)
+
+        return first
+
+
+    @staticmethod
+    def _parse_node(address:str) -> Tuple[str, int, int]:
+        ''' Parse a `host:port` or `host:port/db` node address '''
+
+        address, _, db = address.partition('/')
+        host, _, port = address.partition(':')
+        return host, int(port or 6379), int(db or Redis_Settings.REDIS_DB)
+
+
+    @classmethod
+    def _node_name(cls, address:str) -> str:
+        ''' Canonical `host:port/db` name for a node address (used as the node's name on the hash ring) '''
+
+        return '{}:{}/{}'.format(*cls._parse_node(address))
+
+
+    @classmethod
+    def _connect_node(cls, address:str) -> Redis_Backend:
+        ''' Create a client for a single node. The default node uses the shared pool from `get_pool()` '''
+
+        host, port, db = cls._parse_node(address)
+        if (host, port, db) == (Redis_Settings.REDIS_HOST, int(Redis_Settings.REDIS_PORT), int(Redis_Settings.REDIS_DB)):
+            return Redis_Backend(connection_pool=cls.get_pool())
+
+        return Redis_Backend(connection_pool=cls._make_pool(host, port, db))
+
+
+    @classmethod
+    def memory(cls) -> Memory_Backend:
+        ''' Get the in-process backend, creating it if necessary '''
+
+        if cls._memory is None:
+            with cls._pool_lock:
+                if cls._memory is None:
+                    cls._memory = Memory_Backend(Redis_Settings.REDIS_MEMORY_MAX_BYTES)
+
+        return cls._memory
+
+
+    @property
+    def in_memory(self) -> bool:
+        ''' Check if this client stores data in process memory instead of Redis '''
+
+        return getattr(self._redis, 'IN_MEMORY', False)
+
+
+    @classmethod
+    def get_pool(cls) -> redis.ConnectionPool:
+        ''' Get the connection pool for this process, creating it from `Redis_Settings` if necessary '''
+
+        pool_key = (os.getpid(), Redis_Settings.REDIS_HOST, Redis_Settings.REDIS_PORT, Redis_Settings.REDIS_DB)
+        if cls._pool_key != pool_key:
+            with cls._pool_lock:
+                if cls._pool_key != pool_key:
+                    cls._pool = cls._make_pool(Redis_Settings.REDIS_HOST, Redis_Settings.REDIS_PORT, Redis_Settings.REDIS_DB)
+                    cls._pool_key = pool_key
+
+        return cls._pool
+
+
+    @staticmethod
+    def _make_pool(host:str, port:int, db:int) -> redis.ConnectionPool:
+        ''' Create a connection pool for a node from `Redis_Settings` '''
+
+        # Waits up to `REDIS_POOL_TIMEOUT` seconds for a free connection instead of failing when all are in use
+        return redis.BlockingConnectionPool(
+            host=host,
+            port=port,
+            db=db,
+            max_connections=Redis_Settings.REDIS_MAX_CONNECTIONS,
+            timeout=Redis_Settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=Redis_Settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=Redis_Settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            socket_keepalive=Redis_Settings.REDIS_SOCKET_KEEPALIVE,
+            health_check_interval=Redis_Settings.REDIS_HEALTH_CHECK_INTERVAL
+        )
+
+
+    @classmethod
+    def reset_pool(cls):
+        ''' Close every pooled connection. The pool is recreated on next use '''
+
+        with cls._pool_lock:
+            if cls._pool and cls._pool_key[0] == os.getpid():
+                cls._pool.disconnect()
+            cls._pool = cls._pool_key = None
+
+        with cls._remote_lock:
+            cls._remote = cls._remote_key = None
+
+
+    @classmethod
+    def enable_local(cls, namespace:str):
+        ''' Keep values for a namespace (the key or the key prefix before the first `:`) in a bounded in-process LRU in front of Redis.
+            Writes made through any `Cache` evict the value in every worker. Entries expire after `REDIS_LOCAL_TTL` seconds
+            regardless, which bounds staleness if an invalidation is missed or the key is changed outside of `Cache`
+        '''
+
+        cls.LOCAL_NAMESPACES.add(namespace)
+
+
+    @classmethod
+    def local(cls) -> Local_Cache:
+        ''' Get the in-process tier, creating it from `Redis_Settings` if necessary '''
+
+        if cls._local is None:
+            cls._local = Local_Cache(Redis_Settings.REDIS_LOCAL_SIZE, Redis_Settings.REDIS_LOCAL_MAX_BYTES, Redis_Settings.REDIS_LOCAL_TTL)
+
+        return cls._local
+
+
+    @classmethod
+    def local_stats(cls) -> dict:
+        ''' Hit rates per namespace and the size of the in-process tier '''
+
+        return cls.local().stats()
+
+
+    @classmethod
+    def metrics(cls) -> Cache_Metrics:
+        ''' Get the instrumentation for this process, creating it from `Redis_Settings` if necessary. Returns None if `REDIS_METRICS` is off '''
+
+        if not Redis_Settings.REDIS_METRICS:
+            return None
+
+        if cls._metrics is None:
+            cls._metrics = Cache_Metrics(Redis_Settings.REDIS_METRICS_SAMPLE_RATE, Redis_Settings.REDIS_METRICS_TOP_K, Redis_Settings.REDIS_METRICS_MAX_PREFIXES)
+
+        return cls._metrics
+
+
+    @classmethod
+    def stats(cls) -> dict:
+        ''' Operation counts, hit rates, latency percentiles and payload sizes per key prefix, the hottest and biggest keys
+            and the in-process tier's stats for this process (see `Cache_Metrics`)
+        '''
+
+        metrics = cls.metrics()
+        return {'operations': metrics.stats() if metrics else None, 'local': cls.local_stats()}
+
+
+    @classmethod
+    def reset_stats(cls):
+        ''' Clear the stats recorded by this process '''
+
+        if cls._metrics: cls._metrics.reset()
+
+
+    @staticmethod
+    def namespace(key:str) -> str:
+        ''' The namespace of a key (the key prefix before the first `:`) '''
+
+        return key.split(':', 1)[0]
+
+
+    def _is_local(self, key:str) -> bool:
+        ''' Check if a key is kept in the in-process tier (never needed when the backend is already in memory) '''
+
+        return bool(Redis_Settings.USE_REDIS and Redis_Settings.REDIS_LOCAL_SIZE) and not self.in_memory and \
+            (self.namespace(key) in self.LOCAL_NAMESPACES or self.namespace(key) in Redis_Settings.REDIS_LOCAL_NAMESPACES)
+
+
+    @classmethod
+    def _evict_local(cls, key:str):
+        ''' Remove a key (and any hash fields stored for it) from this worker's in-process tier '''
+
+        cls.local().evict(key)
+        cls.local().evict_prefix(f'{key}\x00')
+
+
+    def _invalidate(self, *keys:str):
+        ''' Evict written keys from the in-process tier of every worker (after the batch is sent inside `batch()`) '''
+
+        if self._pending is not None:
+            self._pending.extend(keys); return
+
+        for key in keys:
+            if self._is_local(key):
+                self._evict_local(key)
+                if self._bus: self._bus.publish('cache', key)
+
+
+    @classmethod
+    def _get_local(cls, key:str, fetch:Callable[[], Any]) -> Any:
+        ''' Get a value from the in-process tier or fetch it from Redis and store it '''
+
+        namespace = cls.namespace(key)
+        value = cls.local().get(key, namespace)
+        if value is None:
+            # Make sure writes in other workers evict this entry
+            if cls._bus: cls._bus.ensure_listening()
+
+            value = fetch()
+            size = sum(len(k) + len(v) for k, v in value.items()) if isinstance(value, dict) else len(value or b'')
+            cls.local().set(key, value, size, namespace=namespace)
+
+        return value
+
+
+    @contextmanager
+    def batch(self, transaction:bool=True) -> 'Cache':
+        ''' Queue every command sent through the yielded `Cache` and send them in one round trip when the block exits.
+            Runs them as a single MULTI/EXEC transaction unless `transaction` is False. Nothing is sent if the block raises.
+            Return values of commands made inside the block are not available. Use `get_many()` to read several keys at once
+        '''
+
+        batch = Cache.__new__(Cache)
+        batch._redis = self._redis.pipeline(transaction=transaction)
+        batch._pending = []
+        try:
+            yield batch
+            batch._redis.execute()
+
+            # Other workers would read the old value back from Redis if told to evict it before it was written
+            self._invalidate(*batch._pending)
+        finally:
+            batch._redis.reset()
+
+
+    @instrumented('set', value='value')
+    def cache_string(self, key:str, value:Union[str, bytes], ttl:int=None):
+        ''' Add or update a key-value pair in the cache. Expires after `ttl` seconds if passed '''
+
+        self._redis.set(key, value, ex=ttl)
+        self._invalidate(key)
+
+
+    @instrumented('set_bits')
+    def set_bits(self, key:str, positions:Iterable[int]):
+        ''' Set bits in a bitmap stored as a string in one round trip. The string grows as needed '''
+
+        with self._redis.pipeline(transaction=False) as pipe:
+            for position in positions:
+                pipe.setbit(key, position, 1)
+            pipe.execute()
+
+        self._invalidate(key)
+
+
+    @instrumented('get_bits')
+    def get_bits(self, key:str, positions:Iterable[int]) -> List[bool]:
+        ''' Read bits from a bitmap stored as a string in one round trip. Bits past the end of the string (or a missing key) are False '''
+
+        with self._redis.pipeline(transaction=False) as pipe:
+            for position in positions:
+                pipe.getbit(key, position)
+            return [bool(bit) for bit in pipe.execute()]
+
+
+    @instrumented('set_many')
+    def cache_many(self, values:Dict[str, Union[str, bytes]], ttl:int=None):
+        ''' Add or update several key-value pairs in one round trip. Expire after `ttl` seconds if passed '''
+
+        if not values:
+            return
+
+        if ttl is None:
+            self._redis.mset(values); self._invalidate(*values); return
+
+        with self.batch(transaction=False) as batch:
+            for key, value in values.items():
+                batch.cache_string(key, value, ttl)
+
 
-    def __init__(self):
-        # Connect to Redis
-        self._redis = redis.Redis(host=Redis_Settings.REDIS_HOST, port=Redis_Settings.REDIS_PORT, db=Redis_Settings.REDIS_DB)
+    @instrumented('delete')
+    def remove_if_equal(self, key:str, value:Union[str, bytes]) -> bool:
+        ''' Remove a key only if it still holds `value`, atomically (e.g. to release a lock only while still holding it). Returns True if removed '''
 
+        removed = bool(self._redis.delete_if_equal(key, value))
+        if removed: self._invalidate(key)
+        return removed
 
-    def cache_string(self, key:str, value:str):
-        ''' Add or update a key-value pair in the cache '''
 
-        self._redis.set(key, value)
+    @instrumented('set', value='value')
+    def cache_string_if_equal(self, key:str, value:Union[str, bytes], expected:Union[str, bytes], ttl:int) -> bool:
+        ''' Add or update a key-value pair only if the key still holds `expected` (or doesn't exist if `expected` is empty),
+            atomically. Expires after `ttl` seconds. Returns True if it was stored
+        '''
 
+        stored = bool(self._redis.set_if_equal(key, value, expected, ttl))
+        if stored: self._invalidate(key)
+        return stored
 
-    def cache_dict(self, key:str, value:dict):
-        ''' Add or overwrite a dictionary in the cache '''
 
-        # Serialize dictionary then store
-        self.cache_string(key, json.dumps(value, cls=JSON_Encoder)) 
+    @instrumented('set', value='value')
+    def cache_string_if_newer(self, key:str, order:str, value:Union[str, bytes], ttl:int) -> bool:
+        ''' Store `order` followed by `value` under a key unless it holds a value stored with an order that sorts after
+            `order`, atomically (so writers finishing out of order keep the newest value). Orders must all be the same
+            length. Expires after `ttl` seconds. Returns True if it was stored
+        '''
 
+        stored = bool(self._redis.set_if_newer(key, order, value, ttl))
+        if stored: self._invalidate(key)
+        return stored
 
-    def cache_list(self, key:str, value:list):
-        ''' Add or overwrite a list in the cache '''
 
-        # Serialize the list with `json.dumps()` and store
-        self.cache_dict(key, value)
+    @instrumented('add', value='value')
+    def add(self, key:str, value:Union[str, bytes], ttl:int=None) -> bool:
+        ''' Add a key-value pair only if the key doesn't exist. Returns True if it was added '''
 
+        added = bool(self._redis.set(key, value, ex=ttl, nx=True))
+        if added: self._invalidate(key)
+        return added
 
-    def cache_dynamic_dict(self, key:str, value:dict):
-        ''' Store a python dictionary as a hash. Allows dictionary values to be updated without fetching the stored value '''
+
+    def cache_value(self, key:str, value:Any, ttl:int=None, tags:Iterable[str]=None):
+        ''' Add or overwrite any value in the cache. `get()` returns it as the same type (see `Cache_Codec`).
+            Expires after `ttl` seconds if passed. Removed when any of `tags` are invalidated with `invalidate_tags()`
+        '''
+
+        # Serialize with type information (and compress if large) then store
+        self.cache_string(key, Cache_Codec.encode(value), ttl)
+        if tags: self.tag(key, tags, ttl)
+
+
+    def namespace_key(self, namespace:str, key:str) -> str:
+        ''' The key to store `key` under in a versioned namespace. Every key built for a namespace is
+            invalidated at once by `invalidate_namespace()`
+        '''
+
+        return f'{namespace}:v{self.namespace_version(namespace)}:{key}'
+
+
+    def namespace_version(self, namespace:str) -> int:
+        ''' The current version of a namespace (served from the in-process tier if Redis is used) '''
+
+        return int(self.get_raw(f'{self._namespace_prefix}:{namespace}') or 0)
+
+
+    def invalidate_namespace(self, namespace:str) -> int:
+        ''' Invalidate every key built with `namespace_key()` for a namespace in O(1) by bumping its version. Returns the new version.
+            Keys for old versions are never read again and are cleaned up by their TTLs (or `purge_namespace()`)
+        '''
+
+        return self.increment(f'{self._namespace_prefix}:{namespace}')
+
+
+    def purge_namespace(self, namespace:str) -> int:
+        ''' Remove the keys of old versions of a namespace (only needed for keys stored without a TTL). Returns the number removed '''
+
+        current = f'{namespace}:v{self.namespace_version(namespace)}:'
+        stale = [key for key in self.keys(f'{namespace}:v*') if not key.startswith(current)]
+        for page in range(0, len(stale), Redis_Settings.REDIS_SCAN_COUNT):
+            self.remove(stale[page:page + Redis_Settings.REDIS_SCAN_COUNT])
+
+        return len(stale)
+
+
+    @instrumented('tag')
+    def tag(self, key:str, tags:Iterable[str], ttl:int=None):
+        ''' Add a key to tags so it's removed when any of them are invalidated with `invalidate_tags()`.
+            `ttl` is the key's TTL. Tag sets expire with their longest lived key so they don't outlive what they track
+        '''
+
+        tag_keys = [f'{self._tag_prefix}:{tag}' for tag in tags]
+        with self._redis.pipeline(transaction=False) as pipe:
+            for tag_key in tag_keys:
+                pipe.exists(tag_key).ttl(tag_key).sadd(tag_key, key)
+            results = pipe.execute()
+
+        # Extend each tag set's TTL to cover the key (or remove it if the key never expires)
+        with self._redis.pipeline(transaction=False) as pipe:
+            for num, tag_key in enumerate(tag_keys):
+                exists, tag_ttl = results[num * 3], results[num * 3 + 1]
+                if ttl is None and exists and tag_ttl >= 0:
+                    pipe.persist(tag_key)
+                elif ttl is not None and (not exists or 0 <= tag_ttl < ttl):
+                    pipe.expire(tag_key, ttl)
+
+            if len(pipe): pipe.execute()
+
+
+    @instrumented('invalidate_tags', prefix='_tag_')
+    def invalidate_tags(self, *tags:str) -> int:
+        ''' Remove every key added to any of the tags. Returns the number of keys removed '''
+
+        tag_keys = [f'{self._tag_prefix}:{tag}' for tag in tags]
+        if not tag_keys:
+            return 0
+
+        # Read and clear the tag sets atomically so keys tagged afterwards aren't lost
+        with self._redis.pipeline(transaction=True) as pipe:
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            pipe.unlink(*tag_keys)
+            results = pipe.execute()
+
+        keys = list({key.decode() for members in results[:-1] for key in members})
+        if not keys:
+            return 0
+
+        removed = self._redis.unlink(*keys)
+        self._invalidate(*keys)
+        return removed
+
+
+    def cache_dict(self, key:str, value:dict, ttl:int=None):
+        ''' Add or overwrite a dictionary in the cache. Expires after `ttl` seconds if passed '''
+
+        self.cache_value(key, value, ttl)
+
+
+    def cache_list(self, key:str, value:list, ttl:int=None):
+        ''' Add or overwrite a list in the cache. Expires after `ttl` seconds if passed '''
+
+        self.cache_value(key, value, ttl)
+
+
+    @instrumented('hset', value='value')
+    def cache_dynamic_dict(self, key:str, value:dict, ttl:int=None):
+        ''' Store a python dictionary as a hash. Allows dictionary values to be updated without fetching the stored value.
+            The whole hash expires after `ttl` seconds if passed
+        '''
 
         # Attempt to insert the raw dictionary in Redis
         try:
@@ -62,57 +588,341 @@ class Cache:
             value = {x: json.dumps(y, cls=JSON_Encoder) for x,y in value.items()}
             self._redis.hset(key, mapping=value)
 
+        if ttl: self._redis.expire(key, ttl)
+        self._invalidate(key)
+
 
+    @instrumented('hset', value='value')
+    def cache_dynamic_dict_if_greater(self, key:str, value:Dict[str, str]) -> List[str]:
+        ''' Update string values in a hash stored with cache_dynamic_dict(), atomically keeping the stored value of any
+            field that sorts after the new one. Returns the fields that were updated
+        '''
+
+        updated = [field.decode() for field in self._redis.hset_if_greater(key, value)]
+        if updated: self._invalidate(key)
+        return updated
+
+
+    @instrumented('hget', read=True)
     def get_dynamic_dict_value(self, dict_key:str, key:str) -> str:
         ''' Get a value from a cached dictionary stored with cache_dynamic_dict() '''
 
         # Retrieve the dynamically cached dictionary
-        result = self._redis.hget(dict_key, key)
+        if self._is_local(dict_key):
+            result = self._get_local(f'{dict_key}\x00{key}', lambda: self._redis.hget(dict_key, key))
+        else:
+            result = self._redis.hget(dict_key, key)
         
         if result:
             return result.decode()
 
 
+    @instrumented('hdel')
     def clear_dynamic_dict_value(self, dict_key:str, key:Union[list,str]):
         ''' Delete a key or list of keys from a cached dictionary stored with cache_dynamic_dict() '''
 
         self._redis.hdel(dict_key, *([key] if isinstance(key,str) else key))
+        self._invalidate(dict_key)
 
 
-    def get(self, key:str) -> str:
-        ''' Fetch data from the cache by key '''
+    @instrumented('get', read=True)
+    def get(self, key:str) -> Any:
+        ''' Fetch data from the cache by key. Returns None if the key doesn't exist
 
-        # Retrieve the cached value and fix type if necessary
-        try:
-            return self._redis.get(key).decode()
+            Values stored with `cache_value()`, `cache_dict()` or `cache_list()` are returned as the type they were stored as.
+            Hashes stored with `cache_dynamic_dict()` are returned as dictionaries of strings and anything else as a string
+        '''
+
+        value = self._get_local(key, lambda: self._fetch(key)) if self._is_local(key) else self._fetch(key)
+        if isinstance(value, dict):
+            return {x.decode(): y.decode() for x,y in value.items()}
+
+        return Cache_Codec.decode(value) if value is not None else None
+
+
+    def _fetch(self, key:str) -> Union[bytes, dict]:
+        ''' Fetch a string or hash in a single round trip without knowing which it is. Returns None if the key doesn't exist '''
+
+        with self._redis.pipeline(transaction=False) as pipe:
+            # Exactly one of these fails with a WRONGTYPE error unless the key is missing
+            string, mapping = pipe.get(key).hgetall(key).execute(raise_on_error=False)
+
+        if not isinstance(string, ResponseError): return string
+        if not isinstance(mapping, ResponseError): return mapping
+        raise mapping
+
+
+    @instrumented('get', read=True)
+    def get_raw(self, key:str) -> bytes:
+        ''' Fetch the raw bytes of a value stored with cache_string() '''
+
+        if self._is_local(key):
+            value = self._get_local(key, lambda: self._fetch(key))
+            if not isinstance(value, dict):
+                return value
+
+        return self._redis.get(key)
+
+
+    def get_many(self, keys:Iterable[str]) -> List[Any]:
+        ''' Fetch several values stored with cache_string() or cache_value() in one round trip. Missing keys are returned as None '''
+
+        return [Cache_Codec.decode(value) if value is not None else None for value in self.get_many_raw(keys)]
+
+
+    @instrumented('get_many', read=True)
+    def get_many_raw(self, keys:Iterable[str]) -> List[bytes]:
+        ''' Same as `get_many()` but returns the raw bytes '''
+
+        keys = list(keys)
+        return self._redis.mget(keys) if keys else []
+
+
+    @instrumented('increment')
+    def increment(self, key:str, field:str=None, amount:int=1) -> int:
+        ''' Atomically increment a counter (or a counter stored in a hash under `field`) and return the new value '''
+
+        result = self._redis.hincrby(key, field, amount) if field else self._redis.incrby(key, amount)
+        self._invalidate(key)
+        return result
+
+
+    @instrumented('expire')
+    def expire(self, key:str, ttl:int) -> bool:
+        ''' Set a key to expire after `ttl` seconds. Returns False if the key doesn't exist '''
+
+        return bool(self._redis.expire(key, ttl))
 
-        # Attempt to retrieve a dynamically cached dictionary on failure
-        except ResponseError: 
-            return {x.decode(): y.decode() for x,y in  self._redis.hgetall(key).items()}
 
+    @instrumented('expire')
+    def expire_if_equal(self, key:str, value:Union[str, bytes], ttl:int) -> bool:
+        ''' Set a key to expire after `ttl` seconds only if it still holds `value`, atomically (e.g. to renew a lease only while still holding it).
+            Returns True if its TTL was set
+        '''
 
+        return bool(self._redis.expire_if_equal(key, value, ttl))
+
+
+    @instrumented('ttl')
+    def ttl(self, key:str) -> int:
+        ''' Seconds until a key expires. Returns None if the key doesn't exist or never expires '''
+
+        ttl = self._redis.ttl(key)
+        return ttl if ttl >= 0 else None
+
+
+    def get_or_compute(self, key:str, compute:Callable[[], Any], ttl:int, stale_ttl:int=None, beta:float=1.0, lock_timeout:float=10, tags:Iterable[str]=None) -> Any:
+        ''' Get a value cached by `get_or_compute()` or call `compute` and cache its result for `ttl` seconds (added to `tags` if passed)
+
+            Protects hot keys from stampedes when they expire:
+
+            - Callers recompute early with a probability that rises as the expiry nears and the longer `compute` took
+              (probabilistic early expiration, scaled by `beta`) so the value is usually refreshed before it expires
+
+            - Only the caller holding a short lock in Redis recomputes. Everyone else serves the current value, which is
+              kept for `stale_ttl` seconds (`ttl` by default) past its expiry for this purpose. Callers that find nothing
+              cached wait up to `lock_timeout` seconds for the result before computing it themselves
+        '''
+
+        entry = self.get(key)
+        if entry and time.time() - entry['d'] * beta * math.log(1.0 - random.random()) < entry['e']:
+            return entry['v']
+
+        # Missing, expired or picked to refresh early. Only recompute if no one else is
+        lock_key, token = f'{key}:_lock_', uuid.uuid4().hex
+        if self.add(lock_key, token, max(1, math.ceil(lock_timeout))):
+            try:
+                started = time.monotonic()
+                value = compute()
+                self.cache_value(key, {'v': value, 'd': time.monotonic() - started, 'e': time.time() + ttl}, ttl + (ttl if stale_ttl is None else stale_ttl), tags)
+                return value
+            finally:
+                # The lock may have expired and been taken by another caller if `compute` ran past `lock_timeout`
+                self.remove_if_equal(lock_key, token)
+
+        if entry:
+            return entry['v']
+
+        # Nothing cached yet, wait for the caller holding the lock
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self.get(key)
+            if entry:
+                return entry['v']
+
+        return compute()
+
+
+    @classmethod
+    def memoize(cls, ttl:int, key:Union[str, Callable[..., str]]=None, stale_ttl:int=None, beta:float=1.0, lock_timeout:float=10,
+        namespace:str=None, tags:Union[Iterable[str], Callable[..., Iterable[str]]]=None) -> Callable:
+        ''' Decorator that caches the results of a function (a route handler, task, etc) for `ttl` seconds with stampede protection (see `get_or_compute()`)
+
+            By default results are cached per set of arguments, identified by a hash of the arguments. Pass `key` to control this:
+            either a format string filled in with the arguments (e.g. `'user:{0}'`) or a function that is passed the
+            arguments and returns a key. Arguments that can't be serialized (e.g. a Flask `request`) should be covered by `key`
+
+            Results are stored in `namespace` if passed and added to `tags` (a list or a function passed the arguments that returns one),
+            so they can be invalidated in bulk with `invalidate_namespace()`/`invalidate_tags()` (e.g. everything derived from a collection).
+            The decorated function gets an `invalidate(*args, **kwargs)` method to remove the cached result for a set of arguments.
+            Flask `Response`s returned by route handlers are cached as their body, status and headers and rebuilt on every call
+        '''
+
+        def decorator(func:Callable) -> Callable:
+            prefix = f'{cls._memoize_prefix}:{func.__module__}.{func.__qualname__}'
+
+            def make_key(cache:Cache, args:tuple, kwargs:dict) -> str:
+                if callable(key): memo_key = f'{prefix}:{key(*args, **kwargs)}'
+                elif key is not None: memo_key = f'{prefix}:{key.format(*args, **kwargs)}'
+                else: memo_key = f'{prefix}:{hashlib.sha1(Cache_Codec.encode([list(args), sorted(kwargs.items())], 0)).hexdigest()}'
+
+                return cache.namespace_key(namespace, memo_key) if namespace else memo_key
+
+            @wraps(func)
+            def wrapped(*args, **kwargs):
+                cache = cls()
+                value = cache.get_or_compute(make_key(cache, args, kwargs), lambda: cls._to_cacheable(func(*args, **kwargs)), ttl, stale_ttl, beta, lock_timeout,
+                    tags(*args, **kwargs) if callable(tags) else tags)
+                return cls._from_cacheable(value)
+
+            def invalidate(*args, **kwargs):
+                cache = cls(); cache.remove(make_key(cache, args, kwargs))
+
+            wrapped.invalidate = invalidate
+            return wrapped
+
+        return decorator
+
+
+    @classmethod
+    def _to_cacheable(cls, value:Any) -> Any:
+        ''' The payload of a Flask `Response` (which `Cache_Codec` can't encode). Anything else is returned as-is '''
+
+        if isinstance(value, Response):
+            return {cls._response_field: value.get_data(), 'status': value.status_code, 'headers': [list(header) for header in value.headers.items()]}
+
+        return value
+
+
+    @classmethod
+    def _from_cacheable(cls, value:Any) -> Any:
+        ''' Rebuild a Flask `Response` stored with `_to_cacheable()`. Anything else is returned as-is '''
+
+        if isinstance(value, dict) and cls._response_field in value:
+            return Response(value[cls._response_field], status=value['status'], headers=value['headers'])
+
+        return value
+
+
+    def publish(self, channel:str, message:str) -> int:
+        ''' Publish a message to all subscribers of a channel '''
+
+        return self._redis.publish(channel, message)
+
+
+    def subscribe(self, *channels:str) -> Union[redis.client.PubSub, Memory_PubSub]:
+        ''' Subscribe to one or more channels. Messages are read with `listen()` or `get_message()` on the result '''
+
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*channels)
+        return pubsub
+
+
+    @instrumented('remove')
     def remove(self, key:Union[list,str]):
         ''' Remove a stored key or list of keys '''
 
-        self._redis.delete(*([key] if isinstance(key,str) else key))
+        keys = [key] if isinstance(key,str) else key
+        self._redis.delete(*keys)
+        self._invalidate(*keys)
 
 
-    def keys(self, regex:str='*') -> list:
-        ''' View the keys stored in the cache or all keys matching a passed regular expression'''
+    def remove_matching(self, regex:str, count:int=None) -> int:
+        ''' Remove every key matching a pattern without blocking Redis. Returns the number of keys removed '''
 
-        return [k.decode() for k in self._redis.keys(regex)]
+        count = count or Redis_Settings.REDIS_SCAN_COUNT
+        removed, page = 0, []
+        for key in self.keys(regex, count):
+            page.append(key)
+            if len(page) >= count:
+                removed += self._redis.unlink(*page); self._invalidate(*page); page = []
 
+        if page:
+            removed += self._redis.unlink(*page); self._invalidate(*page)
 
-    def view(self, regex:str='*') -> dict:
-        ''' View the entire contents of the cache or the keys+contents matching a passed regular expression '''
-        
-        return {k:self.get(k) for k in self.keys(regex)}
+        return removed
+
+
+    def keys(self, regex:str='*', count:int=None, limit:int=None) -> Iterator[str]:
+        ''' Iterate over the keys stored in the cache or all keys matching a passed pattern
+
+            Keys are fetched incrementally with `SCAN` (about `count` keys per call, `REDIS_SCAN_COUNT` by default) so Redis isn't
+            blocked on large keyspaces. Stops after `limit` keys if passed. Keys added or removed while iterating may or may not be included
+        '''
+
+        for num, key in enumerate(self._redis.scan_iter(match=regex, count=count or Redis_Settings.REDIS_SCAN_COUNT)):
+            if limit is not None and num >= limit:
+                return
+
+            yield key.decode()
+
+
+    def view(self, regex:str='*', count:int=None, limit:int=None) -> Iterator[Tuple[str, Any]]:
+        ''' Iterate over the (key, value) pairs of the entire cache or the keys matching a passed pattern
+
+            Keys are scanned like `keys()` and values are fetched a page of `count` keys at a time in a single pipeline.
+            Hashes are returned as dictionaries, lists and sorted sets as lists and sets as sets. Values that aren't valid
+            UTF-8 are returned as bytes and values stored with `cache_value()` as the type they were stored as
+        '''
+
+        count = count or Redis_Settings.REDIS_SCAN_COUNT
+        page = []
+        for key in self.keys(regex, count, limit):
+            page.append(key)
+            if len(page) >= count:
+                yield from self._fetch_page(page); page = []
+
+        if page:
+            yield from self._fetch_page(page)
+
+
+    def _fetch_page(self, keys:List[str]) -> Iterator[Tuple[str, Any]]:
+        ''' Fetch the values for a page of keys with one round trip for their types and one for their values '''
+
+        with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.type(key)
+
+            fetched = []
+            for key, key_type in zip(keys, pipe.execute()):
+                fetch = self._FETCH.get(key_type.decode())
+                if fetch:   # Keys removed since they were scanned have type `none` and are skipped
+                    fetch(pipe, key); fetched.append(key)
+
+            for key, value in zip(fetched, pipe.execute()):
+                yield key, self._decode(value)
+
+
+    @classmethod
+    def _decode(cls, value):
+        ''' Decode values returned by Redis, leaving binary data as bytes '''
+
+        if isinstance(value, bytes):
+            return Cache_Codec.decode(value)
+
+        if isinstance(value, dict): return {cls._decode(k): cls._decode(v) for k, v in value.items()}
+        if isinstance(value, set):  return {cls._decode(v) for v in value}
+        if isinstance(value, list): return [cls._decode(v) for v in value]
+        if isinstance(value, tuple): return tuple(cls._decode(v) for v in value)
+        return value
 
 
     def flush(self, force=False):
         ''' Flush the cache '''
 
         self._redis.flushall(asynchronous=(not force))
+        self.local().clear()
 
 
     def save_to_disk(self):
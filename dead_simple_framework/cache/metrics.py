@@ -0,0 +1,240 @@
+# Encoding
+from .codec import Cache_Codec
+
+# Utilities
+from functools import wraps
+import inspect, math, random, threading, time
+
+# Typing
+from typing import Any, Callable, Dict, List
+
+
+class Cache_Metrics:
+    ''' In-process instrumentation for `Cache` operations. Safe to share between threads
+
+        Calls, hits, misses and errors are counted for every operation, per key prefix (the namespace before the first `:`).
+        Latency, payload sizes and hot/big keys are only recorded for a random `sample_rate` fraction of calls, so the
+        overhead is a counter update unless a call is sampled:
+
+        - Latencies go into a log-scaled histogram (4 buckets per doubling, ~19% resolution) that percentiles are read from
+        - Hot keys are tracked with the Space-Saving algorithm over `top_k * 10` counters. Counts are scaled by the sample rate
+        - Big keys are the `top_k` largest payloads seen
+
+        Prefixes beyond the first `max_prefixes` are counted under `_other_` so unprefixed keys can't grow the stats without bound
+    '''
+
+    OTHER = '_other_'
+    BUCKETS_PER_DOUBLING = 4
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, sample_rate:float=0.01, top_k:int=20, max_prefixes:int=100):
+        self.sample_rate = sample_rate
+        self.top_k = top_k
+        self.max_prefixes = max_prefixes
+
+        self._lock = threading.Lock()
+        self.reset()
+
+
+    def reset(self):
+        ''' Clear everything recorded so far '''
+
+        with self._lock:
+            self._prefixes = set()                      # Prefixes recorded separately (the rest go under `_other_`)
+            self._counts:Dict[tuple, list] = {}         # (prefix, operation) -> [calls, hits, misses, errors]
+            self._latency:Dict[tuple, dict] = {}        # (prefix, operation) -> {bucket: sampled calls}
+            self._sizes:Dict[str, list] = {}            # prefix -> [sampled payloads, total bytes, max bytes]
+            self._hot:Dict[str, list] = {}              # key -> [sampled calls, overestimate] (Space-Saving counters)
+            self._big:Dict[str, int] = {}               # key -> largest payload seen in bytes
+            self._started = time.time()
+
+
+    def sampled(self) -> bool:
+        ''' Pick whether to record the details of a call '''
+
+        return bool(self.sample_rate) and random.random() < self.sample_rate
+
+
+    @staticmethod
+    def size_of(value:Any) -> int:
+        ''' Approximate size of a payload in bytes (the encoded size for values that aren't strings, bytes or hashes) '''
+
+        if value is None:               return 0
+        if isinstance(value, bytes):    return len(value)
+        if isinstance(value, str):      return len(value.encode())
+        if isinstance(value, dict) and all(isinstance(x, (str, bytes)) for x in value.values()):
+            return sum(Cache_Metrics.size_of(x) + Cache_Metrics.size_of(y) for x, y in value.items())
+
+        return len(Cache_Codec.encode(value, 0))
+
+
+    def record(self, operation:str, keys:List[str], hits:int=0, misses:int=0, error:bool=False, seconds:float=None, sizes:Dict[str, int]=None):
+        ''' Record a call. `seconds` and `sizes` (bytes per key) are only passed for sampled calls '''
+
+        if not keys:
+            return
+
+        with self._lock:
+            prefix = self._prefix(keys[0])
+            counts = self._counts.setdefault((prefix, operation), [0, 0, 0, 0])
+            counts[0] += 1; counts[1] += hits; counts[2] += misses; counts[3] += int(error)
+            if seconds is None:
+                return
+
+            bucket = max(0, int(math.log2(seconds * 1e6) * self.BUCKETS_PER_DOUBLING)) if seconds > 1e-6 else 0
+            histogram = self._latency.setdefault((prefix, operation), {})
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+            for key in keys:
+                self._count_hot(key)
+
+            for key, size in (sizes or {}).items():
+                stats = self._sizes.setdefault(prefix, [0, 0, 0])
+                stats[0] += 1; stats[1] += size; stats[2] = max(stats[2], size)
+                self._count_big(key, size)
+
+
+    def _prefix(self, key:str) -> str:
+        ''' The prefix to record a key under (lock must be held) '''
+
+        prefix = key.split(':', 1)[0]
+        if prefix in self._prefixes:
+            return prefix
+
+        if len(self._prefixes) >= self.max_prefixes:
+            return self.OTHER
+
+        self._prefixes.add(prefix)
+        return prefix
+
+
+    def _count_hot(self, key:str):
+        ''' Count a sampled access to a key, replacing the least accessed counter if all are in use (lock must be held) '''
+
+        counter = self._hot.get(key)
+        if counter:
+            counter[0] += 1
+        elif len(self._hot) < self.top_k * 10:
+            self._hot[key] = [1, 0]
+        else:
+            coldest = min(self._hot, key=lambda hot_key: self._hot[hot_key][0])
+            count = self._hot.pop(coldest)[0]
+            self._hot[key] = [count + 1, count]
+
+
+    def _count_big(self, key:str, size:int):
+        ''' Keep a key if it's one of the `top_k` largest payloads seen (lock must be held) '''
+
+        if key in self._big or len(self._big) < self.top_k:
+            self._big[key] = max(size, self._big.get(key, 0)); return
+
+        smallest = min(self._big, key=self._big.get)
+        if size > self._big[smallest]:
+            del self._big[smallest]
+            self._big[key] = size
+
+
+    @classmethod
+    def _percentile(cls, histogram:dict, percentile:float) -> float:
+        ''' Upper bound (in milliseconds) of the histogram bucket containing a percentile '''
+
+        target, seen = sum(histogram.values()) * percentile / 100.0, 0
+        for bucket in sorted(histogram):
+            seen += histogram[bucket]
+            if seen >= target:
+                return round(2 ** ((bucket + 1) / cls.BUCKETS_PER_DOUBLING) / 1000.0, 4)
+
+
+    def stats(self) -> dict:
+        ''' Counts, hit rates, latency percentiles and payload sizes per prefix and operation plus the hottest and biggest keys '''
+
+        with self._lock:
+            counts, latency = dict(self._counts), {key: dict(histogram) for key, histogram in self._latency.items()}
+            sizes, hot, big = {prefix: list(stats) for prefix, stats in self._sizes.items()}, dict(self._hot), dict(self._big)
+
+        prefixes = {}
+        for (prefix, operation), (calls, hits, misses, errors) in sorted(counts.items()):
+            stats = prefixes.setdefault(prefix, {'calls': 0, 'hits': 0, 'misses': 0, 'errors': 0, 'operations': {}})
+            stats['calls'] += calls; stats['hits'] += hits; stats['misses'] += misses; stats['errors'] += errors
+
+            operation_stats = {'calls': calls, 'hits': hits, 'misses': misses, 'errors': errors}
+            if hits or misses:
+                operation_stats['hit_rate'] = hits / (hits + misses)
+
+            histogram = latency.get((prefix, operation))
+            if histogram:
+                operation_stats['latency_ms'] = {'samples': sum(histogram.values()), **{f'p{p}': self._percentile(histogram, p) for p in self.PERCENTILES},
+                    'max': self._percentile(histogram, 100)}
+
+            stats['operations'][operation] = operation_stats
+
+        for prefix, stats in prefixes.items():
+            stats['hit_rate'] = stats['hits'] / (stats['hits'] + stats['misses']) if stats['hits'] + stats['misses'] else None
+            if prefix in sizes:
+                samples, total, largest = sizes[prefix]
+                stats['payload_bytes'] = {'samples': samples, 'mean': total / samples, 'max': largest}
+
+        scale = 1.0 / self.sample_rate if self.sample_rate else 0
+        hottest = sorted(hot.items(), key=lambda item: item[1][0], reverse=True)[:self.top_k]
+
+        return {
+            'since': self._started,
+            'sample_rate': self.sample_rate,
+            'prefixes': prefixes,
+            'hot_keys': [{'key': key, 'estimated_calls': round(count * scale), 'error': round(error * scale)} for key, (count, error) in hottest],
+            'big_keys': [{'key': key, 'bytes': size} for key, size in sorted(big.items(), key=lambda item: item[1], reverse=True)]
+        }
+
+
+def instrumented(operation:str, read:bool=False, prefix:str=None, value:str=None) -> Callable:
+    ''' Decorator that records calls to a `Cache` method in `Cache.metrics()`
+
+    Args:
+        operation (str): Name the calls are recorded under
+        read (bool, optional): Count hits and misses (results that are None are misses, lists are counted per item)
+        prefix (str, optional): Record every call under this key instead of the method's first argument
+        value (str, optional): Argument holding the payload of a write. Reads record the size of the result.
+            Writes that take a dictionary of keys to values as their first argument record the size of each value
+    '''
+
+    def decorator(method:Callable) -> Callable:
+        signature = inspect.signature(method)
+        first = list(signature.parameters)[1]
+
+        @wraps(method)
+        def wrapped(cache, *args, **kwargs):
+            metrics = cache.metrics()
+            if metrics is None:
+                return method(cache, *args, **kwargs)
+
+            target = args[0] if args else kwargs.get(first)
+            keys = [prefix] if prefix else [target] if isinstance(target, str) else list(target or [])
+            sampled = metrics.sampled()
+            started = time.perf_counter() if sampled else None
+
+            try:
+                result = method(cache, *args, **kwargs)
+            except Exception:
+                metrics.record(operation, keys, error=True); raise
+
+            hits = misses = 0
+            if read:
+                hits = sum(item is not None for item in result) if isinstance(result, list) else int(result is not None)
+                misses = (len(result) if isinstance(result, list) else 1) - hits
+
+            sizes = None
+            if sampled:
+                if read:
+                    values = result if isinstance(result, list) else [result]
+                elif value:
+                    values = [signature.bind(cache, *args, **kwargs).arguments.get(value)]
+                else:
+                    values = list(target.values()) if isinstance(target, dict) else []
+                sizes = {key: metrics.size_of(item) for key, item in zip(keys, values) if item is not None}
+
+            metrics.record(operation, keys, hits, misses, seconds=time.perf_counter() - started if sampled else None, sizes=sizes)
+            return result
+
+        return wrapped
+
+    return decorator
@@ -0,0 +1,308 @@
+# Redis
+import redis
+from redis.cluster import RedisCluster
+from redis.exceptions import RedisError, ResponseError
+
+# Backends
+from .backends import Redis_Backend
+
+# Utilities
+from bisect import bisect
+from itertools import chain
+import hashlib, random
+
+# Typing
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+
+class Hash_Ring:
+    ''' Consistent hash ring mapping keys to nodes
+
+        Each node is placed on the ring `virtual_nodes` times so keys are spread evenly. Adding or removing a node
+        only remaps the keys that fall on its points (about 1/N of the keys). Like Redis Cluster, only the part of a
+        key inside `{...}` is hashed if it has one, so related keys (e.g. `{user:1}:profile` and `{user:1}:posts`)
+        can be kept on the same node
+    '''
+
+    def __init__(self, nodes:List[str]=None, virtual_nodes:int=160):
+        self.virtual_nodes = virtual_nodes
+        self.nodes = []
+        self._points:List[int] = []
+        self._owners:List[str] = []
+        for node in nodes or []:
+            self.add_node(node)
+
+
+    @staticmethod
+    def hash(key:str) -> int:
+        ''' Position of a key on the ring (stable across processes, unlike `hash()`) '''
+
+        start = key.find('{')
+        if start != -1:
+            end = key.find('}', start + 1)
+            if end > start + 1: key = key[start + 1:end]
+
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+    def add_node(self, node:str):
+        ''' Add a node to the ring '''
+
+        if node in self.nodes:
+            return
+
+        self.nodes.append(node)
+        points = sorted(list(zip(self._points, self._owners)) + [(self.hash(f'{node}#{num}'), node) for num in range(self.virtual_nodes)])
+        self._points, self._owners = [point for point, _ in points], [owner for _, owner in points]
+
+
+    def remove_node(self, node:str):
+        ''' Remove a node from the ring. Its keys move to the next node on the ring '''
+
+        self.nodes.remove(node)
+        points = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points, self._owners = [point for point, _ in points], [owner for _, owner in points]
+
+
+    def get_node(self, key:str) -> str:
+        ''' The node a key is stored on '''
+
+        if not self._points:
+            raise RedisError('No Redis nodes configured')
+
+        return self._owners[bisect(self._points, self.hash(key)) % len(self._points)]
+
+
+class Sharded_Backend:
+    ''' Backend that spreads keys across several Redis nodes with a `Hash_Ring`
+
+        Single key commands are sent to the node owning the key. Multi-key commands (`mget`, `mset`, `delete`, `unlink`,
+        `exists`) are split per node and their results merged. `scan_iter` walks every node and `flushall`/`save`/`ping`
+        are sent to all of them. Pub/sub goes through the first node so every worker meets on the same server.
+        Reads can be served by replicas (eventually consistent) if `read_from_replicas` is set.
+        Pipelines are split per node, so transactions are only atomic per node
+    '''
+
+    IN_MEMORY = False
+
+    READS = {'get', 'getbit', 'hget', 'hgetall', 'smembers', 'scard', 'type', 'ttl', 'lrange', 'zrange'}
+    KEYED = READS | {'set', 'setbit', 'hset', 'hdel', 'hincrby', 'incrby', 'expire', 'persist', 'sadd', 'srem', 'delete_if_equal', 'expire_if_equal', 'set_if_equal', 'set_if_newer', 'hset_if_greater'}
+    MULTI_KEY = {'delete', 'unlink', 'exists', 'mget', 'mset'}
+    BROADCAST = {'flushall', 'save', 'ping'}
+
+    def __init__(self, nodes:List[str], connect:Callable[[str], Redis_Backend], replicas:Dict[str, List[str]]=None,
+        virtual_nodes:int=160, read_from_replicas:bool=False):
+        ''' Create a sharded backend
+
+        Args:
+            nodes (List[str]): Node addresses (`host:port` or `host:port/db`). Used as the node names on the ring
+            connect (Callable): Creates a client for a node address
+            replicas (Dict[str, List[str]], optional): Replica addresses for each node
+            virtual_nodes (int, optional): Points per node on the ring
+            read_from_replicas (bool, optional): Send reads to a random replica of the owning node if it has any
+        '''
+
+        self.ring = Hash_Ring(nodes, virtual_nodes)
+        self.clients = {node: connect(node) for node in nodes}
+        self.replicas = {node: [connect(replica) for replica in (replicas or {}).get(node, [])] for node in nodes}
+        self.read_from_replicas = read_from_replicas
+
+
+    def client_for(self, key:str, read:bool=False) -> Redis_Backend:
+        ''' The client for the node owning a key (or one of its replicas for reads if enabled) '''
+
+        return self._client(self.ring.get_node(key if isinstance(key, str) else key.decode()), read)
+
+
+    def _client(self, node:str, read:bool=False) -> Redis_Backend:
+        ''' The client for a node (or one of its replicas for reads if enabled) '''
+
+        if read and self.read_from_replicas and self.replicas[node]:
+            return random.choice(self.replicas[node])
+
+        return self.clients[node]
+
+
+    def _home(self) -> Redis_Backend:
+        ''' The node used for commands that aren't tied to a key '''
+
+        return self.clients[self.ring.nodes[0]]
+
+
+    def _group(self, keys:List[str]) -> Dict[str, List[Tuple[int, str]]]:
+        ''' Group keys by node, keeping their original positions '''
+
+        groups = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(self.ring.get_node(key if isinstance(key, str) else key.decode()), []).append((position, key))
+
+        return groups
+
+
+    def split(self, name:str, args:tuple, kwargs:dict) -> Tuple[List[Tuple[str, tuple]], Callable[[list], Any]]:
+        ''' Split a command into per-node parts. Returns the (node, args) parts and a function that merges their results '''
+
+        if name in self.KEYED:
+            return [(self.ring.get_node(args[0] if isinstance(args[0], str) else args[0].decode()), args)], lambda results: results[0]
+
+        if name in ('delete', 'unlink', 'exists'):
+            groups = self._group(list(args))
+            return [(node, tuple(key for _, key in keys)) for node, keys in groups.items()], sum
+
+        if name == 'mget':
+            keys = ([args[0]] if isinstance(args[0], (str, bytes)) else list(args[0])) + list(args[1:])
+            groups = list(self._group(keys).items())
+
+            def merge(results:list) -> list:
+                merged = [None] * len(keys)
+                for (_, node_keys), values in zip(groups, results):
+                    for (position, _), value in zip(node_keys, values):
+                        merged[position] = value
+                return merged
+
+            return [(node, ([key for _, key in node_keys],)) for node, node_keys in groups], merge
+
+        if name == 'mset':
+            groups = self._group(list(args[0]))
+            return [(node, ({key: args[0][key] for _, key in keys},)) for node, keys in groups.items()], all
+
+        raise AttributeError(f"'{type(self).__name__}' does not support [{name}]")
+
+
+    def _run(self, name:str, args:tuple, kwargs:dict) -> Any:
+        ''' Run a command on the nodes it touches and merge the results '''
+
+        read = name in self.READS or name in ('mget', 'exists')
+        if name in self.KEYED:
+            return getattr(self.client_for(args[0], read), name)(*args, **kwargs)
+
+        parts, merge = self.split(name, args, kwargs)
+        return merge([getattr(self._client(node, read), name)(*node_args, **kwargs) for node, node_args in parts])
+
+
+    def __getattr__(self, name:str):
+        if name in self.KEYED or name in self.MULTI_KEY:
+            return lambda *args, **kwargs: self._run(name, args, kwargs)
+
+        if name in self.BROADCAST:
+            return lambda *args, **kwargs: all([getattr(client, name)(*args, **kwargs) for client in self.clients.values()])
+
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+
+    def scan_iter(self, match:str=None, count:int=None, _type:str=None) -> Iterator[bytes]:
+        return chain.from_iterable(client.scan_iter(match=match, count=count, _type=_type) for client in self.clients.values())
+
+
+    def publish(self, channel, message) -> int:
+        return self._home().publish(channel, message)
+
+
+    def pubsub(self, **kwargs) -> redis.client.PubSub:
+        return self._home().pubsub(**kwargs)
+
+
+    def pipeline(self, transaction:bool=True, shard_hint=None) -> 'Sharded_Pipeline':
+        return Sharded_Pipeline(self, transaction)
+
+
+class Sharded_Pipeline:
+    ''' Queues commands for a `Sharded_Backend`. `execute()` sends one pipeline to each node involved (atomic per node
+        if `transaction` is set) and returns the merged results in the order the commands were queued
+    '''
+
+    IN_MEMORY = False
+
+    def __init__(self, backend:Sharded_Backend, transaction:bool=True):
+        self._backend = backend
+        self._transaction = transaction
+        self._commands = []
+
+
+    def __getattr__(self, name:str):
+        if name not in Sharded_Backend.KEYED and name not in Sharded_Backend.MULTI_KEY:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+        def queue_command(*args, **kwargs) -> 'Sharded_Pipeline':
+            self._commands.append((name, args, kwargs)); return self
+
+        return queue_command
+
+
+    def execute(self, raise_on_error:bool=True) -> list:
+        pipes, queued = {}, []
+        for name, args, kwargs in self._commands:
+            parts, merge = self._backend.split(name, args, kwargs)
+            positions = []
+            for node, node_args in parts:
+                pipe = pipes.setdefault(node, self._backend.clients[node].pipeline(transaction=self._transaction))
+                getattr(pipe, name)(*node_args, **kwargs)
+                positions.append((node, len(pipe) - 1))
+            queued.append((positions, merge))
+
+        node_results = {node: pipe.execute(raise_on_error=False) for node, pipe in pipes.items()}
+
+        results = []
+        for positions, merge in queued:
+            parts = [node_results[node][index] for node, index in positions]
+            errors = [part for part in parts if isinstance(part, Exception)]
+            results.append(errors[0] if errors else merge(parts))
+
+        self._commands = []
+        errors = [result for result in results if isinstance(result, Exception)]
+        if raise_on_error and errors:
+            raise errors[0]
+
+        return results
+
+
+    def reset(self):
+        self._commands = []
+
+
+    def __enter__(self) -> 'Sharded_Pipeline':
+        return self
+
+
+    def __exit__(self, *args):
+        self.reset()
+
+
+    def __len__(self) -> int:
+        return len(self._commands)
+
+
+class Cluster_Backend(RedisCluster):
+    ''' Backend used when the configured Redis node is part of a Redis Cluster. Keys are routed by the cluster's slots.
+        Multi-key reads/writes are split per slot and pipelines are not atomic across slots
+    '''
+
+    IN_MEMORY = False
+
+    delete_if_equal = Redis_Backend.delete_if_equal
+    expire_if_equal = Redis_Backend.expire_if_equal
+    set_if_equal = Redis_Backend.set_if_equal
+    set_if_newer = Redis_Backend.set_if_newer
+    hset_if_greater = Redis_Backend.hset_if_greater
+
+
+    def mget(self, keys, *args) -> list:
+        return self.mget_nonatomic(keys, *args)
+
+
+    def mset(self, mapping:dict) -> list:
+        return self.mset_nonatomic(mapping)
+
+
+    def pipeline(self, transaction:bool=None, shard_hint=None):
+        return Redis_Backend.with_scripts(super().pipeline())
+
+
+    @staticmethod
+    def is_cluster(client:redis.Redis) -> bool:
+        ''' Check if a node has cluster mode enabled '''
+
+        try:
+            return bool(client.info('cluster').get('cluster_enabled'))
+        except ResponseError:
+            return False
@@ -0,0 +1,29 @@
+# Cache
+from .main import Cache
+
+
+class Collection_Versions:
+    ''' Per-collection version counters. The version changes whenever data in the collection changes so it can be
+        included in cache keys or compared to detect stale data. Maintained by the `Change_Watcher`
+    '''
+
+    _cache_key = '_collection_versions_'     # Cache key for the hash of collection versions
+
+
+    @staticmethod
+    def _field(database:str, collection:str) -> str:
+        return f'{database}:{collection}'
+
+
+    @classmethod
+    def get(cls, database:str, collection:str) -> int:
+        ''' Get the current version of a collection '''
+
+        return int(Cache().get_dynamic_dict_value(cls._cache_key, cls._field(database, collection)) or 0)
+
+
+    @classmethod
+    def bump(cls, database:str, collection:str, amount:int=1) -> int:
+        ''' Increase the version of a collection and return the new version '''
+
+        return Cache().increment(cls._cache_key, cls._field(database, collection), amount)
@@ -9,7 +9,8 @@ class Route(Config):
 
     CONFIG_TYPE = 'url'
 
-    def __init__(self, url:str, handler=None, name:str=None, defaults:dict=None, collection:str=None, database:str=None, schema:dict=None):
+    def __init__(self, url:str, handler=None, name:str=None, defaults:dict=None, collection:str=None, database:str=None, schema:dict=None, cache_documents:bool=False,
+        bloom_filter:bool=False):
         ''' Initialize a new route to add to the route config 
         
         Args:
@@ -27,6 +28,14 @@ class Route(Config):
             database (str, optional): Optional MongoDB database to use for automatic storage and retrieval
                 of data when a request is sent to the route. This allows automatic CRUD operations with no additional
                 config. If this is not set the default database is used. See the documentation for the internal API for more info (TODO)
+
+            cache_documents (bool, optional): If True, GET requests that look up a single record by `_id` are served from
+                the document cache instead of sending a query to MongoDB for every request
+
+            bloom_filter (bool, optional): If True, GET requests that look up a single record by `_id` are answered with a 404
+                without querying MongoDB when a Bloom filter of the collection's `_id`s shows the record doesn't exist.
+                Only enable for collections written through the framework or tailed by the `Change_Watcher` (see `Id_Filter`).
+                The filter is kept in Redis. Without Redis every lookup goes to MongoDB
         '''
 
         self.url = Config.normalize_url(url)
@@ -36,3 +45,5 @@ class Route(Config):
         self.collection = collection
         self.database = database
         self.schema_handler = SchemaHandler(schema)
+        self.cache_documents = cache_documents
+        self.bloom_filter = bloom_filter
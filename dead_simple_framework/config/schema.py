@@ -105,9 +105,19 @@ class SchemaHandler:
            del response_chunk[path[0]]
 
 
+    def has_redactions(self, method:str) -> bool:
+        ''' Check if responses for a method need to be redacted '''
+
+        return bool(method in self.schema and self.schema[method].get('redact'))
+
+
     def redact_response(self, method:str, response:Response):
         ''' Redact a response payload bbased on the provided schema '''
 
+        # Skip re-parsing the response if there is nothing to redact
+        if not self.has_redactions(method):
+            return response
+
         data = response.get_json()
         if method in self.schema:
             method_schema = self.schema[method].copy()
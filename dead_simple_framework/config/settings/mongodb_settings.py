@@ -1,5 +1,6 @@
 # Interface class
 from .setting import Setting
+from .app_settings import get_list_from_env
 
 # Utilities
 import os, pymongo
@@ -23,11 +24,17 @@ class MongoDB_Settings(Setting):
     MONGODB_LOG_PATH = os.environ.get('MONGODB_LOG_PATH', os.path.expanduser('/tmp/mongo.log'))
     MONGODB_INSTALLATION_PATH = os.environ.get('RABBITMQ_INSTALLATION_PATH', '/usr/local/bin/mongod')
     FORCE_START_MONGODB = os.environ.get('FORCE_START_MONGODB', 'True').capitalize() == 'True'
+    MONGODB_QUERY_SAMPLE_RATE = float(os.environ.get('MONGODB_QUERY_SAMPLE_RATE', 0))
+    MONGODB_QUERY_EXPLAIN = os.environ.get('MONGODB_QUERY_EXPLAIN', 'False').capitalize() == 'True'
+    MONGODB_QUERY_FLUSH_SIZE = int(os.environ.get('MONGODB_QUERY_FLUSH_SIZE', 100))
+    MONGODB_WATCH_COLLECTIONS = get_list_from_env('MONGODB_WATCH_COLLECTIONS') or []
 
     def __init__(self, mongodb_atlas:bool=None, mongodb_host:str=None, mongodb_port:str=None, mongodb_username:str=None,
                     mongodb_password:str=None, mongodb_default_db:str=None, mongodb_default_collection:str=None,
                     mongodb_connection_string:str=None, mongodb_data_path:str=None, mongodb_log_path:str=None, 
-                    force_start_mongodb:bool=None, mongodb_installation_path:str=None, mongodb_conn_timeout:int=None):
+                    force_start_mongodb:bool=None, mongodb_installation_path:str=None, mongodb_conn_timeout:int=None,
+                    mongodb_query_sample_rate:float=None, mongodb_query_explain:bool=None, mongodb_query_flush_size:int=None,
+                    mongodb_watch_collections:list=None):
 
         if mongodb_atlas: MongoDB_Settings.MONGODB_ATLAS = mongodb_atlas
         if mongodb_host: MongoDB_Settings.MONGODB_HOST = mongodb_host
@@ -41,6 +48,10 @@ class MongoDB_Settings(Setting):
         if mongodb_installation_path: MongoDB_Settings.MONGODB_INSTALLATION_PATH = mongodb_installation_path
         if force_start_mongodb: MongoDB_Settings.FORCE_START_MONGODB = force_start_mongodb
         if mongodb_conn_timeout: MongoDB_Settings.MONGODB_CONN_TIMEOUT =mongodb_conn_timeout
+        if mongodb_query_sample_rate != None: MongoDB_Settings.MONGODB_QUERY_SAMPLE_RATE = mongodb_query_sample_rate
+        if mongodb_query_explain != None: MongoDB_Settings.MONGODB_QUERY_EXPLAIN = mongodb_query_explain
+        if mongodb_query_flush_size: MongoDB_Settings.MONGODB_QUERY_FLUSH_SIZE = mongodb_query_flush_size
+        if mongodb_watch_collections: MongoDB_Settings.MONGODB_WATCH_COLLECTIONS = mongodb_watch_collections
         if mongodb_connection_string: 
             MongoDB_Settings.MONGODB_CONNECTION_STRING = mongodb_connection_string
         else:
@@ -71,6 +82,8 @@ class MongoDB_Settings(Setting):
             conn_str,
             f'MongoDB default database set to [{MongoDB_Settings.MONGODB_DEFAULT_DB}]',
             f'MongoDB default collection set to [{MongoDB_Settings.MONGODB_DEFAULT_COLLECTION}]',
+            f'MongoDB query shape sampling set to [{MongoDB_Settings.MONGODB_QUERY_SAMPLE_RATE * 100}%]' if MongoDB_Settings.MONGODB_QUERY_SAMPLE_RATE else 'MongoDB query shape sampling disabled. Set `MONGODB_QUERY_SAMPLE_RATE` to enable it',
+            f'MongoDB change streams watched for cache invalidation: {MongoDB_Settings.MONGODB_WATCH_COLLECTIONS}' if MongoDB_Settings.MONGODB_WATCH_COLLECTIONS else 'MongoDB change streams not watched. Set `MONGODB_WATCH_COLLECTIONS` to enable cache invalidation for writes made outside the framework',
             *log_data,
             'Connected to MongoDB :)'
         ]
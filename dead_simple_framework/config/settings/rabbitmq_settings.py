@@ -20,10 +20,30 @@ class RabbitMQ_Settings(Setting):
     RABBITMQ_PASSWORD = os.environ.get('RABBITMQ_PASSWORD', 'guest')
     RABBITMQ_CONNECTION_STRING = os.environ.get('RABBITMQ_CONNECTION_STRING')
     RABBITMQ_INSTALLATION_PATH = os.environ.get('RABBITMQ_INSTALLATION_PATH', '/usr/local/opt/rabbitmq/sbin/rabbitmq-server')
+    TASK_RESULT_TIMEOUT = float(os.environ.get('TASK_RESULT_TIMEOUT', 300))
+    TASK_RESULT_TTL = int(os.environ.get('TASK_RESULT_TTL', 24 * 60 * 60))
+    TASK_INLINE_RESULT_BYTES = int(os.environ.get('TASK_INLINE_RESULT_BYTES', 16 * 1024))
+    TASK_RESULT_STORE = os.environ.get('TASK_RESULT_STORE', 'gridfs')
+    TASK_RESULT_STORE_PATH = os.environ.get('TASK_RESULT_STORE_PATH')
+    TASK_OFFLOAD_BYTES = int(os.environ.get('TASK_OFFLOAD_BYTES', 1024 * 1024))
+    TASK_RESULT_BATCH_SIZE = int(os.environ.get('TASK_RESULT_BATCH_SIZE', 1))
+    TASK_RESULT_FLUSH_SECONDS = float(os.environ.get('TASK_RESULT_FLUSH_SECONDS', 0.25))
+    TASK_RESULT_BUFFER_SIZE = int(os.environ.get('TASK_RESULT_BUFFER_SIZE', 10000))
+    TASK_ENGINE = os.environ.get('TASK_ENGINE', 'auto')
+    TASK_LOCAL_WORKERS = int(os.environ.get('TASK_LOCAL_WORKERS', min(32, (os.cpu_count() or 1) + 4)))
+    TASK_LOCAL_QUEUE_SIZE = int(os.environ.get('TASK_LOCAL_QUEUE_SIZE', 1000))
+    TASK_PARALLEL_CHUNK_SIZE = int(os.environ.get('TASK_PARALLEL_CHUNK_SIZE', 1))
+    TASK_PARALLEL_WINDOW = int(os.environ.get('TASK_PARALLEL_WINDOW', 100))
+    TASK_MAX_PRIORITY = int(os.environ.get('TASK_MAX_PRIORITY', 10))
+    TASK_THROUGHPUT_PREFETCH = int(os.environ.get('TASK_THROUGHPUT_PREFETCH', 16))
 
     def __init__(self, use_tasks:bool=None, force_start_rabbitmq:bool=None, force_start_celery:bool=None, rabbitmq_host:str=None, 
                     rabbitmq_port:str=None, rabbitmq_username:str=None, rabbitmq_password:str=None, rabbitmq_connection_string:str=None,
-                    rabbitmq_installation_path:str=None):
+                    rabbitmq_installation_path:str=None, task_result_timeout:float=None, task_result_ttl:int=None, task_inline_result_bytes:int=None,
+                    task_result_store:str=None, task_result_store_path:str=None, task_offload_bytes:int=None, task_engine:str=None,
+                    task_local_workers:int=None, task_local_queue_size:int=None, task_result_batch_size:int=None,
+                    task_result_flush_seconds:float=None, task_result_buffer_size:int=None, task_parallel_chunk_size:int=None,
+                    task_parallel_window:int=None, task_max_priority:int=None, task_throughput_prefetch:int=None):
 
         if use_tasks: RabbitMQ_Settings.USE_TASKS = use_tasks
         if force_start_rabbitmq: RabbitMQ_Settings.FORCE_START_RABBITMQ = force_start_rabbitmq
@@ -33,6 +53,22 @@ class RabbitMQ_Settings(Setting):
         if rabbitmq_username: RabbitMQ_Settings.RABBITMQ_USERNAME = rabbitmq_username
         if rabbitmq_password: RabbitMQ_Settings.RABBITMQ_PASSWORD = rabbitmq_password
         if rabbitmq_installation_path: RabbitMQ_Settings.RABBITMQ_INSTALLATION_PATH = rabbitmq_installation_path
+        if task_result_timeout: RabbitMQ_Settings.TASK_RESULT_TIMEOUT = task_result_timeout
+        if task_result_ttl: RabbitMQ_Settings.TASK_RESULT_TTL = task_result_ttl
+        if task_inline_result_bytes != None: RabbitMQ_Settings.TASK_INLINE_RESULT_BYTES = task_inline_result_bytes
+        if task_result_store: RabbitMQ_Settings.TASK_RESULT_STORE = task_result_store
+        if task_result_store_path: RabbitMQ_Settings.TASK_RESULT_STORE_PATH = task_result_store_path
+        if task_offload_bytes != None: RabbitMQ_Settings.TASK_OFFLOAD_BYTES = task_offload_bytes
+        if task_result_batch_size: RabbitMQ_Settings.TASK_RESULT_BATCH_SIZE = task_result_batch_size
+        if task_result_flush_seconds: RabbitMQ_Settings.TASK_RESULT_FLUSH_SECONDS = task_result_flush_seconds
+        if task_result_buffer_size: RabbitMQ_Settings.TASK_RESULT_BUFFER_SIZE = task_result_buffer_size
+        if task_engine: RabbitMQ_Settings.TASK_ENGINE = task_engine
+        if task_local_workers: RabbitMQ_Settings.TASK_LOCAL_WORKERS = task_local_workers
+        if task_local_queue_size != None: RabbitMQ_Settings.TASK_LOCAL_QUEUE_SIZE = task_local_queue_size
+        if task_parallel_chunk_size: RabbitMQ_Settings.TASK_PARALLEL_CHUNK_SIZE = task_parallel_chunk_size
+        if task_parallel_window: RabbitMQ_Settings.TASK_PARALLEL_WINDOW = task_parallel_window
+        if task_max_priority: RabbitMQ_Settings.TASK_MAX_PRIORITY = task_max_priority
+        if task_throughput_prefetch: RabbitMQ_Settings.TASK_THROUGHPUT_PREFETCH = task_throughput_prefetch
 
         if rabbitmq_connection_string: 
             RabbitMQ_Settings.RABBITMQ_CONNECTION_STRING = rabbitmq_connection_string
@@ -50,20 +86,33 @@ class RabbitMQ_Settings(Setting):
     def get_log_data():
         ''' Returns a list of the settings to log to console '''
 
+        if RabbitMQ_Settings.TASK_ENGINE == 'local':
+            return [f'Using the local task engine ({RabbitMQ_Settings.TASK_LOCAL_WORKERS} threads) via config']
+
         # If RabbbitMQ is enabled for tasks
         if RabbitMQ_Settings.USE_TASKS:
             rabbitmq_online = RabbitMQ_Settings.check_rabbitmq_connection()
             if RabbitMQ_Settings.USE_TASKS: 
-                rabbit_conn_test = 'Connected to RabbitMQ :)' if rabbitmq_online else 'WARNING - RabbitMQ ping failed. Ensure the service is running and config is correct. Defaulting to mutliprocess task engine'
+                rabbit_conn_test = 'Connected to RabbitMQ :)' if rabbitmq_online else 'WARNING - RabbitMQ ping failed. Ensure the service is running and config is correct. Defaulting to local task engine'
             else: 
-                rabbit_conn_test = 'RabbitMQ is disabled via config, defaulting to multiprocess task engine'
+                rabbit_conn_test = 'RabbitMQ is disabled via config, defaulting to local task engine'
         
             return [
                 f'RabbitMQ connection string set to [{RabbitMQ_Settings.RABBITMQ_CONNECTION_STRING}]',
                 rabbit_conn_test
             ]
         
-        return [f'RabbitMQ task engine disabled. Set `USE_TASKS` to True in environment to enable it']
+        return [f'RabbitMQ task engine disabled, using the local task engine. Set `USE_TASKS` to True in environment to enable it']
+
+
+    @staticmethod
+    def use_local_engine() -> bool:
+        ''' Check if tasks should run on the in-process task engine (`TASK_ENGINE` is `local`, or `auto` and RabbitMQ is disabled or offline) '''
+
+        if RabbitMQ_Settings.TASK_ENGINE != 'auto':
+            return RabbitMQ_Settings.TASK_ENGINE == 'local'
+
+        return not RabbitMQ_Settings.USE_TASKS or not RabbitMQ_Settings.check_rabbitmq_connection()
 
 
     @staticmethod
@@ -2,6 +2,7 @@
 from .setting import Setting
 
 # Utilities
+from .app_settings import get_list_from_env
 import os, redis
 
 class Redis_Settings(Setting):
@@ -17,8 +18,44 @@ class Redis_Settings(Setting):
     REDIS_DB = os.environ.get('REDIS_DB', 0)
     REDIS_INSTALLATION_PATH = os.environ.get('REDIS_INSTALLATION_PATH', '/usr/local/bin/redis-server')
     REDIS_CONNECTION_STRING = os.environ.get('REDIS_CONNECTION_STRING')
+    REDIS_DOCUMENT_TTL = int(os.environ.get('REDIS_DOCUMENT_TTL', 300))
+    REDIS_DOCUMENT_MISS_TTL = int(os.environ.get('REDIS_DOCUMENT_MISS_TTL', 5))
+    REDIS_DOCUMENT_LOCAL_SIZE = int(os.environ.get('REDIS_DOCUMENT_LOCAL_SIZE', 1024))
+    REDIS_DOCUMENT_LOCAL_TTL = int(os.environ.get('REDIS_DOCUMENT_LOCAL_TTL', 5))
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 5))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 5))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2))
+    REDIS_SOCKET_KEEPALIVE = os.environ.get('REDIS_SOCKET_KEEPALIVE', 'True').capitalize() == 'True'
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+    REDIS_SCAN_COUNT = int(os.environ.get('REDIS_SCAN_COUNT', 500))
+    REDIS_LOCAL_SIZE = int(os.environ.get('REDIS_LOCAL_SIZE', 1024))
+    REDIS_LOCAL_MAX_BYTES = int(os.environ.get('REDIS_LOCAL_MAX_BYTES', 16 * 1024 * 1024))
+    REDIS_LOCAL_TTL = int(os.environ.get('REDIS_LOCAL_TTL', 5))
+    REDIS_LOCAL_NAMESPACES = get_list_from_env('REDIS_LOCAL_NAMESPACES') or []
+    REDIS_COMPRESS_THRESHOLD = int(os.environ.get('REDIS_COMPRESS_THRESHOLD', 1024))
+    REDIS_MEMORY_MAX_BYTES = int(os.environ.get('REDIS_MEMORY_MAX_BYTES', 64 * 1024 * 1024))
+    REDIS_NODES = get_list_from_env('REDIS_NODES') or []                # `host:port[/db]` addresses to shard keys across
+    REDIS_REPLICAS = get_list_from_env('REDIS_REPLICAS') or []          # `node=replica` address pairs
+    REDIS_VIRTUAL_NODES = int(os.environ.get('REDIS_VIRTUAL_NODES', 160))
+    REDIS_READ_FROM_REPLICAS = os.environ.get('REDIS_READ_FROM_REPLICAS', 'False').capitalize() == 'True'
+    REDIS_METRICS = os.environ.get('REDIS_METRICS', 'True').capitalize() == 'True'
+    REDIS_METRICS_SAMPLE_RATE = float(os.environ.get('REDIS_METRICS_SAMPLE_RATE', 0.01))
+    REDIS_METRICS_TOP_K = int(os.environ.get('REDIS_METRICS_TOP_K', 20))
+    REDIS_METRICS_MAX_PREFIXES = int(os.environ.get('REDIS_METRICS_MAX_PREFIXES', 100))
+    REDIS_BLOOM_CAPACITY = int(os.environ.get('REDIS_BLOOM_CAPACITY', 1000000))
+    REDIS_BLOOM_ERROR_RATE = float(os.environ.get('REDIS_BLOOM_ERROR_RATE', 0.01))
+    REDIS_BLOOM_REBUILD_SECONDS = int(os.environ.get('REDIS_BLOOM_REBUILD_SECONDS', 6 * 60 * 60))
 
-    def __init__(self, use_redis:bool=None, force_start_redis:bool=None, redis_host:str=None, redis_port:str=None, redis_db:str=None, redis_connection_string:str=None):
+    def __init__(self, use_redis:bool=None, force_start_redis:bool=None, redis_host:str=None, redis_port:str=None, redis_db:str=None, redis_connection_string:str=None,
+                    redis_document_ttl:int=None, redis_document_miss_ttl:int=None, redis_document_local_size:int=None, redis_document_local_ttl:int=None,
+                    redis_max_connections:int=None, redis_pool_timeout:float=None, redis_socket_timeout:float=None, redis_socket_connect_timeout:float=None,
+                    redis_socket_keepalive:bool=None, redis_health_check_interval:int=None, redis_scan_count:int=None,
+                    redis_local_size:int=None, redis_local_max_bytes:int=None, redis_local_ttl:int=None, redis_local_namespaces:list=None,
+                    redis_compress_threshold:int=None, redis_memory_max_bytes:int=None, redis_nodes:list=None, redis_replicas:list=None,
+                    redis_virtual_nodes:int=None, redis_read_from_replicas:bool=None, redis_metrics:bool=None, redis_metrics_sample_rate:float=None,
+                    redis_metrics_top_k:int=None, redis_metrics_max_prefixes:int=None, redis_bloom_capacity:int=None, redis_bloom_error_rate:float=None,
+                    redis_bloom_rebuild_seconds:int=None):
 
         if use_redis: Redis_Settings.USE_REDIS = use_redis
         if force_start_redis: Redis_Settings.FORCE_START_REDIS = force_start_redis
@@ -30,6 +67,35 @@ class Redis_Settings(Setting):
         else:
             Redis_Settings.REDIS_CONNECTION_STRING = f'redis://{Redis_Settings.REDIS_HOST}:{Redis_Settings.REDIS_PORT}/{Redis_Settings.REDIS_DB}'
 
+        if redis_document_ttl: Redis_Settings.REDIS_DOCUMENT_TTL = redis_document_ttl
+        if redis_document_miss_ttl: Redis_Settings.REDIS_DOCUMENT_MISS_TTL = redis_document_miss_ttl
+        if redis_document_local_size != None: Redis_Settings.REDIS_DOCUMENT_LOCAL_SIZE = redis_document_local_size
+        if redis_document_local_ttl != None: Redis_Settings.REDIS_DOCUMENT_LOCAL_TTL = redis_document_local_ttl
+        if redis_max_connections: Redis_Settings.REDIS_MAX_CONNECTIONS = redis_max_connections
+        if redis_pool_timeout: Redis_Settings.REDIS_POOL_TIMEOUT = redis_pool_timeout
+        if redis_socket_timeout: Redis_Settings.REDIS_SOCKET_TIMEOUT = redis_socket_timeout
+        if redis_socket_connect_timeout: Redis_Settings.REDIS_SOCKET_CONNECT_TIMEOUT = redis_socket_connect_timeout
+        if redis_socket_keepalive != None: Redis_Settings.REDIS_SOCKET_KEEPALIVE = redis_socket_keepalive
+        if redis_health_check_interval != None: Redis_Settings.REDIS_HEALTH_CHECK_INTERVAL = redis_health_check_interval
+        if redis_scan_count: Redis_Settings.REDIS_SCAN_COUNT = redis_scan_count
+        if redis_local_size != None: Redis_Settings.REDIS_LOCAL_SIZE = redis_local_size
+        if redis_local_max_bytes != None: Redis_Settings.REDIS_LOCAL_MAX_BYTES = redis_local_max_bytes
+        if redis_local_ttl != None: Redis_Settings.REDIS_LOCAL_TTL = redis_local_ttl
+        if redis_local_namespaces: Redis_Settings.REDIS_LOCAL_NAMESPACES = redis_local_namespaces
+        if redis_compress_threshold != None: Redis_Settings.REDIS_COMPRESS_THRESHOLD = redis_compress_threshold
+        if redis_memory_max_bytes != None: Redis_Settings.REDIS_MEMORY_MAX_BYTES = redis_memory_max_bytes
+        if redis_nodes: Redis_Settings.REDIS_NODES = redis_nodes
+        if redis_replicas: Redis_Settings.REDIS_REPLICAS = redis_replicas
+        if redis_virtual_nodes: Redis_Settings.REDIS_VIRTUAL_NODES = redis_virtual_nodes
+        if redis_read_from_replicas != None: Redis_Settings.REDIS_READ_FROM_REPLICAS = redis_read_from_replicas
+        if redis_metrics != None: Redis_Settings.REDIS_METRICS = redis_metrics
+        if redis_metrics_sample_rate != None: Redis_Settings.REDIS_METRICS_SAMPLE_RATE = redis_metrics_sample_rate
+        if redis_metrics_top_k: Redis_Settings.REDIS_METRICS_TOP_K = redis_metrics_top_k
+        if redis_metrics_max_prefixes: Redis_Settings.REDIS_METRICS_MAX_PREFIXES = redis_metrics_max_prefixes
+        if redis_bloom_capacity: Redis_Settings.REDIS_BLOOM_CAPACITY = redis_bloom_capacity
+        if redis_bloom_error_rate: Redis_Settings.REDIS_BLOOM_ERROR_RATE = redis_bloom_error_rate
+        if redis_bloom_rebuild_seconds: Redis_Settings.REDIS_BLOOM_REBUILD_SECONDS = redis_bloom_rebuild_seconds
+
         # Allow redis to be force started from the application
         if Redis_Settings.FORCE_START_REDIS and not Redis_Settings.check_redis_connection():
             os.system(f'{Redis_Settings.REDIS_INSTALLATION_PATH} --daemonize yes')
@@ -50,6 +116,9 @@ class Redis_Settings(Setting):
                 f'Redis host set to [{Redis_Settings.REDIS_HOST}]',
                 f'Redis port set to [{Redis_Settings.REDIS_PORT}]',
                 f'Redis default db set to [{Redis_Settings.REDIS_DB}]',
+                f'Redis connection pool size set to [{Redis_Settings.REDIS_MAX_CONNECTIONS}]',
+                f'Redis nodes set to [{", ".join(Redis_Settings.REDIS_NODES) or "default node"}]',
+                f'Cache metrics sampling set to [{Redis_Settings.REDIS_METRICS_SAMPLE_RATE * 100}%]' if Redis_Settings.REDIS_METRICS else 'Cache metrics disabled',
                 conn_test
             ]
         
@@ -3,15 +3,18 @@
 from .config import Config
 
 # Typing
-from typing import Callable
+from typing import Callable, List, Union
 
 
 class TaskConfig(Config):
     ''' Used to specify a task in the config dictionary '''
 
     CONFIG_TYPE = 'task'
+    PREFETCH_PROFILES = ('latency', 'throughput')
 
-    def __init__(self, name:str, logic:Callable, schedule:dict=None, default_args:tuple=None, default_kwargs:dict=None, depends_on:str=None, store_results:bool=None):
+    def __init__(self, name:str, logic:Callable, schedule:dict=None, default_args:tuple=None, default_kwargs:dict=None, depends_on:Union[str, list]=None, store_results:Union[bool, str]=None,
+        result_ttl:int=None, resolve_references:bool=True, memoize_ttl:int=None, deduplicate:bool=None, queue:str=None, priority:int=None,
+        rate_limit:Union[str, int]=None, soft_time_limit:Union[int, float]=None, time_limit:Union[int, float]=None, prefetch:str=None):
         ''' Initialize a new task to add to the task config 
         
         Args:
@@ -26,12 +29,48 @@ class TaskConfig(Config):
             
             default_kwargs (dict): A dictionary of default keyword arguments + values to pass to the task
 
-            depends_on (str): The name of another task that this one depends on. Used to create chains of dependant tasks
+            depends_on (Union[str, list]): The name of another task that this one depends on (its result is passed as the first argument).
+                Used to create chains of dependant tasks. If passed a list of task names, they run first (in parallel where they don't
+                depend on each other) and a dictionary of their results by task name is passed as the first argument instead
 
-            store_results (bool): If set to True, all results for this task will be store. If set to false no results will be stored.
+            store_results (Union[bool, str]): If set to True, all results for this task will be store. If set to false no results will be stored.
+                If set to 'cache', only the latest result will be kept and only in the cache (never in the database).
                 If not set, only the latest result will be saved (default behavior)
+
+            result_ttl (int): Seconds cached results are kept for (`TASK_RESULT_TTL` by default). Applies to every result of
+                tasks with `store_results='cache'` and to results small enough to be cached for other tasks
+
+            resolve_references (bool): If set to False, large results passed from other tasks (over `TASK_OFFLOAD_BYTES`) are passed
+                to the task's logic as `Result_Reference`s to load with `get()` when needed instead of being loaded before it runs
+
+            memoize_ttl (int): If set, the result for a set of arguments is cached for this many seconds and returned by `run_task()`
+                (or `get_result()` with `args`/`kwargs`) instead of running the task again
+
+            deduplicate (bool): If set, scheduling the task while it's running with the same arguments attaches to the running
+                execution instead of starting another one. Defaults to True for memoized tasks
+
+            queue (str): The queue the task is sent to (Celery's default queue if not set). Workers can be started for
+                specific queues with `Task_Manager.start_worker()` to keep slow batch tasks from holding up quick ones
+
+            priority (int): Priority of the task in its queue, from 0 (lowest) to `TASK_MAX_PRIORITY`. Only applies to tasks with a `queue`
+
+            rate_limit (Union[str, int]): Most runs of the task per worker, e.g. `'10/s'`, `'100/m'` or `'1000/h'` (per second if a number).
+                Only applies when the task is sent on its own. Runs from `Task_Manager.parallelize()` and from graphs of tasks
+                with several dependencies happen inside the framework's helper tasks and aren't rate limited
+
+            soft_time_limit (Union[int, float]): Seconds the task can run before a `SoftTimeLimitExceeded` is raised inside it.
+                Not applied to runs from `Task_Manager.parallelize()` (tasks are sent in chunks)
+
+            time_limit (Union[int, float]): Seconds the task can run before the worker process running it is killed.
+                Not applied to runs from `Task_Manager.parallelize()`
+
+            prefetch (str): How workers for the task's queue take messages:
+                - 'latency'    | One message per worker process at a time so queued tasks go to the next free process [default]
+                - 'throughput' | `TASK_THROUGHPUT_PREFETCH` messages per process to cut broker round trips for many short tasks
         '''
 
+        assert prefetch in self.PREFETCH_PROFILES or prefetch is None, f"TaskConfig error for task [{name}] | prefetch must be one of {self.PREFETCH_PROFILES}"
+
         self.name = name
         self.logic = logic
         self.schedule = schedule # TODO - Add schedule config
@@ -39,6 +78,16 @@ class TaskConfig(Config):
         self.default_kwargs = default_kwargs
         self.depends_on = depends_on
         self.store_results = store_results
+        self.result_ttl = result_ttl
+        self.resolve_references = resolve_references
+        self.memoize_ttl = memoize_ttl
+        self.deduplicate = bool(memoize_ttl) if deduplicate is None else deduplicate
+        self.queue = queue
+        self.priority = priority
+        self.rate_limit = rate_limit
+        self.soft_time_limit = soft_time_limit
+        self.time_limit = time_limit
+        self.prefetch = prefetch or 'latency'
 
         # Set externally
         self.task = None
@@ -46,6 +95,20 @@ class TaskConfig(Config):
         # Set the name of the function for the task to the task's name
         self.logic.__name__ = name
 
+    def dependencies(self) -> List[str]:
+        ''' The names of the tasks this one depends on '''
+
+        if not self.depends_on:
+            return []
+
+        return [self.depends_on] if isinstance(self.depends_on, str) else list(self.depends_on)
+
+    def options(self) -> dict:
+        ''' Options the task is sent with (queue, priority and time limits that are set) '''
+
+        options = {'queue': self.queue, 'priority': self.priority, 'soft_time_limit': self.soft_time_limit, 'time_limit': self.time_limit}
+        return {option: value for option, value in options.items() if value is not None}
+
     def set_task(self, task):
         ''' Set the actual Celery task for this class '''
 
@@ -1,3 +1,6 @@
 from .main import Database
 from .index import Indices, Index
-from .fixtures import Fixtures
\ No newline at end of file
+from .fixtures import Fixtures
+from .shapes import Query_Shapes
+from .advisor import Index_Advisor
+from .watcher import Change_Watcher
@@ -0,0 +1,198 @@
+''' Suggests MongoDB indices based on the query shapes recorded by `Query_Shapes` '''
+
+# Database
+from .main import Database
+from .index import Indices, Index
+from .shapes import Query_Shapes
+from pymongo.errors import OperationFailure
+
+# Utilities
+import argparse, json
+
+# Typing
+from typing import Dict, List, Set
+
+# Debug
+import logging
+
+
+class Index_Advisor:
+    ''' Compares recorded query shapes against the `Indices` registry and `$indexStats` to suggest
+        missing compound indices and flag unused ones
+    '''
+
+    @staticmethod
+    def suggest_keys(shape:dict) -> List[list]:
+        ''' Build the compound key for a shape following the equality -> sort -> range rule '''
+
+        filter_shape, sort = shape['filter'], shape['sort']
+        sort_fields = [field for field, _ in sort]
+
+        keys = [[field, 1] for field in sorted(filter_shape) if filter_shape[field] in ('eq', 'in') and field not in sort_fields]
+        keys += [[field, order] for field, order in sort]
+        keys += [[field, 1] for field in sorted(filter_shape) if filter_shape[field] in ('range', 'regex') and field not in sort_fields]
+
+        return keys
+
+
+    @staticmethod
+    def covers(index_keys:List[list], keys:List[list], num_equality:int) -> bool:
+        ''' Check if an existing index key can serve a suggested key. Equality fields may be in any order '''
+
+        if len(index_keys) < len(keys):
+            return False
+
+        if {field for field, _ in index_keys[:num_equality]} != {field for field, _ in keys[:num_equality]}:
+            return False
+
+        tail, index_tail = keys[num_equality:], index_keys[num_equality:len(keys)]
+        same = all(field == i_field and order == i_order for (field, order), (i_field, i_order) in zip(tail, index_tail))
+        inverted = all(field == i_field and order == -i_order for (field, order), (i_field, i_order) in zip(tail, index_tail))
+
+        return same or inverted
+
+
+    @staticmethod
+    def registered_keys(collection:str) -> List[List[list]]:
+        ''' Get the keys of all indices registered for a collection in the `Indices` registry '''
+
+        registered = []
+        indices = Indices.INDICES.get(collection, {})
+        compounds = [index.compound_with for index in indices.values() if index.compound_with]
+        for key, index in indices.items():
+            # Text and partial indices can't serve arbitrary queries with the same keys
+            if index.is_text or index.partial_filter is not None or key in compounds: continue
+            registered.append([list(entry) for entry in index.keys(indices)])
+
+        return registered
+
+
+    @staticmethod
+    def registered_names(collection:str, existing:Dict[str, list]) -> Set[str]:
+        ''' Get the names of the existing indices that are registered for a collection in the `Indices` registry '''
+
+        indices = Indices.INDICES.get(collection, {})
+        names = set()
+        for index in indices.values():
+            keys = [[field, order] for field, order in index.keys(indices)]
+            names.add(index.name or '_'.join(f'{field}_{order}' for field, order in keys))     # MongoDB's default index name
+            names.update(name for name, index_keys in existing.items() if index_keys == keys)
+
+        return names
+
+
+    @staticmethod
+    def is_protected(info:dict) -> bool:
+        ''' Check if an index does work that `$indexStats` doesn't count (enforcing uniqueness or expiring documents) '''
+
+        return bool(info.get('unique')) or 'expireAfterSeconds' in info
+
+
+    @classmethod
+    def analyze(cls, collection:str, shapes:List[dict], min_count:int=1) -> dict:
+        ''' Build the report for a single collection '''
+
+        with Database(collection=collection) as coll:
+            information = coll.index_information()
+            existing = {name: [[field, order] for field, order in info['key']] for name, info in information.items()}
+            try:
+                usage = {stat['name']: stat['accesses'] for stat in coll.aggregate([{'$indexStats': {}}])}
+            except OperationFailure as e:
+                logging.warning(f'$indexStats unavailable for collection [{collection}]: {e}'); usage = {}
+
+        registered = cls.registered_keys(collection)
+        keep = cls.registered_names(collection, existing) | {'_id_'} | {name for name, info in information.items() if cls.is_protected(info)}
+        suggestions = {}
+        for shape in shapes:
+            if shape['count'] < min_count: continue
+
+            keys = cls.suggest_keys(shape['shape'])
+            if not keys or keys == [['_id', 1]]: continue
+
+            num_equality = len([1 for field, kind in shape['shape']['filter'].items() if kind in ('eq', 'in') and field not in dict(shape['shape']['sort'])])
+            if any(cls.covers(index_keys, keys, num_equality) for index_keys in existing.values()): continue
+
+            name = '_'.join(f'{field}_{order}' for field, order in keys)
+            suggestion = suggestions.setdefault(name, {
+                'keys': keys,
+                'queries': 0,
+                'avg_ms': 0.0,
+                'docs_examined_per_returned': None,
+                'registered': any(cls.covers(index_keys, keys, num_equality) for index_keys in registered)
+            })
+            total_ms = suggestion['avg_ms'] * suggestion['queries'] + shape['total_ms']
+            suggestion['queries'] += shape['count']
+            suggestion['avg_ms'] = total_ms / suggestion['queries']
+            if shape.get('explained'):
+                suggestion['docs_examined_per_returned'] = shape['examined'] / max(shape['returned'], 1)
+
+        return {
+            'shapes': [{'shape': shape['shape'], 'count': shape['count'], 'avg_ms': shape['total_ms'] / max(shape['count'], 1), 'max_ms': shape['max_ms'],
+                        'docs_examined': shape['examined'], 'docs_returned': shape['returned'], 'collscans': shape['collscans']} for shape in shapes],
+            'suggestions': sorted(suggestions.values(), key=lambda x: x['queries'] * x['avg_ms'], reverse=True),
+            # `$indexStats` counters restart with the server, so an index is only unused since its `since` time
+            'unused': [{'name': name, 'keys': existing[name], 'since': accesses.get('since')} for name, accesses in usage.items()
+                       if accesses.get('ops') == 0 and name in existing and name not in keep]
+        }
+
+
+    @classmethod
+    def report(cls, collection:str=None, min_count:int=1, include_profile:bool=False) -> dict:
+        ''' Get index suggestions and unused indices for every collection with recorded query shapes. Unique, TTL and
+            registered indices are never reported as unused
+        '''
+
+        if include_profile:
+            Query_Shapes.load_profile()
+
+        by_collection = {}
+        for shape in Query_Shapes.get_shapes(collection):
+            by_collection.setdefault(shape['collection'], []).append(shape)
+
+        return {name: cls.analyze(name, shapes, min_count) for name, shapes in by_collection.items()}
+
+
+    @classmethod
+    def apply(cls, report:dict, drop_unused:Dict[str, List[str]]=None) -> List[str]:
+        ''' Create the suggested indices in a report. Returns the names of the created indices
+
+            Unused indices are only dropped if named in `drop_unused` (collection -> index names) and reported as unused
+        '''
+
+        drop_unused = drop_unused or {}
+        created = []
+        for collection, analysis in report.items():
+            for suggestion in analysis['suggestions']:
+                (field, order), *fields = suggestion['keys']
+                name = '_'.join(f'{key}_{key_order}' for key, key_order in suggestion['keys'])
+                index = Index(field, order, fields=fields, name=name)
+
+                Indices.add_index(collection, index, register=False)
+                created.append(Database.register_index(collection, index, Indices.INDICES[collection]))
+                logging.warning(f'Index advisor created index [{created[-1]}] for collection [{collection}]')
+
+            drop = [unused['name'] for unused in analysis['unused'] if unused['name'] in drop_unused.get(collection, [])]
+            if drop:
+                with Database(collection=collection) as coll:
+                    for name in drop:
+                        coll.drop_index(name)
+                        logging.warning(f'Index advisor dropped unused index [{name}] for collection [{collection}]')
+
+        return created
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Suggest MongoDB indices from recorded query shapes')
+    parser.add_argument('--collection', help='Only report on a single collection')
+    parser.add_argument('--min-count', type=int, default=1, help='Ignore shapes seen fewer times than this')
+    parser.add_argument('--profile', action='store_true', help='Include queries captured by the MongoDB profiler')
+    parser.add_argument('--apply', action='store_true', help='Create the suggested indices')
+    parser.add_argument('--drop-unused', action='append', default=[], metavar='INDEX', help='Drop an unused index of the collection (requires --apply and --collection, repeatable)')
+    args = parser.parse_args()
+    if args.drop_unused and not args.collection:
+        parser.error('--drop-unused requires --collection')
+
+    result = Index_Advisor.report(args.collection, args.min_count, args.profile)
+    print(json.dumps(result, indent=4, default=str))
+    if args.apply:
+        print(f'Created indices: {Index_Advisor.apply(result, {args.collection: args.drop_unused} if args.drop_unused else None)}')
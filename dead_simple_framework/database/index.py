@@ -1,8 +1,11 @@
 # Database
 from .main import Database
 
+# MongoDB
+from pymongo import TEXT, HASHED, GEOSPHERE
+
 # Typing
-from typing import Dict, Union
+from typing import Dict, List, Union
 
 # Logging
 import logging
@@ -19,7 +22,7 @@ class Indices:
 
     @staticmethod
     def _parse_indices_dict(indices:dict) -> Dict[str, Dict[str, "Index"]]:
-        ''' Convert a dictionary of indices in the config to Index objects for storage '''
+        ''' Convert a dictionary of indices in the config to Index objects for storage (keyed by `Index.key`) '''
 
         parsed_indices = {}
         for collection, fields in indices.items():
@@ -28,7 +31,7 @@ class Indices:
 
             for field in fields:
                 index = Index.from_dict(collection, field, indices[collection][field]) if not isinstance(indices[collection][field], Index) else indices[collection][field]
-                parsed_indices[collection][field] = index
+                parsed_indices[collection][index.key] = index
 
         return parsed_indices
 
@@ -43,10 +46,10 @@ class Indices:
         if isinstance(index, dict):
             field = list(index.keys())[0]; index = Index.from_dict(collection, field, index[field])
 
-        if index.field in cls.INDICES[collection]:
-            logging.warning(f"Index [{index.field}] for collection [{collection}] was overwritten")
+        if index.key in cls.INDICES[collection]:
+            logging.warning(f"Index [{index.key}] for collection [{collection}] was overwritten")
 
-        cls.INDICES[collection][index.field] = index
+        cls.INDICES[collection][index.key] = index
 
         if register:
             Database.register_indices(cls)
@@ -87,29 +90,151 @@ class Indices:
 
 
 class Index:
-    ''' Stores MongoDB index information '''
-
-    def __init__(self, field:str, order:int=None, properties:dict=None, compound_with:str=None, is_text=False):
+    ''' Stores MongoDB index information
+
+        Keys start with `field` followed by any extra `fields` for compound indices. Each entry in `fields` is a
+        `[field, order]` pair or a field name (ascending). Orders may also be an index type (`'hashed'`, `'2dsphere'`, `'text'`)
+    '''
+
+    TYPES = {'text': TEXT, 'hashed': HASHED, '2dsphere': GEOSPHERE, 'wildcard': 1}     # Supported `index_type` values and their key order
+
+    def __init__(self, field:str, order:int=None, properties:dict=None, compound_with:str=None, is_text=False, fields:list=None,
+        index_type:str=None, partial_filter:dict=None, sparse:bool=False, expire_after_seconds:int=None, name:str=None):
+        ''' Create an index definition
+
+        Args:
+            field (str): The first (or only) field in the index. Use `$**` or `index_type='wildcard'` for wildcard indices
+            order (int, optional): 1 (ascending) or -1 (descending). Not needed if `index_type` is set. An index type passed as the order is used as `index_type`
+            properties (dict, optional): Extra options passed to `create_index()` (e.g. `{'unique': True}`)
+            compound_with (str, optional): Another registered index on the same collection to compound with (two fields only, prefer `fields`)
+            is_text (bool, optional): Same as `index_type='text'`
+            fields (list, optional): Extra `[field, order]` pairs (or field names) after `field` for compound indices
+            index_type (str, optional): One of `text`, `hashed`, `2dsphere` or `wildcard`. Applies to `field`
+            partial_filter (dict, optional): Only index documents matching this filter (`partialFilterExpression`)
+            sparse (bool, optional): Only index documents that have the indexed fields
+            expire_after_seconds (int, optional): Delete documents this many seconds after the date stored in `field` (TTL index)
+            name (str, optional): Name of the index in MongoDB. Also used as the key in `Indices` so multiple indices can share a leading field
+        '''
+
+        # Older configs pass the index type as the order (e.g. `{'order': '2dsphere'}`)
+        if isinstance(order, str) and index_type is None:
+            index_type, order = order, None
 
-        if not order and not field:
-            raise TypeError(f"Index [{field}] was not passed an order and is_text is False. Please supply and order or create a text index")
-            
         self.field = field
         self.order = order
         self.properties = properties or {}
         self.compound_with = compound_with
-        self.is_text = is_text
+        self.is_text = is_text or index_type == 'text'
+        self.index_type = 'text' if is_text else index_type
+        self.fields = [[entry, 1] if isinstance(entry, str) else list(entry) for entry in fields or []]
+        self.partial_filter = partial_filter
+        self.sparse = sparse
+        self.expire_after_seconds = expire_after_seconds
+        self.name = name
+
+        self._validate()
+
+
+    @property
+    def key(self) -> str:
+        ''' The key this index is stored under in `Indices` '''
+
+        return self.name or self.field
+
+
+    def _validate(self):
+        ''' Ensure the index options are valid together before they reach MongoDB '''
+
+        if not self.field:
+            raise TypeError("Index was not passed a field")
+
+        if self.index_type is not None and self.index_type not in self.TYPES:
+            raise TypeError(f"Index [{self.field}] has an invalid index_type [{self.index_type}]. Supported types are {list(self.TYPES)}")
+
+        if self.index_type is None and self.order not in (1, -1):
+            raise TypeError(f"Index [{self.field}] was not passed a valid order and has no index_type. Please supply an order of 1 or -1 or an index_type")
+
+        if self.fields and self.compound_with:
+            raise TypeError(f"Index [{self.field}] can't use both fields and compound_with. List every field in fields instead")
+
+        for entry in self.fields:
+            if len(entry) != 2 or not isinstance(entry[0], str) or (entry[1] not in (1, -1) and entry[1] not in self.TYPES.values()):
+                raise TypeError(f"Index [{self.field}] has an invalid compound field {entry}. Must be a field name or a [field, order] pair")
+
+        orders = [self.TYPES.get(self.index_type, self.order)] + [order for _, order in self.fields]
+        if orders.count(HASHED) > 1:
+            raise TypeError(f"Index [{self.field}] can only have one hashed field")
+
+        if HASHED in orders and (self.properties.get('unique') or self.index_type == 'hashed' and self.sparse):
+            raise TypeError(f"Hashed index [{self.field}] can't be unique or sparse")
+
+        if self.index_type == 'wildcard' and (self.fields or self.compound_with or self.properties.get('unique') or self.expire_after_seconds is not None):
+            raise TypeError(f"Wildcard index [{self.field}] can't be compound, unique or a TTL index")
+
+        if self.partial_filter is not None:
+            if not isinstance(self.partial_filter, dict) or not self.partial_filter:
+                raise TypeError(f"Index [{self.field}] partial_filter must be a non-empty filter dictionary")
+            if self.sparse:
+                raise TypeError(f"Index [{self.field}] can't be both sparse and partial")
+
+        if self.expire_after_seconds is not None:
+            if not isinstance(self.expire_after_seconds, int) or self.expire_after_seconds < 0:
+                raise TypeError(f"Index [{self.field}] expire_after_seconds must be a non-negative integer")
+            if self.fields or self.compound_with or self.index_type is not None:
+                raise TypeError(f"TTL index [{self.field}] must be a single field ascending/descending index")
+
+
+    def keys(self, indices:Dict[str, "Index"]=None) -> List[tuple]:
+        ''' The key specification passed to `create_index()`. `indices` are the other indices on the collection (for `compound_with`) '''
+
+        field = self.field
+        if self.index_type == 'wildcard' and not field.endswith('$**'):
+            field = f'{field}.$**'
+
+        keys = [(field, self.TYPES.get(self.index_type, self.order))] + [tuple(entry) for entry in self.fields]
+
+        if self.compound_with:
+            if not indices or self.compound_with not in indices:
+                raise TypeError(f'Index [{self.compound_with}] to compound with index [{self.field}] not specified!')
+
+            compound = indices[self.compound_with]
+            keys.append((compound.field, compound.order))
+
+        return keys
+
+
+    def options(self, indices:Dict[str, "Index"]=None) -> dict:
+        ''' The options passed to `create_index()` '''
+
+        options = {}
+        if self.compound_with and indices and self.compound_with in indices:
+            options.update(indices[self.compound_with].properties)
+
+        options.update(self.properties)
+        if self.partial_filter is not None: options['partialFilterExpression'] = self.partial_filter
+        if self.sparse: options['sparse'] = True
+        if self.expire_after_seconds is not None: options['expireAfterSeconds'] = self.expire_after_seconds
+        if self.name: options['name'] = self.name
+
+        return options
 
 
     @classmethod
     def from_dict(cls, collection:str, field:str, index_data:dict) -> "Index":
-        ''' Parse an Index from a dictionary '''
+        ''' Parse an Index from a dictionary. The dictionary can set its own `field` (e.g. for a named index sharing
+            its leading field with another index), otherwise `field` is used
+        '''
 
+        index_data = dict(index_data)
+        field = index_data.pop('field', field)
         try:
             return cls(field, **index_data)
         except TypeError as e:
-            raise TypeError(f"Index [{field}] for collection [{collection}] was passed an invalid option: {str(e).split(' ')[-1]}")
+            if 'unexpected keyword argument' in str(e):
+                raise TypeError(f"Index [{field}] for collection [{collection}] was passed an invalid option: {str(e).split(' ')[-1]}")
+
+            raise TypeError(f"Collection [{collection}]: {e}")
 
 
     def __repr__(self) -> str:
-        return f'<order: {self.order}, props: {self.properties}, compound_with: {self.compound_with}' 
+        return f'<keys: {self.keys() if not self.compound_with else self.compound_with}, options: {self.options()}>' 
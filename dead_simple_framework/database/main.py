@@ -1,7 +1,6 @@
 # MongoDB
 from bson.objectid import ObjectId
 from pymongo.collection import Collection
-from pymongo import TEXT
 from werkzeug.local import LocalProxy
 from pymongo.errors import OperationFailure
 
@@ -64,27 +63,26 @@ class Database:
 
         curr_indices = indices.INDICES.copy()
         for collection,indices in curr_indices.items():
+            # Indices another index compounds with are created as part of that index
             compounds = [index.compound_with for index in indices.values() if index.compound_with]
-            with cls(collection=collection) as coll:
-                try:
-                    for field, index in indices.items():
-                        if index.is_text:
-                            coll.create_index([(field, TEXT)])
-                        elif field not in compounds and not index.compound_with:
-                            coll.create_index([(field, index.order)], **index.properties, background=True)
-                        elif field not in compounds:
-                            if index.compound_with not in indices:
-                                raise TypeError(f'Index [{index.compound_with}] to compound with index [{field}] not specified for collection [{collection}]!')
-
-                            compound = indices[index.compound_with]
-                            index.properties.update(compound.properties)
-                            coll.create_index([(field, index.order), (compound.field, compound.order)], **index.properties, background=True)
-
-                except OperationFailure as e:
-                    if e.code == 85:
-                        pass
-                    else:
-                        raise e
+            for key, index in indices.items():
+                if key not in compounds:
+                    cls.register_index(collection, index, indices)
+
+
+    @classmethod
+    def register_index(cls, collection:str, index, indices:dict=None) -> str:
+        ''' Create a single `Index` in MongoDB and return its name. `indices` are the other indices on the collection (for `compound_with`) '''
+
+        with cls(collection=collection) as coll:
+            try:
+                return coll.create_index(index.keys(indices), **index.options(indices), background=True)
+            except OperationFailure as e:
+                # 85 - An index with the same keys but different options already exists
+                if e.code == 85:
+                    logging.warning(f"Index [{index.key}] for collection [{collection}] already exists with different options: {e}")
+                else:
+                    raise e
 
     @classmethod
     def register_fixtures(cls, fixtures):
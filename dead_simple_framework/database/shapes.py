@@ -0,0 +1,181 @@
+# Database
+from .main import Database
+from pymongo.collection import Collection
+from pymongo import UpdateOne
+
+# MongoDB Settings
+from ..config import MongoDB_Settings
+
+# Utilities
+from contextlib import contextmanager
+import json, random, threading, time
+
+# Typing
+from typing import Dict, List, Tuple
+
+# Debug
+import logging
+
+
+class Query_Sample:
+    ''' A single (possibly unsampled) query sent to MongoDB. Filled in by the code issuing the query '''
+
+    def __init__(self, collection:Collection, mongo_filter:dict=None, sort:list=None, active:bool=False):
+        self.collection = collection
+        self.filter = mongo_filter
+        self.sort = sort
+        self.active = active
+        self.returned = None
+
+
+class Query_Shapes:
+    ''' Sampling recorder of the normalized filter/sort shapes sent to MongoDB
+
+        Values are stripped from every sampled query so that `{'name': 'x', 'age': {'$gt': 3}}` and
+        `{'name': 'y', 'age': {'$gt': 9}}` are counted as the same shape. Stats are kept in-process and
+        periodically merged into the `_query_shapes_` collection so all workers contribute to one report
+    '''
+
+    _collection = '_query_shapes_'                 # Collection shapes are aggregated in across workers
+    SHAPES:Dict[Tuple[str, str], dict] = {}        # Stats recorded by this process that haven't been flushed yet
+    _pending = 0
+    _lock = threading.Lock()
+
+    # Operator -> kind used when normalizing a filter
+    EQUALITY_OPS = {'$eq': 'eq', '$in': 'in'}
+    RANGE_OPS = {'$gt': 'range', '$gte': 'range', '$lt': 'range', '$lte': 'range', '$ne': 'range', '$nin': 'range', '$exists': 'exists', '$regex': 'regex'}
+
+
+    @classmethod
+    def normalize_filter(cls, mongo_filter:dict, shape:dict=None) -> dict:
+        ''' Reduce a MongoDB filter to a {field: kind} dictionary where kind is one of eq, in, range, exists, regex, or, other '''
+
+        shape = {} if shape is None else shape
+        for field, value in (mongo_filter or {}).items():
+            if field == '$and':
+                [cls.normalize_filter(chunk, shape) for chunk in value]
+            elif field in ('$or', '$nor'):
+                for chunk in value:
+                    for or_field in cls.normalize_filter(chunk):
+                        shape[or_field] = 'or'
+            elif field.startswith('$'):
+                continue
+            elif isinstance(value, dict) and value and all(str(op).startswith('$') for op in value):
+                kinds = [cls.EQUALITY_OPS.get(op) or cls.RANGE_OPS.get(op, 'other') for op in value]
+                shape[field] = kinds[0] if len(set(kinds)) == 1 else ('range' if 'range' in kinds else kinds[0])
+            else:
+                shape[field] = 'eq'
+
+        return shape
+
+
+    @staticmethod
+    def shape_key(shape:dict, sort:list=None) -> str:
+        ''' Stable string key for a normalized shape '''
+
+        return json.dumps({'filter': shape, 'sort': [[field, int(order)] for field, order in (sort or [])]}, sort_keys=True)
+
+
+    @classmethod
+    @contextmanager
+    def track(cls, collection:Collection, mongo_filter:dict=None, sort:list=None):
+        ''' Time the block of code that runs a query and record its shape if it was sampled. The yielded
+            `Query_Sample` can have its `filter`, `sort` and `returned` attributes set inside the block
+        '''
+
+        sample = Query_Sample(collection, mongo_filter, sort, active=random.random() < MongoDB_Settings.MONGODB_QUERY_SAMPLE_RATE)
+        start = time.perf_counter()
+        yield sample
+
+        if sample.active and sample.collection is not None and sample.filter is not None:
+            try:
+                cls.record_sample(sample, (time.perf_counter() - start) * 1000.0)
+            except Exception as e:
+                logging.warning(f'Failed to record query shape for collection [{sample.collection.name}]: {e}')
+
+
+    @classmethod
+    def record_sample(cls, sample:Query_Sample, duration_ms:float):
+        ''' Record a sampled query, explaining it first if `MONGODB_QUERY_EXPLAIN` is set '''
+
+        examined = returned = collscan = None
+        if MongoDB_Settings.MONGODB_QUERY_EXPLAIN:
+            cursor = sample.collection.find(sample.filter)
+            if sample.sort: cursor = cursor.sort(sample.sort)
+            explained = cursor.explain()
+            stats = explained.get('executionStats', {})
+            examined, returned = stats.get('totalDocsExamined'), stats.get('nReturned')
+            collscan = 'COLLSCAN' in json.dumps(explained.get('queryPlanner', {}).get('winningPlan', {}), default=str)
+
+        cls.record(sample.collection.name, sample.filter, sample.sort, duration_ms, examined, returned if returned is not None else sample.returned, collscan)
+
+
+    @classmethod
+    def record(cls, collection:str, mongo_filter:dict, sort:list=None, duration_ms:float=0, docs_examined:int=None, docs_returned:int=None, collscan:bool=None):
+        ''' Record a query shape for a collection. Can also be used to feed in profiler data '''
+
+        key = (collection, cls.shape_key(cls.normalize_filter(mongo_filter), sort))
+        with cls._lock:
+            stats = cls.SHAPES.setdefault(key, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'explained': 0, 'examined': 0, 'returned': 0, 'collscans': 0})
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            if docs_examined is not None:
+                stats['explained'] += 1
+                stats['examined'] += docs_examined
+                stats['returned'] += docs_returned or 0
+            if collscan:
+                stats['collscans'] += 1
+
+            cls._pending += 1
+            should_flush = cls._pending >= MongoDB_Settings.MONGODB_QUERY_FLUSH_SIZE
+
+        if should_flush:
+            cls.flush()
+
+
+    @classmethod
+    def flush(cls):
+        ''' Merge the stats recorded by this process into the shared `_query_shapes_` collection '''
+
+        with cls._lock:
+            shapes, cls.SHAPES, cls._pending = cls.SHAPES, {}, 0
+
+        if not shapes: return
+
+        operations = []
+        for (collection, shape), stats in shapes.items():
+            max_ms = stats.pop('max_ms')
+            operations.append(UpdateOne(
+                {'_id': f'{collection}|{shape}'},
+                {'$inc': stats, '$max': {'max_ms': max_ms}, '$setOnInsert': {'collection': collection, 'shape': shape}},
+                upsert=True
+            ))
+
+        with Database(collection=cls._collection) as db:
+            db.bulk_write(operations, ordered=False)
+
+
+    @classmethod
+    def load_profile(cls, database:str=None, limit:int=1000):
+        ''' Record the shapes of the latest queries captured by the MongoDB profiler (`db.setProfilingLevel()`) '''
+
+        with Database(database=database, collection='system.profile') as profile:
+            for entry in profile.find({'op': 'query'}).sort('ts', -1).limit(limit):
+                command = entry.get('command', {})
+                collection = entry.get('ns', '').split('.', 1)[-1]
+                sort = list(command.get('sort', {}).items())
+                cls.record(collection, command.get('filter', {}), sort, entry.get('millis', 0), entry.get('docsExamined'), entry.get('nreturned'), entry.get('planSummary') == 'COLLSCAN')
+
+
+    @classmethod
+    def get_shapes(cls, collection:str=None) -> List[dict]:
+        ''' Get all recorded shapes (optionally for a single collection) across all workers '''
+
+        cls.flush()
+        with Database(collection=cls._collection) as db:
+            shapes = list(db.find({'collection': collection} if collection else {}))
+
+        # Shapes are stored as strings as the field names in them may contain `.`
+        for shape in shapes: shape['shape'] = json.loads(shape['shape'])
+        return shapes
@@ -0,0 +1,171 @@
+# Database
+from .main import Database
+from pymongo.errors import OperationFailure, PyMongoError
+
+# Cache
+from ..cache import Cache, Document_Cache, Id_Filter
+from ..cache.versions import Collection_Versions
+
+# Settings
+from ..config import MongoDB_Settings, Redis_Settings
+
+# Redis Errors
+from redis.exceptions import RedisError
+
+# Utilities
+import os, threading, time, uuid
+
+# Typing
+from typing import List
+
+# Debug
+import logging
+
+
+class Change_Watcher:
+    ''' Background watcher that tails MongoDB change streams so caches stay correct when data is changed outside
+        the default handlers (other services, shell scripts, tasks writing with `Database`)
+
+        Every change invalidates the cached document in `Document_Cache` (in Redis and every worker) and bumps the
+        collection's version in `Collection_Versions`. Resume tokens are stored in MongoDB so no changes are missed
+        across restarts. Only one worker tails the streams at a time (via a lease in Redis). Change streams need a
+        replica set. On a standalone server the watcher logs a warning and stops
+    '''
+
+    _collection = '_change_stream_tokens_'     # Collection to persist resume tokens in
+    _lease_key = '_change_watcher_lease_'      # Cache key for the lease held by the worker tailing the streams
+    LEASE_SECONDS = 30                         # Lease length. Renewed while the watcher is tailing
+    TOKEN_BATCH = 100                          # Persist the resume token at least every `TOKEN_BATCH` changes
+
+    SUPPORTED = None                           # Set to False if the server doesn't support change streams
+    _running = False
+    _lease_id = None                           # Set per process by `_get_lease_id()`
+    _lease_pid = None
+    _pid = None
+
+
+    @classmethod
+    def start(cls, collections:List[str]=None):
+        ''' Start tailing the change streams of the passed collections (or `MONGODB_WATCH_COLLECTIONS`) in the background '''
+
+        collections = collections or MongoDB_Settings.MONGODB_WATCH_COLLECTIONS
+        if not collections or cls.SUPPORTED == False or (cls._running and cls._pid == os.getpid()):
+            return
+
+        cls._running, cls._pid = True, os.getpid()
+        for collection in collections:
+            threading.Thread(target=cls._watch, args=(collection,), name=f'change-watcher-{collection}', daemon=True).start()
+
+
+    @classmethod
+    def stop(cls):
+        ''' Stop tailing change streams '''
+
+        cls._running = False
+
+
+    @classmethod
+    def is_active(cls) -> bool:
+        ''' Check if change streams are being tailed for invalidation '''
+
+        return bool(cls._running and cls.SUPPORTED != False)
+
+
+    @classmethod
+    def _get_lease_id(cls) -> str:
+        ''' ID this process holds leases under. Generated per process so workers forked after import don't share one '''
+
+        if cls._lease_pid != os.getpid():
+            cls._lease_id, cls._lease_pid = uuid.uuid4().hex, os.getpid()
+
+        return cls._lease_id
+
+
+    @classmethod
+    def _acquire_lease(cls, collection:str) -> bool:
+        ''' Hold the lease to tail a collection's change stream. Always succeeds if Redis isn't used (single worker) '''
+
+        if not Redis_Settings.USE_REDIS:
+            return True
+
+        key = f'{cls._lease_key}:{collection}'
+        cache, lease_id = Cache(), cls._get_lease_id()
+        try:
+            return cache.expire_if_equal(key, lease_id, cls.LEASE_SECONDS) or cache.add(key, lease_id, cls.LEASE_SECONDS)
+        except RedisError as e:
+            logging.warning(f'Change watcher could not reach Redis for lease [{key}]: {e}')
+            return False
+
+
+    @classmethod
+    def _watch(cls, collection:str):
+        ''' Tail a single collection's change stream, resuming from the last stored token '''
+
+        while cls._running:
+            if not cls._acquire_lease(collection):
+                time.sleep(cls.LEASE_SECONDS / 2); continue
+
+            try:
+                with Database(collection=cls._collection) as tokens:
+                    stored = tokens.find_one({'_id': collection})
+
+                with Database(collection=collection) as coll:
+                    with coll.watch(resume_after=stored['token'] if stored else None, max_await_time_ms=1000) as stream:
+                        cls.SUPPORTED = True
+                        cls._tail(collection, coll.database.name, stream)
+
+            except OperationFailure as e:
+                # 40573 - Change streams are only supported on replica sets
+                if e.code in (40573, 40324) or 'replica set' in str(e):
+                    cls.SUPPORTED = False
+                    logging.warning(f'Change streams are not supported by this MongoDB server. Cached data for [{collection}] will only be invalidated by writes through the framework')
+                    return
+
+                # 286 - The resume token is too old, start from now
+                if e.code == 286:
+                    with Database(collection=cls._collection) as tokens: tokens.delete_one({'_id': collection})
+
+                logging.warning(f'Change stream for [{collection}] failed, resuming: {e}')
+                time.sleep(1)
+
+            except PyMongoError as e:
+                logging.warning(f'Change stream for [{collection}] disconnected, resuming: {e}')
+                time.sleep(1)
+
+            except RedisError as e:
+                logging.warning(f'Change watcher could not invalidate caches for [{collection}], resuming: {e}')
+                time.sleep(1)
+
+
+    @classmethod
+    def _tail(cls, collection:str, database:str, stream):
+        ''' Handle changes from an open stream until stopped or the lease is lost '''
+
+        pending, lease_renewed = 0, time.monotonic()
+        while cls._running and stream.alive:
+            change = stream.try_next()
+            if change:
+                cls.handle_change(database, collection, change); pending += 1
+
+            if pending and (pending >= cls.TOKEN_BATCH or not change):
+                with Database(collection=cls._collection) as tokens:
+                    tokens.replace_one({'_id': collection}, {'_id': collection, 'token': stream.resume_token}, upsert=True)
+                pending = 0
+
+            if time.monotonic() - lease_renewed > cls.LEASE_SECONDS / 3:
+                if not cls._acquire_lease(collection): return
+                lease_renewed = time.monotonic()
+
+
+    @staticmethod
+    def handle_change(database:str, collection:str, change:dict):
+        ''' Invalidate caches for a single change event '''
+
+        operation = change.get('operationType')
+        if operation in ('insert', 'update', 'replace', 'delete'):
+            Document_Cache.invalidate_key(Document_Cache.key_for(database, collection, change['documentKey']['_id']))
+            if operation in ('insert', 'replace'): Id_Filter.add_for(database, collection, change['documentKey']['_id'])
+        elif operation in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+            Document_Cache.invalidate_collection(database, collection)
+
+        Collection_Versions.bump(database, collection)
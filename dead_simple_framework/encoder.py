@@ -1,6 +1,7 @@
 # Utilities
 from datetime import datetime
 from json import JSONEncoder
+from bson import ObjectId
 
 class JSON_Encoder(JSONEncoder):
     ''' Custom JSON serializer '''
@@ -15,4 +16,22 @@ class JSON_Encoder(JSONEncoder):
             # TODO - [Logging] | Throw a warning when this occurs
             obj = str(obj)
             
-            return obj
\ No newline at end of file
+            return obj
+
+
+class BSON_JSON_Encoder(JSON_Encoder):
+    ''' Serializer for documents read from MongoDB (used for API responses). Output matches `JSON_Encoder`, but
+        ObjectIds/datetimes are looked up by type instead of by raising and catching a `TypeError` for every value
+    '''
+
+    TYPES = {
+        ObjectId: str,
+        datetime: lambda obj: int(obj.timestamp() * 1000.0)
+    }
+
+    def default(self, obj):
+        serializer = self.TYPES.get(type(obj))
+        if serializer:
+            return serializer(obj)
+
+        return JSON_Encoder.default(self, obj)
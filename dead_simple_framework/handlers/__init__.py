@@ -5,3 +5,5 @@ from .permissions import PermissionsRouteHandler, DefaultPermissionsRouteHandler
 from ..api.main import RouteHandler
 from .login import LoginRouteHandler
 from .users import UserRouteHandler
+from .advisor import IndexAdvisorRouteHandler
+from .metrics import CacheMetricsRouteHandler
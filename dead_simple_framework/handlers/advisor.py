@@ -0,0 +1,52 @@
+''' Builtin handler that reports on query shapes and suggests MongoDB indices '''
+
+# Base class
+from .permissions import Permissions, PermissionsRouteHandler
+
+# Database
+from ..database import Index_Advisor
+
+# Utils
+from ..api.utils import JsonResponse
+
+# Flask HTTP
+from flask import Request, Response
+
+# Typing
+from typing import Callable
+
+
+class IndexAdvisorRouteHandler(PermissionsRouteHandler):
+    ''' Serves the `Index_Advisor` report. GET returns the report, POST creates the suggested indices
+
+        Accepts `collection`, `min_count`, `profile` and (POST only) `drop_unused` parameters. `drop_unused` maps collections
+        to the names of the unused indices to drop
+    '''
+
+    def __init__(self, GET:Callable=None, POST:Callable=None, permissions:Permissions=None):
+        super().__init__(GET=GET or self.GET, POST=POST or self.POST, permissions=permissions or Permissions(GET=['ADMIN'], POST=['ADMIN']))
+
+
+    @staticmethod
+    def _get_report(payload:dict) -> dict:
+        ''' Build a report from the request parameters '''
+
+        return Index_Advisor.report(payload.get('collection'), int(payload.get('min_count', 1)), str(payload.get('profile', False)).capitalize() == 'True')
+
+
+    @classmethod
+    def GET(cls, request:Request, payload:dict) -> Response:
+        ''' Get the index report '''
+
+        return JsonResponse({'data': cls._get_report(payload)})
+
+
+    @classmethod
+    def POST(cls, request:Request, payload:dict) -> Response:
+        ''' Apply the suggestions in the index report '''
+
+        report = cls._get_report(payload)
+        drop_unused = payload.get('drop_unused')
+        created = Index_Advisor.apply(report, drop_unused if isinstance(drop_unused, dict) else None)
+
+        return JsonResponse({'data': report, 'created': created})
@@ -0,0 +1,38 @@
+''' Builtin handler that reports cache instrumentation '''
+
+# Base class
+from .permissions import Permissions, PermissionsRouteHandler
+
+# Cache
+from ..cache import Cache
+
+# Utils
+from ..api.utils import JsonResponse
+
+# Flask HTTP
+from flask import Request, Response
+
+# Typing
+from typing import Callable
+
+
+class CacheMetricsRouteHandler(PermissionsRouteHandler):
+    ''' Serves the `Cache` stats of the worker handling the request. GET returns the stats, DELETE resets them '''
+
+    def __init__(self, GET:Callable=None, DELETE:Callable=None, permissions:Permissions=None):
+        super().__init__(GET=GET or self.GET, DELETE=DELETE or self.DELETE, permissions=permissions or Permissions(GET=['ADMIN'], DELETE=['ADMIN']))
+
+
+    @staticmethod
+    def GET(request:Request, payload:dict) -> Response:
+        ''' Get the cache stats '''
+
+        return JsonResponse({'data': Cache.stats()})
+
+
+    @staticmethod
+    def DELETE(request:Request, payload:dict) -> Response:
+        ''' Reset the cache stats '''
+
+        Cache.reset_stats()
+        return JsonResponse({'data': Cache.stats()})
@@ -12,7 +12,7 @@ from .encoder import JSON_Encoder
 from .tasks import Task_Manager
 
 # Database
-from .database import Indices, Index, Database, Fixtures
+from .database import Indices, Index, Database, Fixtures, Change_Watcher
 
 # App-wide settings
 from .config.settings.main import Settings
@@ -87,6 +87,9 @@ class Application(Task_Manager):
         self.app.before_first_request(lambda: Database.register_indices(self.indices))
         self.app.before_first_request(lambda: Database.register_fixtures(Fixtures(config.get('fixtures'))))
 
+        # Tail change streams to invalidate caches when data changes outside the framework
+        self.app.before_first_request(lambda: Change_Watcher.start())
+
 
     def _setup_jwt(self):
         ''' Adds JWT config options '''
@@ -7,6 +7,9 @@ from .handlers import RouteHandler, DefaultRouteHandler
 # Route config class
 from .config import Route
 
+# Cache
+from .cache import Document_Cache, Id_Filter
+
 # Encoding
 import json
 
@@ -53,6 +56,12 @@ class Router:
             app.register_blueprint(blueprint)
             # Add the Route object to the internal registry
             route_objs[route.url] = route
+            # Serve lookups by `_id` from the cache if specified
+            if route.cache_documents and route.collection:
+                Document_Cache.enable(route.database, route.collection)
+            # Answer lookups for `_id`s that don't exist from a Bloom filter if specified
+            if route.bloom_filter and route.collection:
+                Id_Filter.enable(route.database, route.collection)
 
         RouteHandler.ROUTES = route_objs # Copy routes to RouteHandler instances
 
@@ -1 +1,5 @@
-from .main import Task_Manager
\ No newline at end of file
+from .main import Task_Manager
+from .errors import Task_Error, Parallel_Error
+from .store import Result_Store, Result_Reference
+from .engine import Local_Engine, Local_Result
+from .parallel import Parallel_Results
\ No newline at end of file
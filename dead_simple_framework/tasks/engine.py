@@ -0,0 +1,223 @@
+''' In-process task engine used when RabbitMQ isn't available '''
+
+# Celery
+from celery import Task
+from celery.schedules import crontab
+
+# Cache
+from ..cache import Cache
+
+# Task Settings
+from ..config import RabbitMQ_Settings
+
+# Errors
+from .errors import Task_Error
+
+# Utilities
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import queue, threading, time, uuid
+
+# Typing
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Debug
+import logging
+
+
+class Local_Result:
+    ''' Handle to a task run by the `Local_Engine` (stands in for Celery's `AsyncResult`) '''
+
+    def __init__(self, task_id:str, future:Future):
+        self.id = task_id
+        self._future = future
+
+
+    @classmethod
+    def done(cls, task_id:str, value:Any) -> 'Local_Result':
+        ''' A handle to a task that already finished with `value` '''
+
+        future = Future()
+        future.set_result(value)
+        return cls(task_id, future)
+
+
+    def ready(self) -> bool:
+        ''' Check if the task finished '''
+
+        return self._future.done()
+
+
+    def get(self, timeout:float=None) -> Any:
+        ''' Wait up to `timeout` seconds for the task and return what it returned. Raises a `Task_Error` if it failed '''
+
+        try:
+            return self._future.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f'Task ({self.id}) did not finish within [{timeout}] seconds')
+
+
+class Local_Engine:
+    ''' Runs tasks on a pool of `TASK_LOCAL_WORKERS` threads in this process instead of sending them to Celery workers
+
+        Tasks are run with Celery's `apply()`, so results are stored by the same task classes as on a worker. At most
+        `TASK_LOCAL_QUEUE_SIZE` tasks wait for a thread; scheduling more blocks for up to `TASK_RESULT_TIMEOUT` seconds and
+        then raises a `queue.Full`. Tasks scheduled from inside a task run in the calling thread so tasks waiting on other
+        tasks can't use up the pool. Periodic tasks are run by a scheduler thread (see `schedule()`)
+    '''
+
+    _schedule_prefix = '_task_scheduled_'   # Prefix for the keys that stop several processes running the same periodic task
+
+    def __init__(self, workers:int=None, queue_size:int=None):
+        self.workers = workers or RabbitMQ_Settings.TASK_LOCAL_WORKERS
+        self.queue_size = RabbitMQ_Settings.TASK_LOCAL_QUEUE_SIZE if queue_size is None else queue_size
+
+        self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='local-task')
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._worker = threading.local()
+        self._running:Dict[str, Future] = {}            # Task ID -> future of every task not finished yet
+
+        self._schedules:Dict[str, Tuple[crontab, Callable[[], Any]]] = {}
+        self._scheduler:threading.Thread = None
+        self._stopped = threading.Event()
+
+
+    def in_worker(self) -> bool:
+        ''' Check if the current thread is running a task '''
+
+        return getattr(self._worker, 'active', False)
+
+
+    def submit(self, task:Task, args:tuple=(), kwargs:dict=None, task_id:str=None) -> Local_Result:
+        ''' Run a task on the pool (with `task_id` as its ID if passed) '''
+
+        return self._submit(lambda task_id: self._apply(task, task_id, args, kwargs or {}), task_id)
+
+
+    def attach(self, task_id:str) -> Optional[Local_Result]:
+        ''' A handle to a task submitted to this engine that hasn't finished or None if there isn't one '''
+
+        future = self._running.get(task_id)
+        return Local_Result(task_id, future) if future else None
+
+
+    def submit_chain(self, steps:List[Tuple[Task, tuple, dict]]) -> Local_Result:
+        ''' Run tasks one after another on the pool, passing each result to the next task as its first argument (like a Celery chain) '''
+
+        def run_chain(task_id:str) -> Any:
+            result = None
+            for num, (task, args, kwargs) in enumerate(steps):
+                result = self._apply(task, task_id if num == len(steps) - 1 else str(uuid.uuid4()), ((result,) if num else ()) + tuple(args), kwargs)
+            return result
+
+        return self._submit(run_chain)
+
+
+    def submit_graph(self, levels:List[List[str]], run:Callable[[str, dict], Any]) -> Local_Result:
+        ''' Run the steps of a task graph level by level, calling `run(name, outputs)` with the outputs of the steps run
+            before by name. Steps in the same level run in parallel on the pool. The handle returns the output of the last step
+        '''
+
+        task_id, future = str(uuid.uuid4()), Future()
+
+        def run_graph():
+            outputs = {}
+            try:
+                for level in levels:
+                    running = [(name, self._submit(lambda _, name=name: run(name, outputs))) for name in level]
+                    for name, handle in running:
+                        outputs[name] = handle.get()
+                future.set_result(outputs[levels[-1][-1]])
+            except Exception as e:
+                future.set_exception(e)
+
+        # Steps are waited on from outside the pool so a graph never holds a thread its own steps need
+        if self.in_worker():
+            run_graph()
+        else:
+            threading.Thread(target=run_graph, name='local-task-graph', daemon=True).start()
+
+        return Local_Result(task_id, future)
+
+
+    def _submit(self, run:Callable[[str], Any], task_id:str=None) -> Local_Result:
+        task_id = task_id or str(uuid.uuid4())
+
+        # Run nested tasks right away rather than waiting for a thread that may be held by the task waiting on them
+        if self.in_worker():
+            future = Future()
+            try:
+                future.set_result(run(task_id))
+            except Exception as e:
+                future.set_exception(e)
+            return Local_Result(task_id, future)
+
+        if not self._slots.acquire(timeout=RabbitMQ_Settings.TASK_RESULT_TIMEOUT):
+            raise queue.Full(f'[{self.workers + self.queue_size}] local tasks are already running or waiting')
+
+        def run_in_worker() -> Any:
+            self._worker.active = True
+            try:
+                return run(task_id)
+            finally:
+                self._worker.active = False
+
+        try:
+            future = self._pool.submit(run_in_worker)
+        except Exception:
+            self._slots.release(); raise
+
+        self._running[task_id] = future
+
+        def finished(_):
+            self._slots.release()
+            self._running.pop(task_id, None)
+
+        future.add_done_callback(finished)
+        return Local_Result(task_id, future)
+
+
+    @staticmethod
+    def _apply(task:Task, task_id:str, args:tuple, kwargs:dict) -> Any:
+        ''' Run a task in the current thread and return what it returned. Raises a `Task_Error` if it failed '''
+
+        result = task.apply(args, kwargs, task_id=task_id)
+        if result.failed():
+            raise Task_Error(task.name, task_id, f'{type(result.result).__name__}: {result.result}')
+
+        return result.result
+
+
+    def schedule(self, name:str, schedule:crontab, run:Callable[[], Any]):
+        ''' Call `run` whenever a crontab schedule is due. Only one process calls it per minute if the cache is shared '''
+
+        self._schedules[name] = (schedule, run)
+        if self._scheduler is None:
+            self._scheduler = threading.Thread(target=self._run_schedules, name='local-task-scheduler', daemon=True)
+            self._scheduler.start()
+
+
+    def _run_schedules(self):
+        last_run = {}
+        delay = 0
+        while not self._stopped.wait(delay):
+            delay = 60
+            for name, (schedule, run) in list(self._schedules.items()):
+                last_run.setdefault(name, schedule.now())
+                is_due, next_seconds = schedule.is_due(last_run[name])
+                delay = min(delay, max(next_seconds, 1))
+                if not is_due:
+                    continue
+
+                last_run[name] = schedule.now()
+                try:
+                    if Cache(shared=True).add(f'{self._schedule_prefix}:{name}:{int(time.time() // 60)}', '1', 120):
+                        run()
+                except Exception as e:
+                    logging.warning(f'Failed to run scheduled task [{name}]: {e}')
+
+
+    def shutdown(self, wait:bool=True):
+        ''' Stop the scheduler and (optionally) wait for running tasks to finish '''
+
+        self._stopped.set()
+        self._pool.shutdown(wait)
@@ -0,0 +1,23 @@
+class Task_Error(Exception):
+    ''' Error thrown when a task being waited on fails '''
+
+    def __init__(self, task_name:str, task_id:str, error:str):
+        super(Exception, self).__init__(f'Task [{task_name}] ({task_id}) failed | {error}')
+        self.task_name = task_name
+        self.task_id = task_id
+        self.error = error
+
+
+class Parallel_Error(Task_Error):
+    ''' Error thrown by `Task_Manager.parallelize()` once every task finished if some of them failed. `errors` holds the
+        `Task_Error` of each failed task by position and `partial` what the others returned (or the reduced value)
+    '''
+
+    def __init__(self, errors:dict, partial):
+        position, first = min(errors.items(), key=lambda error: error[0])
+        super(Exception, self).__init__(f'[{len(errors)}] parallel tasks failed | First failure (task {position}): {first}')
+        self.task_name = first.task_name
+        self.task_id = first.task_id
+        self.error = first.error
+        self.errors = errors
+        self.partial = partial
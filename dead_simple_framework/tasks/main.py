@@ -5,6 +5,7 @@ from celery.result import AsyncResult
 # Celery Configuration
 from celery.schedules import crontab
 from kombu.serialization import register
+from kombu import Queue
 
 # Task config class
 from ..config import TaskConfig
@@ -13,27 +14,30 @@ from ..config import TaskConfig
 from ..config import Redis_Settings, RabbitMQ_Settings
 
 # Custom Tasks
-from .task import Database_Task, Store_Task, Store_Latest_Task
+from .task import Tracked_Task, Cache_Task, Database_Task, Store_Task, Store_Latest_Task
+from .errors import Task_Error, Parallel_Error
+from .parallel import Parallel_Results
+from .store import Result_Store, Result_Reference
+from .engine import Local_Engine, Local_Result
 
 # Database
 from ..database import Database
 from bson import ObjectId
 
 # Cache
-from ..cache import Cache
+from ..cache import Cache, Document_Cache
 
 # Utilities
-from .utils import upsert_persistently_and_cache
+from .utils import upsert_persistently_and_cache, latest_id, migrate_to_latest_id, result_key, get_cached_result, args_key, get_memoized_result, running_key
 from celery import chain, group
-import os, json
+import os, json, time, uuid
 
 # Typing
-from typing import Union, Dict
+from typing import Any, Callable, Iterable, Iterator, Optional, Union, Dict, List, Tuple
 
 # Debug
 import logging
 
-# TODO - [Stability]     | Warnings + (Dummy `Task_Manager` if RabbitMQ isn't running [use multiprocess])?
 # TODO - [Stability]     | RPC backend if Redis isn't running
 # TODO - [Stability]     | Timeouts for all tasks (especially sync tasks)
 # TODO - [Useability]    | Retreival method for failed tasks
@@ -46,10 +50,18 @@ class Task_Manager(Celery):
         Allows any tasks specified in the application configuration dictionary's
         `tasks` section to be run or scheduled. Also allows retreival of the most
         recent result of a task. Handles periodic tasks too
+
+        Tasks run on the in-process `Local_Engine` instead of Celery workers if RabbitMQ is disabled or offline
+        (or `TASK_ENGINE` is set to `local`), behind the same methods
     '''
 
     _app = None                                    # Internal application reference
     _internal_tasks:Dict[str, TaskConfig] = {}     # Internal reference to all dynamically registered tasks
+    _engine:Local_Engine = None                    # In-process engine tasks run on when Celery isn't used
+    _graph_step:Task = None                        # Celery task running a task of a graph of dependant tasks
+    _graph_merge:Task = None                       # Celery task merging the outputs of a level of a graph
+    _parallel_chunk:Task = None                    # Celery task running a chunk of the tasks passed to `parallelize()`
+    _poll_seconds = (0.01, 0.5)                    # Shortest and longest wait between checks for finished chunks
    
     _results_collection = Database_Task._collection     # Collection for task results
     _results_cache_key  = Database_Task._cache_key      # Cache key for latest task result ID storage
@@ -64,10 +76,24 @@ class Task_Manager(Celery):
         # Set Pickle as the task result serializer
         self.configure()
 
+        # Run tasks in this process if there's no broker to send them to
+        if RabbitMQ_Settings.use_local_engine():
+            if Task_Manager._engine: Task_Manager._engine.shutdown(wait=False)
+            Task_Manager._engine = Local_Engine()
+
+        # Tasks running the steps of task graphs on the workers (see `chain()`)
+        Task_Manager._graph_step = self.task(Task_Manager._run_graph_step, name='_graph_step_', result_serializer='pickle')
+        Task_Manager._graph_merge = self.task(Task_Manager._merge_graph_outputs, name='_graph_merge_', result_serializer='pickle')
+        Task_Manager._parallel_chunk = self.task(Task_Manager._run_parallel_chunk, name='_parallel_chunk_', result_serializer='pickle')
+
         # Register all tasks specified in the `tasks` section of the application config
         if dynamic_tasks:
             self.register_tasks(dynamic_tasks)
 
+        # Serve the IDs of the latest task results and small results from memory (workers storing new results evict them everywhere)
+        Cache.enable_local(self._results_cache_key)
+        Cache.enable_local(Cache.namespace(result_key('')))
+
         Task_Manager._app = self
 
     def configure(self):
@@ -78,7 +104,7 @@ class Task_Manager(Celery):
             task_create_missing_queues = True,
             task_acks_late = True,
             worker_prefetch_multiplier = 1,
-            result_expires = 1,
+            result_expires = int(RabbitMQ_Settings.TASK_RESULT_TIMEOUT) + 1,    # Graph chords need their parts' results until the slowest finished
             task_serializer='pickle',
             result_serializer='pickle',
             accept_content=['pickle']
@@ -93,22 +119,109 @@ class Task_Manager(Celery):
             task = self._cast_task(task_name, task_config)
 
             # Create and register a new Celery task with auto-caching results unless explicitely specified otherwise
-            task.set_task(self.task(task.logic, name=task_name, result_serializer='pickle', base=self.get_task_type(task.depends_on), ignore_result=True if task.schedule else False))
+            task.set_task(self.task(task.logic, name=task_name, result_serializer='pickle', base=self.get_task_type(task.store_results), ignore_result=True if task.schedule else False,
+                result_ttl=task.result_ttl, resolve_references=task.resolve_references, memoize_ttl=task.memoize_ttl, deduplicate=task.deduplicate,
+                priority=task.priority, rate_limit=task.rate_limit, soft_time_limit=task.soft_time_limit, time_limit=task.time_limit))
             
             # Store a reference in the Task_Manager
             self._internal_tasks[task_name] = task
 
+            # Send the task to its own queue if it has one
+            if task.queue:
+                self.route_task(task_name, task.queue)
+
             # If the task should run on a schedule, set that up
             if task.schedule != None:
                 self.register_periodic_task(task)
-                
+
+        # Tasks may depend on tasks registered after them, so the graph is checked once all of them are
+        self.check_dependencies()
+
+
+    def route_task(self, task_name:str, queue:str):
+        ''' Send a task to a queue. Queues are declared with priorities up to `TASK_MAX_PRIORITY` '''
+
+        self.conf.task_routes = {**(self.conf.task_routes or {}), task_name: {'queue': queue}}
+
+        # Celery only declares the default queue once any are listed
+        queues = list(self.conf.task_queues or [Queue(self.conf.task_default_queue)])
+        if queue not in [declared.name for declared in queues]:
+            queues.append(Queue(queue, routing_key=queue, queue_arguments={'x-max-priority': RabbitMQ_Settings.TASK_MAX_PRIORITY}))
+        self.conf.task_queues = queues
+
+
+    def get_queues(self) -> List[str]:
+        ''' The names of every queue tasks are sent to (the default queue first) '''
+
+        return [self.conf.task_default_queue] + sorted({task.queue for task in self._internal_tasks.values() if task.queue} - {self.conf.task_default_queue})
+
+
+    def get_prefetch_multiplier(self, queues:List[str]) -> int:
+        ''' Messages each worker process takes at a time when consuming from `queues`. 1 unless every task sent to
+            them has the 'throughput' prefetch profile (`TASK_THROUGHPUT_PREFETCH` then)
+        '''
+
+        profiles = {task.prefetch for task in self._internal_tasks.values() if (task.queue or self.conf.task_default_queue) in queues}
+        return RabbitMQ_Settings.TASK_THROUGHPUT_PREFETCH if profiles == {'throughput'} else 1
+
+
+    def start_worker(self, queues:List[str]=None, concurrency:int=None, beat:bool=False, loglevel:str='INFO'):
+        ''' Run a Celery worker in this process (blocks until it's stopped)
+
+        Args:
+
+            queues (List[str], optional): The queues to consume from (every queue by default, see `get_queues()`). Start separate
+                workers for queues of quick tasks and of slow batch tasks to keep them from holding each other up
+
+            concurrency (int, optional): Worker processes (one per CPU by default)
+
+            beat (bool, optional): Also run the scheduler for periodic tasks. Only one worker should
+
+            loglevel (str, optional): Worker log level
+        '''
+
+        queues = queues or self.get_queues()
+        argv = ['worker', f'--queues={",".join(queues)}', f'--prefetch-multiplier={self.get_prefetch_multiplier(queues)}', f'--loglevel={loglevel}']
+        if concurrency: argv.append(f'--concurrency={concurrency}')
+        if beat: argv.append('--beat')
+
+        self.worker_main(argv)
+
+
+    @classmethod
+    def check_dependencies(cls):
+        ''' Check that every task depended on is registered and that no task depends on itself (directly or through
+            other tasks). Raises a `ValueError` describing the first problem found
+        '''
+
+        checked, path = set(), []
+
+        def visit(name:str):
+            if name in path:
+                cycle = path[path.index(name):] + [name]
+                raise ValueError(f"Task [{name}] depends on itself through {' -> '.join(cycle)}")
+            if name in checked:
+                return
+
+            path.append(name)
+            for parent in cls._internal_tasks[name].dependencies():
+                if parent not in cls._internal_tasks:
+                    raise ValueError(f'Task [{name}] depends on [{parent}] which is not a registered task')
+                visit(parent)
+            path.pop()
+            checked.add(name)
+
+        for name in list(cls._internal_tasks):
+            visit(name)
 
     def register_task_chain(self, task:TaskConfig):
-        ''' Register a chain of tasks as a single task. Allows top-level tasks to be called that depend on the results of sub-tasks '''
+        ''' Register a chain (or graph) of tasks as a single task. Allows top-level tasks to be called that depend on the results of sub-tasks '''
 
         # Create a new task that invokes the chain of tasks when executed
-        chain_as_task = TaskConfig(name=task.name + '_chain', logic=lambda x=None: self.chain(task.name, task.default_args or [], task.default_kwargs or {}))
-        chain_as_task.set_task(self.task(chain_as_task.logic, name=chain_as_task.name, result_serializer='pickle', base=self.get_task_type(task.depends_on), ignore_result=False))
+        chain_as_task = TaskConfig(name=task.name + '_chain', logic=lambda x=None: self.chain(task.name, task.default_args or [], task.default_kwargs or {}), store_results=task.store_results,
+            result_ttl=task.result_ttl)
+        chain_as_task.set_task(self.task(chain_as_task.logic, name=chain_as_task.name, result_serializer='pickle', base=self.get_task_type(task.store_results), ignore_result=False,
+            result_ttl=task.result_ttl, resolve_references=task.resolve_references))
         
         # Store an internal reference to the task chain's top-level task
         self._internal_tasks[chain_as_task.name] = chain_as_task
@@ -129,114 +242,482 @@ class Task_Manager(Celery):
         self.conf.beat_schedule[task.name] = {
             'task': task_name,
             'schedule': crontab(**task.schedule),
-            'args': task.default_args
+            'args': task.default_args,
+            'options': task.options()
         }
 
+        if self._engine:
+            self._engine.schedule(task.name, crontab(**task.schedule), lambda: Task_Manager.schedule_task(task.name))
+
+
+    @staticmethod
+    def _task_arguments(args:tuple, kwargs:dict) -> Tuple[list, dict, dict]:
+        ''' Split the arguments of `schedule_task()` (passed the way `send_task()` takes them: a list of positional arguments
+            and a dictionary of keyword arguments for the task, then options) into the task's arguments and the options
+        '''
+
+        options = dict(kwargs)
+        task_args = list(options.pop('args', args[0] if args else None) or [])
+        task_kwargs = dict(options.pop('kwargs', args[1] if len(args) > 1 else None) or {})
+        return task_args, task_kwargs, options
+
 
     @classmethod
     def schedule_task(cls, task_name:str, *args, **kwargs):
         ''' Schedule an asynchronous task to be run by the next available worker.
-            The latest result for a task can be retrieved with `get_result()` '''
+            The latest result for a task can be retrieved with `get_result()`
+
+            Memoized tasks (`TaskConfig.memoize_ttl`) with a result for the arguments aren't run again. Scheduling a
+            deduplicated task (`TaskConfig.deduplicate`) while it's running with the same arguments returns the running one
+        '''
         
         # Check to see if the relies on sub-tasks and must be chained 
         if cls._internal_tasks[task_name].depends_on:
             return cls._app.chain(task_name, args, kwargs)
         
         # Apply default arguments if none provided
-        default_args = cls._internal_tasks[task_name].default_args
-        if not args and default_args:
-            args = (default_args,)
+        task = cls._internal_tasks[task_name]
+        if not args and task.default_args:
+            args = (task.default_args,)
+
+        task_args, task_kwargs, options = cls._task_arguments(args, kwargs)
+        task_id = options.pop('task_id', None) or str(uuid.uuid4())
+        key = args_key(task_args, task_kwargs) if task.memoize_ttl or task.deduplicate else None
+
+        if task.memoize_ttl:
+            memoized = get_memoized_result(task_name, key)
+            if memoized:
+                return Local_Result.done(memoized['task_id'], Result_Store.resolve(memoized['task_result'])) if cls._engine else cls._app.AsyncResult(memoized['task_id'])
 
-        # Drop the result in Celery/Redis as we're relying on the framework to cache them
-        return cls._app.send_task(task_name, *args, **kwargs, ignore_result=True)
+        if task.deduplicate:
+            cache = Cache(shared=True)
+            if not cache.add(running_key(task_name, key), task_id, int(RabbitMQ_Settings.TASK_RESULT_TIMEOUT)):
+                running = cache.get_raw(running_key(task_name, key))
+                attached = (cls._engine.attach(running.decode()) if cls._engine else cls._app.AsyncResult(running.decode())) if running else None
+                if attached:
+                    return attached
+
+        try:
+            if cls._engine:
+                return cls._engine.submit(task.task, task_args, task_kwargs, task_id)
+
+            # Drop the result in Celery/Redis as we're relying on the framework to cache them
+            return cls._app.send_task(task_name, task_args, task_kwargs, task_id=task_id, ignore_result=True, **{**task.options(), **options})
+        except Exception:
+            if task.deduplicate: Cache(shared=True).remove(running_key(task_name, key))
+            raise
 
 
     @classmethod
-    def run_task(cls, task_name:str, sync=True, *args, **kwargs):
-        ''' Run an asynchronous task. Gets the result immediately if sync=True (force synchronous)'''
+    def run_task(cls, task_name:str, sync=True, *args, timeout:float=None, **kwargs):
+        ''' Run an asynchronous task. If sync=True (force synchronous) waits for this run of the task to finish and returns its result
+
+            Waits up to `timeout` seconds (`TASK_RESULT_TIMEOUT` by default) and raises a `TimeoutError` after that.
+            Raises a `Task_Error` if the task fails
+        '''
 
         if not sync: return cls.schedule_task(task_name, *args, **kwargs)
 
-        cache = Cache()
+        # Memoized results for the arguments are returned without running the task
+        task = cls._internal_tasks[task_name]
+        if task.memoize_ttl:
+            memoized = cls._get_memoized(task_name, *cls._task_arguments(args, kwargs)[:2])
+            if memoized:
+                return Result_Store.resolve(memoized['task_result'])
+
+        # Tasks run in this process return their result directly (it's stored like any other result). Memoized results
+        # are returned even if they aren't stored so later runs returning the memoized result return the same thing
+        if cls._engine:
+            result = cls.schedule_task(task_name, *args, **kwargs).get(timeout or RabbitMQ_Settings.TASK_RESULT_TIMEOUT)
+            return Result_Store.resolve(result) if task.store_results != False or task.memoize_ttl else None
+
+        # Send the task to the next available worker and block until it announces it finished
+        task_id = cls.schedule_task(task_name, *args, **kwargs).id
+        done = Tracked_Task.wait(task_id, timeout)
+        if done['error']:
+            raise Task_Error(task_name, task_id, done['error'])
+
+        # The result of memoized tasks is cached for their arguments
+        if task.memoize_ttl:
+            memoized = cls._get_memoized(task_name, *cls._task_arguments(args, kwargs)[:2])
+            if memoized and memoized['task_id'] == task_id:
+                return Result_Store.resolve(memoized['task_result'])
+
+        result_id = done['result_id']
+        if not result_id:   # Results aren't stored in the database for the task
+            return cls.get_result(task_name)
+
+        # Small results are cached. Use the cached copy if it's from this run
+        cached = get_cached_result(task_name)
+        if cached and cached['task_id'] == task_id:
+            return Result_Store.resolve(cached['task_result'])
+
+        result_id = ObjectId(result_id) if ObjectId.is_valid(result_id) else result_id
+        with Database(collection=cls._results_collection) as db:
+            res = Document_Cache.get(db, result_id)
 
-        is_started = False
-        last_id = cache.get_dynamic_dict_value(cls._results_cache_key, task_name)
-        # Wait for ID of cached result to update then return
-        while cache.get_dynamic_dict_value(cls._results_cache_key, task_name) == last_id:
-            if not is_started:
-                # Send the task to the next available worker once
-                cls.schedule_task(task_name, *args, **kwargs)
-                is_started = True
+            # The latest result is replaced in place for some tasks, so the cached copy may still be an earlier run's
+            if res and res.get('task_id') != task_id:
+                res = db.find_one({'_id': result_id})
 
-        # Fetch the result from the cache and return
-        return cls.get_result(task_name)
+        # Only the latest result is kept for some tasks, so a newer run may have replaced this one's
+        return Result_Store.resolve(res['task_result']) if res else cls.get_result(task_name)
 
 
     @classmethod
     def chain(cls, task_name:str, *args, **kwargs) ->list:
-        ''' Form a chain of dependant sub-tasks for a given task '''
+        ''' Form a chain of dependant sub-tasks for a given task
 
-        # Get the top level task and its parameters
-        task = cls._internal_tasks[task_name]
+            Tasks that depend on a single task (`depends_on` set to a name) all the way down run as a Celery chain.
+            Otherwise the tasks are run level by level, every task in a level running in parallel once the tasks it
+            depends on finished (see `_graph_levels()`)
+        '''
+
+        levels = cls._graph_levels(task_name)
+        if any(len(level) > 1 or not isinstance(cls._internal_tasks[level[0]].depends_on, (str, type(None))) for level in levels):
+            return cls._run_graph(levels)
 
         # Begin a list of dependent tasks (executed first to last)
-        dependants = [task.task.s(*(task.default_args or []), **(task.default_kwargs or {}))] 
+        steps = [(cls._internal_tasks[name].task, tuple(cls._internal_tasks[name].default_args or []), cls._internal_tasks[name].default_kwargs or {})
+            for [name] in levels]
+
+        if cls._engine:
+            return cls._engine.submit_chain(steps)
 
-        # Add each sub-task to the list of dependant tasks to be executed before the task after it
-        while task.depends_on:
-            task_name   = task.depends_on
-            task        = cls._internal_tasks[task_name]
-            dependants.insert(0, task.task.s(*(task.default_args or []), **(task.default_kwargs or {}))) 
+        dependants = [celery_task.s(*args, **kwargs) for celery_task, args, kwargs in steps]
 
         # Create a chain of tasks allowing the argument of the first to be passed to the next and so on
         return chain(*dependants)()
 
 
     @classmethod
-    def parallelize(cls, tasks, cache_as:str=None):
-        ''' Takes a list of tasks (in the same format as `schedule_task()`) and runs them in parallel 
-            If `cache_as` is set, the result will be cached as if it were a task and will be accessible via `
+    def _graph_levels(cls, task_name:str) -> List[List[str]]:
+        ''' The tasks a task depends on (directly or not) and the task itself, grouped into the levels they run in.
+            Tasks run one level after the tasks they depend on, so the task itself is alone in the last level
+        '''
+
+        depth = {}
+
+        def visit(name:str) -> int:
+            if name not in depth:
+                parents = cls._internal_tasks[name].dependencies()
+                depth[name] = 1 + max(visit(parent) for parent in parents) if parents else 0
+            return depth[name]
+
+        levels = [[] for _ in range(visit(task_name) + 1)]
+        for name, level in sorted(depth.items()):
+            levels[level].append(name)
+
+        return levels
+
+
+    @classmethod
+    def _run_graph(cls, levels:List[List[str]]):
+        ''' Run the levels of a task graph. On Celery each level is a group of `_graph_step_` tasks passing on a dictionary
+            of the outputs later levels need (merged by a `_graph_merge_` chord callback after levels with several tasks)
+        '''
+
+        if cls._engine:
+            return cls._engine.submit_graph(levels, cls._run_graph_node)
+
+        stages = []
+        for num, level in enumerate(levels):
+            keep = sorted({parent for later in levels[num + 1:] for name in later for parent in cls._internal_tasks[name].dependencies()})
+            outputs = () if num else ({},)      # Later levels are passed the outputs of the level before by Celery
+            steps = [cls._graph_step.s(*outputs, name, keep, num == len(levels) - 1).set(**cls._internal_tasks[name].options()) for name in level]
+
+            stages.extend([steps[0]] if len(steps) == 1 else [group(steps), cls._graph_merge.s(keep)])
+
+        return chain(*stages)()
+
+
+    @classmethod
+    def _run_graph_node(cls, task_name:str, outputs:Dict[str, Any], task_id:str=None) -> Any:
+        ''' Run a task of a graph in the current thread (as `task_id` if passed), passing it the outputs of the tasks it depends on '''
+
+        task = cls._internal_tasks[task_name]
+        parents = task.dependencies()
+
+        if isinstance(task.depends_on, str):
+            inputs = (outputs[task.depends_on],)
+        elif parents:
+            inputs = ({parent: Result_Store.resolve(outputs[parent]) if task.resolve_references else outputs[parent] for parent in parents},)
+        else:
+            inputs = ()
+
+        return Local_Engine._apply(task.task, task_id or str(uuid.uuid4()), inputs + tuple(task.default_args or []), task.default_kwargs or {})
+
+
+    @staticmethod
+    def _run_graph_step(outputs:Dict[str, Any], task_name:str, keep:List[str], last:bool) -> Any:
+        ''' Celery task running one task of a graph. Returns the outputs in `keep` (large ones as `Result_Reference`s) or
+            the task's result for the last task, which runs with the step's task ID (the one `run_task()` waits for)
+        '''
+
+        if last:
+            return Task_Manager._run_graph_node(task_name, outputs, Task_Manager._graph_step.request.id)
+
+        result = Task_Manager._run_graph_node(task_name, outputs)
+
+        outputs = {name: outputs[name] for name in keep if name in outputs}
+        if task_name in keep:
+            outputs[task_name] = Result_Store.offload(result, RabbitMQ_Settings.TASK_RESULT_TTL)
+
+        return outputs
+
+
+    @staticmethod
+    def _merge_graph_outputs(outputs:List[Dict[str, Any]], keep:List[str]) -> Dict[str, Any]:
+        ''' Celery chord callback merging the outputs of the tasks of a graph level '''
+
+        merged = {}
+        for output in outputs:
+            merged.update(output)
+
+        return {name: merged[name] for name in keep if name in merged}
+
+
+    @classmethod
+    def parallelize(cls, tasks:Iterable, cache_as:str=None, resolve:bool=True, chunk_size:int=None, window:int=None,
+        reduce:Callable[[Any, Any], Any]=None, initial:Any=None, raise_errors:bool=True):
+        ''' Takes a list of tasks (in the same format as `schedule_task()`) and runs them in parallel (see `iter_parallel()`)
+
+        Args:
+
+            tasks (Iterable): The tasks to run as `(task_name, args, kwargs)` (`args` and `kwargs` are optional). Can be a generator
+
+            cache_as (str, optional): If set, the result will be cached as if it were a task and will be accessible via `get_result()`
+
+            resolve (bool, optional): Results larger than `TASK_OFFLOAD_BYTES` come back from the workers as `Result_Reference`s,
+                which are loaded before returning unless this is False
+
+            chunk_size (int, optional): Tasks sent to a worker per message (`TASK_PARALLEL_CHUNK_SIZE` by default)
+
+            window (int, optional): Most chunks running at once (`TASK_PARALLEL_WINDOW` by default)
+
+            reduce (Callable, optional): If set, results are combined as chunks finish with `value = reduce(value, result)`
+                (starting from `initial`, in the order they finish) and the value is returned instead of a list of results
+
+            initial (Any, optional): The value `reduce` starts from
+
+            raise_errors (bool, optional): If set, a `Parallel_Error` holding the other results is raised once every task
+                finished if any failed. Otherwise failures are in the `errors` of the returned `Parallel_Results` (or logged when reducing)
+
+        Returns:
+
+            A `Parallel_Results` list of the task results in the order the tasks were passed, or the reduced value
         '''
 
-        to_run = []
-        for task in tasks: # Create signature (with args) for every task being run in parallel
-            task_name, args, kwargs = task[0], task[1] if len(task) > 1 else [], task[2] if len(task) > 2 else {}
-            task = cls._internal_tasks[task_name]
-            to_run.append(task.task.s(*args, **kwargs))
+        results, errors, value, count = {}, {}, initial, 0
+        for position, result, error in cls.iter_parallel(tasks, chunk_size, window, resolve=False):
+            count = max(count, position + 1)
+            if error:
+                errors[position] = error
+            elif reduce:
+                value = reduce(value, Result_Store.resolve(result))
+            else:
+                results[position] = result
 
-        # Run the task and immediately get the result
-        task = group(to_run).apply_async()
+        result = value if reduce else Parallel_Results([results.get(position) for position in range(count)], errors)
 
-        # Allow sync subtasks in the event `parallelize` is used within another task
-        result = task.get(disable_sync_subtasks=False)
+        if errors and raise_errors:
+            raise Parallel_Error(errors, result if reduce or not resolve else Parallel_Results(Result_Store.resolve(result), errors))
+        if errors and reduce:
+            logging.warning(f'[{len(errors)}] parallel tasks failed and were left out of the reduced result. First failure: {errors[min(errors)]}')
 
         # Cache the data like a regular task if specified
         if cache_as:
-            data = {'task_name': cache_as, 'task_id': str(task.id), 'task_result': result}
+            stored = [Result_Store.offload(item) for item in ([result] if reduce else result)]
+            stored = [item.to_document() if isinstance(item, Result_Reference) else item for item in stored]
+            data = {'task_name': cache_as, 'task_id': str(uuid.uuid4()), 'task_result': stored[0] if reduce else stored}
             upsert_persistently_and_cache(cls._results_collection, cls._results_cache_key, data, cache_as)
-        
-        return result
+
+        if reduce or not resolve:
+            return result
+
+        return Parallel_Results(Result_Store.resolve(result), errors)
+
+
+    @classmethod
+    def iter_parallel(cls, tasks:Iterable, chunk_size:int=None, window:int=None, resolve:bool=True) -> Iterator[Tuple[int, Any, Optional[Task_Error]]]:
+        ''' Run tasks (in the same format as `schedule_task()`) in parallel and yield `(position, result, error)` for each task
+            as the chunk it was sent in finishes (so not in order). `error` is a `Task_Error` (and `result` None) if the task failed
+
+            Tasks are sent `chunk_size` to a message and at most `window` chunks run at once, so `tasks` is only read as
+            chunks finish. Chunks that take longer than `TASK_RESULT_TIMEOUT` are reported as failed. Results larger than
+            `TASK_OFFLOAD_BYTES` come back as `Result_Reference`s, which are loaded unless `resolve` is False
+
+            On Celery, chunk results are kept in the result backend for `TASK_RESULT_TIMEOUT` seconds (`result_expires`).
+            Every finished chunk is read before its results are yielded, so a slow consumer only loses results if it holds
+            the iterator for longer than that
+        '''
+
+        chunk_size = max(1, chunk_size or RabbitMQ_Settings.TASK_PARALLEL_CHUNK_SIZE)
+        window = max(1, window or RabbitMQ_Settings.TASK_PARALLEL_WINDOW)
+        chunks = cls._parallel_chunks((cls._parallel_item(position, task) for position, task in enumerate(tasks)), chunk_size)
+
+        running, wait = [], cls._poll_seconds[0]
+        while True:
+            while len(running) < window:
+                chunk = next(chunks, None)
+                if not chunk: break
+                running.append((cls._send_chunk(chunk), chunk, time.monotonic()))
+
+            if not running:
+                return
+
+            finished = [entry for entry in running if entry[0].ready() or time.monotonic() - entry[2] > RabbitMQ_Settings.TASK_RESULT_TIMEOUT]
+            if not finished:    # Back off while nothing finishes so waiting on slow chunks doesn't flood the result backend
+                time.sleep(wait); wait = min(wait * 2, cls._poll_seconds[1])
+                continue
+
+            wait = cls._poll_seconds[0]
+            outputs = []
+            for entry in finished:
+                running.remove(entry)
+                outputs.extend(cls._chunk_results(*entry[:2]))
+
+            for position, result, error in outputs:
+                yield position, Result_Store.resolve(result) if resolve and not error else result, error
+
+
+    @classmethod
+    def _parallel_item(cls, position:int, task:Union[str, tuple, list]) -> Tuple[int, str, list, dict]:
+        ''' A task passed to `parallelize()` as `(position, task_name, args, kwargs)`. Raises a `KeyError` for unknown tasks '''
+
+        task = (task,) if isinstance(task, str) else task
+        task_name, args, kwargs = task[0], task[1] if len(task) > 1 else [], task[2] if len(task) > 2 else {}
+        if task_name not in cls._internal_tasks:
+            raise KeyError(f'Task [{task_name}] is not registered')
+
+        return position, task_name, list(args or []), dict(kwargs or {})
+
+
+    @classmethod
+    def _parallel_chunks(cls, items:Iterator[Tuple[int, str, list, dict]], chunk_size:int) -> Iterator[List[Tuple[int, str, list, dict]]]:
+        ''' Group tasks into chunks of up to `chunk_size` tasks sent to the same queue with the same priority. Partly filled
+            chunks are sent once every task was read
+        '''
+
+        pending:Dict[tuple, list] = {}      # (queue, priority) -> tasks waiting for a chunk
+        for item in items:
+            options = cls._internal_tasks[item[1]].options()
+            route = (options.get('queue'), options.get('priority'))
+            pending.setdefault(route, []).append(item)
+            if len(pending[route]) >= chunk_size:
+                yield pending.pop(route)
+
+        yield from pending.values()
+
+
+    @classmethod
+    def _send_chunk(cls, chunk:List[Tuple[int, str, list, dict]]):
+        ''' Start running a chunk of tasks. Returns a handle to the `_parallel_chunk_` task '''
+
+        if cls._engine:
+            return cls._engine.submit(cls._parallel_chunk, (chunk, False))
+
+        # Every task in a chunk has the same queue and priority (see `_parallel_chunks()`)
+        options = cls._internal_tasks[chunk[0][1]].options()
+        return cls._parallel_chunk.apply_async((chunk, True), **{option: options[option] for option in ('queue', 'priority') if option in options})
+
+
+    @classmethod
+    def _chunk_results(cls, handle, chunk:List[Tuple[int, str, list, dict]]) -> List[Tuple[int, Any, Optional[Task_Error]]]:
+        ''' The `(position, result, error)` of each task in a finished chunk. Every task fails if the chunk did '''
+
+        try:
+            outputs = handle.get(0.1) if cls._engine else handle.get(0.1, disable_sync_subtasks=False)
+        except Exception as e:
+            error = 'Timed out' if not handle.ready() else f'{type(e).__name__}: {e}'
+            return [(position, None, Task_Error(task_name, handle.id, error)) for position, task_name, _, _ in chunk]
+        finally:
+            if not cls._engine: handle.forget()     # Results are only read once
+
+        names = {position: task_name for position, task_name, _, _ in chunk}
+        return [(position, result, Task_Error(names[position], task_id, error) if error else None) for position, task_id, result, error in outputs]
+
+
+    @staticmethod
+    def _run_parallel_chunk(chunk:List[Tuple[int, str, list, dict]], offload:bool) -> List[Tuple[int, str, Any, Optional[str]]]:
+        ''' Celery task running a chunk of the tasks passed to `parallelize()` one after another. Returns the
+            `(position, task_id, result, error)` of each so one failing task doesn't fail the others
+        '''
+
+        outputs = []
+        for position, task_name, args, kwargs in chunk:
+            task_id = str(uuid.uuid4())
+            try:
+                result = Local_Engine._apply(Task_Manager._internal_tasks[task_name].task, task_id, tuple(args), kwargs)
+                outputs.append((position, task_id, Result_Store.offload(result, RabbitMQ_Settings.TASK_RESULT_TTL) if offload else result, None))
+            except Exception as e:
+                outputs.append((position, task_id, None, e.error if isinstance(e, Task_Error) else f'{type(e).__name__}: {e}'))
+
+        return outputs
+
+
+    @classmethod
+    def _get_memoized(cls, task_name:str, args:list=None, kwargs:dict=None) -> dict:
+        ''' The result cached for a memoized task's arguments (a dictionary with the `task_id` and `task_result`) or None '''
+
+        task = cls._internal_tasks.get(task_name)
+        if not args and not kwargs and task and task.default_args:
+            args = task.default_args
+
+        return get_memoized_result(task_name, args_key(args, kwargs))
 
 
     @classmethod 
-    def get_result(cls, task_name:str):
+    def get_result(cls, task_name:str, args:list=None, kwargs:dict=None):
         ''' Get the latest result of a task if it exists
         
         Args:
 
             task_name (str): The name of the task to retrieve the last result for
 
+            args (list, optional): Get the result of a memoized task for these positional arguments instead of the latest result
+
+            kwargs (dict, optional): Get the result of a memoized task for these keyword arguments instead of the latest result
+
         Returns:
 
-           The last stored result for the task
+           The last stored result for the task (or the result memoized for the arguments if passed, None if there isn't one)
         '''
 
-        # Get the database record ID of the task result from the cache
-        result_id = Cache().get_dynamic_dict_value(cls._results_cache_key, task_name)
-        if result_id: # Use it to retrieve the result
+        if args is not None or kwargs is not None:
+            memoized = cls._get_memoized(task_name, args, kwargs)
+            return Result_Store.resolve(memoized['task_result']) if memoized else None
+
+        task = cls._internal_tasks.get(task_name)
+        if task and task.store_results == False:
+            return None
+
+        # Small results (and every result of tasks that only cache their results) are read straight from the cache
+        cached = get_cached_result(task_name)
+        if cached or (task and task.store_results == 'cache'):
+            return Result_Store.resolve(cached['task_result']) if cached else None
+
+        # Only tasks that store every result need to look up the ID of the latest one. The rest store it under a known ID
+        if task and task.store_results:
+            result_id = Cache(shared=True).get_dynamic_dict_value(cls._results_cache_key, task_name)
+            result_id = ObjectId(result_id) if result_id else None
+        else:
+            result_id = latest_id(task_name)
+
+        if result_id: # Use it to retrieve the result (a cached copy of a result replaced in place can trail it until the invalidation reaches this process)
             with Database(collection=cls._results_collection) as db:
-                res =  db.find_one({'_id': ObjectId(result_id)})
-                return res['task_result'] if res else res
+                res = Document_Cache.get(db, result_id)
+                return Result_Store.resolve(res['task_result']) if res else res
+
+
+    @classmethod
+    def migrate_results(cls) -> int:
+        ''' Clean up results stored for registered tasks that only keep their latest result before it had a deterministic `_id`.
+            Done automatically by each task the first time it stores a result. Returns the number of documents removed
+        '''
+
+        return sum(migrate_to_latest_id(cls._results_collection, cls._results_cache_key, name) for name, task in cls._internal_tasks.items()
+            if task.store_results is None)
 
 
     @classmethod 
@@ -253,7 +734,7 @@ class Task_Manager(Celery):
         '''
 
         with Database(collection=cls._results_collection) as db:
-            return [res['task_result'] for res in list(db.find({'task_name': task_name}))]
+            return [Result_Store.resolve(res['task_result']) for res in list(db.find({'task_name': task_name}))]
 
 
     @staticmethod
@@ -280,19 +761,22 @@ class Task_Manager(Celery):
 
         Args:
 
-            should_store (bool): Whether or not results should be stored. The type is based on the `store_results` key, if it is present, possible values:
+            should_store (Union[bool, str]): Whether or not results should be stored. The type is based on the `store_results` key, if it is present, possible values:
                 - None     | Store the last result in the database [default]
                 - True     | Store all results in the database
                 - False    | Store no results in the database
+                - 'cache'  | Store the last result in the cache only
 
         Returns:
 
             The celery task type that should be used to instantiate a given task with based on it's `should_store` attribute
         '''
 
+        if should_store == 'cache':
+            return Cache_Task
         if should_store: 
             return Store_Task
         if should_store == False:
-            return Task
+            return Tracked_Task
 
         return Store_Latest_Task
\ No newline at end of file
@@ -0,0 +1,17 @@
+''' Results of tasks run in parallel '''
+
+# Errors
+from .errors import Task_Error
+
+# Typing
+from typing import Dict, Iterable
+
+
+class Parallel_Results(list):
+    ''' Results of `Task_Manager.parallelize()` in the order the tasks were passed. Failed tasks have None in their
+        position and their `Task_Error` in `errors` (by position)
+    '''
+
+    def __init__(self, results:Iterable=(), errors:Dict[int, Task_Error]=None):
+        super().__init__(results)
+        self.errors = errors or {}
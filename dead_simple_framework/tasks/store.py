@@ -0,0 +1,369 @@
+''' Out-of-band storage for task results too large to pass through the broker or keep in a MongoDB document '''
+
+# Database
+from ..database import Database
+from bson import encode
+from bson.errors import InvalidDocument
+import gridfs
+
+# Task Settings
+from ..config import RabbitMQ_Settings
+
+# Utilities
+from datetime import datetime, timezone
+import os, pickle, tempfile, threading, time, uuid, zlib
+
+# Typing
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+# Debug
+import logging
+
+
+class Result_Reference:
+    ''' Lightweight handle to a value kept in a `Result_Store`
+
+        Passed through the broker, between chained tasks and stored with task results in place of the value itself.
+        The value is only loaded when `get()` is called (and is kept after that), so tasks that just pass a result
+        on never load it. Stored in MongoDB as a small document (see `to_document()`)
+    '''
+
+    FIELD = '_result_ref_'      # Field marking a document as a reference (holds the name of the store)
+
+    def __init__(self, store:str, key:str, size:int):
+        self.store = store
+        self.key = key
+        self.size = size        # Bytes stored (after compression)
+        self._value, self._loaded = None, False
+
+
+    def get(self) -> Any:
+        ''' Load the value (once). Raises a `KeyError` if it was removed from the store '''
+
+        if not self._loaded:
+            self._value, self._loaded = Result_Store.get_store(self.store).load(self.key), True
+
+        return self._value
+
+
+    def delete(self):
+        ''' Remove the value from the store '''
+
+        Result_Store.get_store(self.store).delete(self.key)
+
+
+    def to_document(self) -> dict:
+        ''' The reference as a document that can be stored in MongoDB or the cache '''
+
+        return {self.FIELD: self.store, 'key': self.key, 'size': self.size}
+
+
+    @classmethod
+    def from_document(cls, document:Any) -> Optional['Result_Reference']:
+        ''' The reference a value holds (a `Result_Reference` or a document from `to_document()`) or None if it isn't one '''
+
+        if isinstance(document, cls):
+            return document
+        if isinstance(document, dict) and cls.FIELD in document:
+            return cls(document[cls.FIELD], document['key'], document['size'])
+
+        return None
+
+
+    def __getstate__(self) -> dict:
+        # Never send a loaded value through the broker
+        return {'store': self.store, 'key': self.key, 'size': self.size}
+
+
+    def __setstate__(self, state:dict):
+        self.__init__(**state)
+
+
+    def __repr__(self) -> str:
+        return f'Result_Reference({self.store!r}, {self.key!r}, size={self.size})'
+
+
+class Result_Store:
+    ''' Stores large task results out-of-band so only a `Result_Reference` goes through the broker and into MongoDB
+
+        Values are pickled (like every task argument and result) and compressed with zlib. Values stored with a `ttl`
+        (results only passed between tasks) are purged once expired, at most once every `PURGE_SECONDS` per process.
+        Use `get_store()` for the store configured with `TASK_RESULT_STORE`:
+
+        - `gridfs` | GridFS in the default database [default]
+        - `local`  | Files under `TASK_RESULT_STORE_PATH`. Only shared between workers if the directory is (for tests and single hosts)
+    '''
+
+    NAME:str = None
+    PURGE_SECONDS = 60 * 60
+    COMPRESSION_LEVEL = 1       # Favor speed, results are usually read once
+
+    COMPRESSED = b'z'
+    UNCOMPRESSED = b'-'
+
+    _stores:Dict[str, 'Result_Store'] = {}
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self._purged = time.monotonic()
+
+
+    @classmethod
+    def get_store(cls, name:str=None) -> 'Result_Store':
+        ''' The store registered under a name (`TASK_RESULT_STORE` by default) '''
+
+        name = name or RabbitMQ_Settings.TASK_RESULT_STORE
+        with cls._lock:
+            if name not in cls._stores:
+                if name == GridFS_Result_Store.NAME:  cls._stores[name] = GridFS_Result_Store()
+                elif name == Local_Result_Store.NAME: cls._stores[name] = Local_Result_Store(RabbitMQ_Settings.TASK_RESULT_STORE_PATH)
+                else: raise ValueError(f'Unknown task result store [{name}]')
+
+            return cls._stores[name]
+
+
+    @classmethod
+    def encode(cls, pickled:bytes) -> bytes:
+        ''' Compress a pickled value for storage (if it helps) '''
+
+        compressed = zlib.compress(pickled, cls.COMPRESSION_LEVEL)
+        if len(compressed) < len(pickled):
+            return cls.COMPRESSED + compressed
+
+        return cls.UNCOMPRESSED + pickled
+
+
+    @classmethod
+    def decode(cls, raw:bytes) -> Any:
+        ''' Load a value stored with `encode()` '''
+
+        data = zlib.decompress(raw[1:]) if raw[:1] == cls.COMPRESSED else raw[1:]
+        return pickle.loads(data)
+
+
+    def put(self, value:Any, ttl:int=None, pickled:bytes=None) -> Result_Reference:
+        ''' Store a value (already pickled as `pickled` if passed) and return a reference to it. Removed after `ttl` seconds if passed '''
+
+        data = self.encode(pickled or pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        key = self.save(data, time.time() + ttl if ttl else None)
+
+        if time.monotonic() - self._purged > self.PURGE_SECONDS:
+            self._purged = time.monotonic()
+            try:
+                self.purge_expired()
+            except Exception as e:
+                logging.warning(f'Failed to purge expired task results: {e}')
+
+        return Result_Reference(self.NAME, key, len(data))
+
+
+    def load(self, key:str) -> Any:
+        ''' Load a stored value. Raises a `KeyError` if it doesn't exist '''
+
+        return self.decode(self.read(key))
+
+
+    def save(self, data:bytes, expires:float=None) -> str:
+        ''' Abstract - Store encoded data (until the `expires` timestamp if passed) and return its key '''
+
+
+    def read(self, key:str) -> bytes:
+        ''' Abstract - Read stored data. Raises a `KeyError` if it doesn't exist '''
+
+
+    def delete(self, key:str):
+        ''' Abstract - Remove stored data if it exists '''
+
+
+    def purge_expired(self) -> int:
+        ''' Abstract - Remove expired data. Returns the number of values removed '''
+
+
+    @classmethod
+    def offload(cls, value:Any, ttl:int=None, threshold:int=None) -> Any:
+        ''' Store a value and return a reference to it if it's larger than `threshold` bytes pickled (`TASK_OFFLOAD_BYTES`
+            by default, 0 disables). Smaller values (and references) are returned as-is
+        '''
+
+        threshold = RabbitMQ_Settings.TASK_OFFLOAD_BYTES if threshold is None else threshold
+        if not threshold or value is None or isinstance(value, (bool, int, float, Result_Reference)):
+            return value
+
+        try:
+            pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return value    # Left to the serializer of whatever it's passed to
+
+        if len(pickled) <= threshold:
+            return value
+
+        return cls.get_store().put(value, ttl, pickled)
+
+
+    @classmethod
+    def offload_document(cls, value:Any, ttl:int=None, threshold:int=None) -> Any:
+        ''' Store a value that will be stored in MongoDB and return a reference to it if it's larger than `threshold` bytes
+            as BSON (`TASK_OFFLOAD_BYTES` by default, 0 disables) or can't be encoded as BSON. Values that can't be encoded
+            or pickled are returned as a string
+        '''
+
+        threshold = RabbitMQ_Settings.TASK_OFFLOAD_BYTES if threshold is None else threshold
+        if value is None or isinstance(value, (bool, float, Result_Reference)):
+            return value
+
+        try:
+            if not threshold or len(encode({'value': value})) <= threshold:
+                return value
+        except (InvalidDocument, OverflowError):
+            return cls.keep(value, ttl)
+
+        try:
+            pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return value    # MongoDB can still store it
+
+        return cls.get_store().put(value, ttl, pickled)
+
+
+    @classmethod
+    def keep(cls, value:Any, ttl:int=None) -> Union[Result_Reference, str]:
+        ''' Store a value MongoDB can't and return a reference to it, or the value as a string if it can't be pickled either '''
+
+        try:
+            pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logging.warning(f'Storing task result as a string as it can\'t be stored in MongoDB or pickled: {type(e).__name__}: {e}')
+            return str(value)
+
+        return cls.get_store().put(value, ttl, pickled)
+
+
+    @staticmethod
+    def resolve(value:Any) -> Any:
+        ''' Load the value a reference (or a reference document) points to. References in a list (e.g. results of
+            `Task_Manager.parallelize()`) are loaded item by item. Anything else is returned as-is
+        '''
+
+        if isinstance(value, list):
+            return [Result_Store.resolve(item) if isinstance(item, (dict, Result_Reference)) else item for item in value]
+
+        reference = Result_Reference.from_document(value)
+        return reference.get() if reference else value
+
+
+    @classmethod
+    def resolve_all(cls, args:tuple, kwargs:dict) -> Tuple[tuple, dict]:
+        ''' Load the values of any references passed as task arguments '''
+
+        return tuple(cls.resolve(arg) for arg in args), {name: cls.resolve(arg) for name, arg in kwargs.items()}
+
+
+    @staticmethod
+    def release(value:Any, keep:Any=None):
+        ''' Remove the values references in `value` (a reference document or list of them) point to, except those also in `keep` '''
+
+        def references(value:Any) -> Iterable[Result_Reference]:
+            for item in (value if isinstance(value, list) else [value]):
+                reference = Result_Reference.from_document(item)
+                if reference: yield reference
+
+        kept = {(reference.store, reference.key) for reference in references(keep)}
+        for reference in references(value):
+            if (reference.store, reference.key) not in kept:
+                try:
+                    reference.delete()
+                except Exception as e:
+                    logging.warning(f'Failed to remove replaced task result [{reference.key}]: {e}')
+
+
+class GridFS_Result_Store(Result_Store):
+    ''' Stores values in GridFS in the default database. Expiry times are kept in the file metadata '''
+
+    NAME = 'gridfs'
+    BUCKET = '_task_blobs_'
+
+    def __init__(self):
+        super().__init__()
+        self._fs:gridfs.GridFS = None
+
+
+    def fs(self) -> gridfs.GridFS:
+        if self._fs is None:
+            with Database(collection=self.BUCKET) as db:
+                self._fs = gridfs.GridFS(db.database, collection=self.BUCKET)
+                db.database[f'{self.BUCKET}.files'].create_index('metadata.expires', sparse=True)
+
+        return self._fs
+
+
+    def save(self, data:bytes, expires:float=None) -> str:
+        key = uuid.uuid4().hex
+        metadata = {'expires': datetime.fromtimestamp(expires, timezone.utc)} if expires else {}
+        self.fs().put(data, _id=key, metadata=metadata)
+        return key
+
+
+    def read(self, key:str) -> bytes:
+        try:
+            return self.fs().get(key).read()
+        except gridfs.NoFile:
+            raise KeyError(f'Task result [{key}] is not stored')
+
+
+    def delete(self, key:str):
+        self.fs().delete(key)
+
+
+    def purge_expired(self) -> int:
+        fs, removed = self.fs(), 0
+        for stored in fs.find({'metadata.expires': {'$lt': datetime.now(timezone.utc)}}):
+            fs.delete(stored._id); removed += 1
+
+        return removed
+
+
+class Local_Result_Store(Result_Store):
+    ''' Stores values as files in a directory. The expiry time is part of the key (and file name) '''
+
+    NAME = 'local'
+
+    def __init__(self, path:str=None):
+        super().__init__()
+        self.path = path or os.path.join(tempfile.gettempdir(), 'dead_simple_framework_results')
+        os.makedirs(self.path, exist_ok=True)
+
+
+    def save(self, data:bytes, expires:float=None) -> str:
+        key = f'{uuid.uuid4().hex}-{int(expires) if expires else 0}'
+
+        # Write to a temporary file first so readers never see a partial value
+        temporary = os.path.join(self.path, f'.{key}.tmp')
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, os.path.join(self.path, key))
+        return key
+
+
+    def read(self, key:str) -> bytes:
+        try:
+            with open(os.path.join(self.path, os.path.basename(key)), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(f'Task result [{key}] is not stored')
+
+
+    def delete(self, key:str):
+        try:
+            os.remove(os.path.join(self.path, os.path.basename(key)))
+        except FileNotFoundError:
+            pass
+
+
+    def purge_expired(self) -> int:
+        now, removed = time.time(), 0
+        for key in os.listdir(self.path):
+            expires = key.rsplit('-', 1)[-1]
+            if not key.startswith('.') and expires.isdigit() and 0 < int(expires) < now:
+                self.delete(key); removed += 1
+
+        return removed
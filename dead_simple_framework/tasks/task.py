@@ -4,11 +4,25 @@ from ..database import Database
 # Celery
 from celery import Task
 
+# Cache
+from ..cache import Cache
+
+# Task Settings
+from ..config import RabbitMQ_Settings
+
 # Utilities
-from .utils import insert_persistently_and_cache, upsert_persistently_and_cache
+from .utils import insert_persistently_and_cache, upsert_persistently_and_cache, migrate_to_latest_id, cache_result, result_key, args_key, memoize_result, running_key
+import json, time
+
+# Result Storage
+from .store import Result_Store, Result_Reference
+from .writer import Result_Writer
+from bson import ObjectId, encode
+from bson.raw_bson import RawBSONDocument
 
 # Errors
-from pymongo.errors import InvalidDocument
+from .errors import Task_Error
+from pymongo.errors import InvalidDocument, DocumentTooLarge
 
 # Debug
 import logging
@@ -17,15 +31,145 @@ import logging
 # TODO - [Stability]     | Automatic retry
 # TODO - [Useability]    | Storage of failed tasks for easy retreival [configurable]
 # TODO - [Extendability] | Allow results collection and cache key to be overridden
-# TODO - [Extendability] | Allow results to be cached directly [new task class]
 
 
-class Database_Task(Task):
-    ''' Base Celery task for storing results in the database '''
+class Tracked_Task(Task):
+    ''' Base Celery task that records when it finishes so callers can wait for a specific run with `wait()`
+
+        Completion is stored under the task ID (for `TASK_RESULT_TIMEOUT` seconds) and published on a channel
+        for the task ID, so waiters wake up as soon as the task finishes instead of polling for results
+    '''
+
+    _done_prefix = '_task_done_'    # Prefix for the keys/channels task completions are stored/published under
+    POLL_SECONDS = 1                # Waiters re-check the completion key at least this often in case a message is missed
+    result_ttl:int = None           # Seconds results cached by subclasses are kept for (`TASK_RESULT_TTL` if not set). Set from `TaskConfig.result_ttl`
+    resolve_references = True       # Load results passed from other tasks by reference before running. Set from `TaskConfig.resolve_references`
+    offload_results = False         # Move results too large (as BSON) for the database or that it can't store to the `Result_Store`
+    memoize_ttl:int = None          # Seconds results are reused for the same arguments. Set from `TaskConfig.memoize_ttl`
+    deduplicate = False             # Runs for the same arguments share one execution. Set from `TaskConfig.deduplicate`
+
+    def __call__(self, *args, **kwargs):
+        ''' Runs the task. Results larger than `TASK_OFFLOAD_BYTES` that are stored or passed to other tasks (in a chain
+            or group) are moved to the `Result_Store` and a `Result_Reference` is returned in their place.
+            Results of memoized tasks are cached for their arguments before anyone waiting for them is notified
+        '''
+
+        key = args_key(args, kwargs) if self.memoize_ttl else None
+        if self.resolve_references:
+            args, kwargs = Result_Store.resolve_all(args, kwargs)
+
+        result = super().__call__(*args, **kwargs)
+
+        if self.offload_results:
+            result = Result_Store.offload_document(result)
+        elif self.request.chain or self.request.callbacks or self.request.group or self.memoize_ttl:
+            # Only passed on (or reused), so it can be removed once every consumer had time to run
+            result = Result_Store.offload(result, max(self.result_ttl or RabbitMQ_Settings.TASK_RESULT_TTL, self.memoize_ttl or 0))
+
+        if key:
+            memoize_result(self.name, key, self.request.id, result, self.memoize_ttl)
+
+        return result
+
+
+    def after_return(self, status, retval, task_id, args, kwargs, einfo):
+        ''' Lets new runs of a deduplicated task start once this one finished (whether it succeeded or not) '''
+
+        if self.deduplicate:
+            cache, key = Cache(shared=True), running_key(self.name, args_key(args, kwargs))
+            if cache.get_raw(key) == str(task_id).encode():
+                cache.remove(key)
+
+    @classmethod
+    def notify(cls, task_id:str, result_id=None, error:str=None, cache:Cache=None):
+        ''' Record that a task finished (with the ID of its stored result or an error) and wake up anyone waiting for it.
+            Writes through `cache` if passed (e.g. a `Cache.batch()`)
+        '''
+
+        key = f'{cls._done_prefix}:{task_id}'
+        message = json.dumps({'result_id': str(result_id) if result_id else None, 'error': error})
+
+        cache = cache or Cache(shared=True)
+        cache.cache_string(key, message, max(1, int(RabbitMQ_Settings.TASK_RESULT_TIMEOUT)))
+        cache.publish(key, message)
+
+
+    @classmethod
+    def wait(cls, task_id:str, timeout:float=None) -> dict:
+        ''' Block until a task finishes and return its completion (`result_id` and `error`)
+
+            Raises a `TimeoutError` if it doesn't finish within `timeout` seconds (`TASK_RESULT_TIMEOUT` by default)
+        '''
+
+        key = f'{cls._done_prefix}:{task_id}'
+        timeout = RabbitMQ_Settings.TASK_RESULT_TIMEOUT if timeout is None else timeout
+
+        cache = Cache(shared=True)
+        subscription = cache.subscribe(key)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                # Checked after subscribing so a task that finished before the subscription isn't missed
+                done = cache.get_raw(key)
+                if done is not None:
+                    return json.loads(done)
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f'Task [{task_id}] did not finish within [{timeout}] seconds')
+
+                subscription.get_message(timeout=min(remaining, cls.POLL_SECONDS))
+        finally:
+            subscription.close()
+
+
+    def on_success(self, retval, task_id, args, kwargs):
+        ''' Wake up anyone waiting for the task '''
+
+        self.notify(task_id)
+
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        ''' Wake up anyone waiting for the task with the error '''
+
+        self.notify(task_id, error=f'{type(exc).__name__}: {exc}')
+
+
+class Cache_Task(Tracked_Task):
+    ''' Celery task that only stores the latest result in the cache (for `result_ttl` seconds, `TASK_RESULT_TTL` by default)
+
+        Results never touch the database, so they are lost if the cache is flushed. Results are stored with `Cache_Codec`
+        so anything it can't represent (e.g. custom classes) is converted to a string
+    '''
+
+    def on_success(self, retval, task_id, args, kwargs):
+        ''' Caches the result of an asynchronous task when it completes '''
+
+        try:
+            if isinstance(retval, Result_Reference):
+                retval = retval.to_document()
+
+            cache_result(self.name, task_id, retval, self.result_ttl or RabbitMQ_Settings.TASK_RESULT_TTL)
+        except Exception as e:
+            self.notify(task_id, error=f'Failed to store result | {type(e).__name__}: {e}'); raise
+
+        self.notify(task_id)
+
+
+class Database_Task(Tracked_Task):
+    ''' Base Celery task for storing results in the database
+
+        Results smaller than `TASK_INLINE_RESULT_BYTES` once encoded are also cached (for `result_ttl` seconds,
+        `TASK_RESULT_TTL` by default) so `Task_Manager.get_result()` can read them in one round trip. Results larger than
+        `TASK_OFFLOAD_BYTES` as BSON (or that MongoDB can't store) are kept in the `Result_Store` and referenced from the
+        database. Results that can't be pickled either are stored as strings
+    '''
 
     _collection  = '_task_results_'  # Collection to store results in
     _cache_key =   '_task_results_'  # Cache key to store latest result ID (so you don't need to watch Mongo collections)
     _is_setup = False
+    offload_results = True
+    inline_results = True           # Cache small results under `result_key()`. Off for tasks whose latest result is under a known `_id`
 
     # TODO - Distinct task ID field?
 
@@ -42,34 +186,106 @@ class Database_Task(Task):
     def on_success(self, retval, task_id, args, kwargs):
         ''' Stores the result of an asynchronous task in Mongo when it completes '''
 
-        if not self._is_setup: 
-            self._setup()                               # Perform initial setup if not done
-        
-        self.success(retval, task_id, args, kwargs)     # Delegate storage logic to concrete subclasses
+        try:
+            if not self._is_setup: 
+                self._setup()                                   # Perform initial setup if not done
+
+            if isinstance(retval, Result_Reference):
+                retval = retval.to_document()                   # Large results are stored by reference
+
+            result_id = self.success(retval, task_id, args, kwargs) # Delegate storage logic to concrete subclasses
+            if result_id is Result_Writer.PENDING:
+                return                                          # Cached and announced once its batch is written
+
+            # Inline small results in the cache (the stored copy stays the source of truth)
+            if self.inline_results:
+                cache_result(self.name, task_id, retval, self.result_ttl or RabbitMQ_Settings.TASK_RESULT_TTL, RabbitMQ_Settings.TASK_INLINE_RESULT_BYTES, exact=True, order=result_id)
+            else:
+                Cache(shared=True).remove(result_key(self.name))  # Left by an older version
+        except Exception as e:
+            self.notify(task_id, error=f'Failed to store result | {type(e).__name__}: {e}'); raise
+
+        self.notify(task_id, result_id)
     
     
     def success(self, retval, task_id, args, kwargs):
-        ''' Abstract - Implemented by concrete Task classes '''
+        ''' Abstract - Implemented by concrete Task classes. Returns the ID of the stored result '''
+
+
+    @staticmethod
+    def _keep(retval):
+        ''' The reference document (or string if it can't be pickled) stored in place of a result MongoDB can't store '''
+
+        stored = Result_Store.keep(retval)
+        return stored.to_document() if isinstance(stored, Result_Reference) else stored
 
 
 class Store_Task(Database_Task):
-    ''' Celery task that persistently stores the all results in the database '''
+    ''' Celery task that persistently stores the all results in the database
+
+        Results are written in batches by the worker's `Result_Writer` if `TASK_RESULT_BATCH_SIZE` is over 1
+    '''
+
+    MAX_DOCUMENT_BYTES = 16 * 1024 * 1024   # MongoDB's document size limit
 
     def success(self, retval, task_id, args, kwargs):
         ''' Stores the result of an asynchronous task in Mongo when it completes '''
 
+        if Result_Writer.is_enabled():
+            return self._buffer(retval, task_id)
+
         data = {'task_name': self.name, 'task_id': str(task_id), 'task_result': retval}
         try:
             # Store the result in MongoDB for retrieval with `Task_Manager.get_result()`
-            insert_persistently_and_cache(self._collection, self._cache_key, data, self.name)
-        except InvalidDocument as e:
-            # Coerce task result to string if it can't be serialized 
-            data = {'task_name': self.name, 'task_id': str(task_id), 'task_result': str(retval)}
-            insert_persistently_and_cache(self._collection, self._cache_key, data, self.name)
+            return insert_persistently_and_cache(self._collection, self._cache_key, data, self.name)
+        except (InvalidDocument, DocumentTooLarge) as e:
+            # Keep results MongoDB can't store in the result store
+            data = {'task_name': self.name, 'task_id': str(task_id), 'task_result': self._keep(retval)}
+            return insert_persistently_and_cache(self._collection, self._cache_key, data, self.name)
+
+
+    def _buffer(self, retval, task_id) -> object:
+        ''' Hand the result to the worker's `Result_Writer`. It's cached and announced once its batch is written '''
+
+        _id = ObjectId()    # Generated now so the latest result is the one that finished last
+        try:
+            document = RawBSONDocument(encode({'_id': _id, 'task_name': self.name, 'task_id': str(task_id), 'task_result': retval}))
+            if len(document.raw) > self.MAX_DOCUMENT_BYTES: raise DocumentTooLarge()
+        except (InvalidDocument, DocumentTooLarge):
+            # Keep results MongoDB can't store in the result store
+            retval = self._keep(retval)
+            document = RawBSONDocument(encode({'_id': _id, 'task_name': self.name, 'task_id': str(task_id), 'task_result': retval}))
+
+        def on_stored(cache:Cache, error:str, latest:bool):
+            if error:
+                self.notify(task_id, error=f'Failed to store result | {error}', cache=cache); return
+
+            if latest:
+                cache_result(self.name, task_id, retval, self.result_ttl or RabbitMQ_Settings.TASK_RESULT_TTL,
+                    RabbitMQ_Settings.TASK_INLINE_RESULT_BYTES, exact=True, cache=cache, order=_id)
+            self.notify(task_id, _id, cache=cache)
+
+        Result_Writer.for_collection(self._collection, self._cache_key).add(document, self.name, on_stored)
+        return Result_Writer.PENDING
         
 
 class Store_Latest_Task(Database_Task):
-    ''' Celery task that persistently stores the latest result in the database '''
+    ''' Celery task that persistently stores the latest result in the database (under a deterministic `_id`, see `latest_id()`)
+
+        Results aren't inlined in the cache as runs replacing the result concurrently could leave another run's copy there.
+        `Task_Manager.get_result()` reads the result straight from the document cache instead
+    '''
+
+    inline_results = False
+
+    def _setup(self):
+        ''' Perform database optimizations and clean up results stored before results had a deterministic `_id` (once) '''
+
+        super()._setup()
+
+        removed = migrate_to_latest_id(self._collection, self._cache_key, self.name)
+        if removed: logging.info(f'Removed [{removed}] outdated results for task [{self.name}]')
+
 
     def success(self, retval, task_id, args, kwargs):
         ''' Stores the result of an asynchronous task in Mongo when it completes '''
@@ -77,9 +293,9 @@ class Store_Latest_Task(Database_Task):
         data = {'task_name': self.name, 'task_id': str(task_id), 'task_result': retval}
         try:
             # Store the result in MongoDB for retrieval with `Task_Manager.get_result()`
-            upsert_persistently_and_cache(self._collection, self._cache_key, data, self.name)
-        except InvalidDocument as e:
-            # Coerce task result to string if it can't be serialized 
-            data = {'task_name': self.name, 'task_id': str(task_id), 'task_result': str(retval)}
-            upsert_persistently_and_cache(self._collection, self._cache_key, data, self.name)
+            return upsert_persistently_and_cache(self._collection, self._cache_key, data, self.name)
+        except (InvalidDocument, DocumentTooLarge) as e:
+            # Keep results MongoDB can't store in the result store
+            data = {'task_name': self.name, 'task_id': str(task_id), 'task_result': self._keep(retval)}
+            return upsert_persistently_and_cache(self._collection, self._cache_key, data, self.name)
         
\ No newline at end of file
@@ -5,31 +5,159 @@ from ..database import Database
 from bson import ObjectId
 
 # Cache
-from ..cache import Cache
+from ..cache import Cache, Cache_Codec, Document_Cache
 
+# Result Storage
+from .store import Result_Store, Result_Reference
 
-def cache_mongo_id(_id:ObjectId, cache_key:str, cache_sub_key:str=None):
-    ''' Cache the ID of persistently stored data '''
+# Utilities
+import hashlib, pickle
 
-    Cache().cache_dynamic_dict(cache_key, {cache_sub_key: str(_id)}) if cache_sub_key else Cache().cache_string(cache_key, str(_id))
+# Typing
+from typing import Union
 
+# Debug
+import logging
 
-def insert_persistently_and_cache(collection:str, cache_key:str, document:dict, cache_sub_key=None):
-    ''' Store data persistently in the database and make it easily available via the cache '''
 
+def cache_mongo_id(_id:ObjectId, cache_key:str, cache_sub_key:str=None) -> ObjectId:
+    ''' Cache the ID of persistently stored data (unless a later ID is cached for `cache_sub_key`). Returns the ID '''
+
+    cache = Cache(shared=True)
+    cache.cache_dynamic_dict_if_greater(cache_key, {cache_sub_key: str(_id)}) if cache_sub_key else cache.cache_string(cache_key, str(_id))
+    return _id
+
+
+def insert_persistently_and_cache(collection:str, cache_key:str, document:dict, cache_sub_key=None) -> ObjectId:
+    ''' Store data persistently in the database and make it easily available via the cache. Returns the ID of the stored data '''
+
+    with Database(collection=collection) as db:
+        return cache_mongo_id(db.insert_one(document).inserted_id, cache_key, cache_sub_key)
+
+
+def result_key(name:str) -> str:
+    ''' The cache key the latest result for a task is stored under when it's cached directly '''
+
+    return f'_task_result_:{name}'
+
+
+def cache_result(name:str, task_id:str, result, ttl:int, max_bytes:int=None, exact:bool=False, cache:Cache=None, order:ObjectId=None) -> bool:
+    ''' Cache the latest result of a task under `result_key()` for `ttl` seconds so it can be read in one round trip.
+        If `max_bytes` is passed, larger results aren't cached (and any older cached result is removed). If `exact` is set,
+        results the codec can only store as JSON (and would be read back as different types) aren't cached either.
+        Writes through `cache` if passed (e.g. a `Cache.batch()`). Returns True if the result was cached
+
+        `order` (the ID of the stored result, a new ObjectId by default) orders runs, so a run finishing after a later
+        one can't replace its result
+    '''
+
+    cache = cache or Cache(shared=True)
+    order = str(order or ObjectId())
+    encoded = Cache_Codec.encode({'task_id': str(task_id), 'task_result': result})
+    if (max_bytes is not None and len(encoded) > max_bytes) or (exact and encoded[2:3] == Cache_Codec.JSON):
+        cache.cache_string_if_newer(result_key(name), order, b'', ttl); return False
+
+    cache.cache_string_if_newer(result_key(name), order, encoded, ttl)
+    return True
+
+
+def get_cached_result(name:str) -> dict:
+    ''' Get the result cached for a task with `cache_result()` (a dictionary with the `task_id` and `task_result`) or None '''
+
+    cached = Cache(shared=True).get_raw(result_key(name))
+    encoded = cached[len(str(ObjectId())):] if cached else None    # Skip the order of the run
+    if not encoded or not Cache_Codec.is_encoded(encoded):
+        return None     # No result cached for the latest run (or one cached by an older version)
+
+    return Cache_Codec.decode(encoded)
+
+
+def args_key(args:Union[list, tuple]=None, kwargs:dict=None) -> str:
+    ''' Stable hash identifying a set of task arguments (the same across processes and for lists/tuples) '''
+
+    return hashlib.sha1(Cache_Codec.encode([list(args or []), sorted((kwargs or {}).items())], 0)).hexdigest()
+
+
+def memo_key(name:str, key:str) -> str:
+    ''' The cache key the result of a memoized task is stored under for a set of arguments (see `args_key()`) '''
+
+    return f'_task_memo_:{name}:{key}'
+
+
+def memoize_result(name:str, key:str, task_id:str, result, ttl:int) -> bool:
+    ''' Cache the result of a memoized task for a set of arguments (see `args_key()`) for `ttl` seconds. Results are
+        pickled so they're read back as the same types. Results that can't be pickled aren't memoized. Returns True if cached
+    '''
+
+    try:
+        pickled = pickle.dumps({'task_id': str(task_id), 'task_result': result}, pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        logging.warning(f'Not memoizing the result of task [{name}] as it can\'t be pickled: {type(e).__name__}: {e}'); return False
+
+    Cache(shared=True).cache_string(memo_key(name, key), Result_Store.encode(pickled), ttl)
+    return True
+
+
+def get_memoized_result(name:str, key:str) -> dict:
+    ''' Get the result cached for a memoized task with `memoize_result()` (a dictionary with the `task_id` and `task_result`) or None '''
+
+    memoized = Cache(shared=True).get_raw(memo_key(name, key))
+    try:
+        return Result_Store.decode(memoized) if memoized else None
+    except Exception:
+        return None     # Not written by `memoize_result()` (e.g. cached by an older version)
+
+
+def running_key(name:str, key:str) -> str:
+    ''' The cache key holding the ID of the run of a deduplicated task in progress for a set of arguments (see `args_key()`) '''
+
+    return f'_task_running_:{name}:{key}'
+
+
+def latest_id(name:str) -> str:
+    ''' The deterministic `_id` of the document holding the latest data stored for a name with `upsert_persistently_and_cache()` '''
+
+    return f'_latest_:{name}'
+
+
+def upsert_persistently_and_cache(collection:str, cache_key:str, document:dict, cache_sub_key=None) -> str:
+    ''' Replace the latest data stored for `cache_sub_key` (or `cache_key`) in a single atomic write. Returns the ID of the stored data
+
+        The document is stored under `latest_id()` so it can be read without looking up an ID in the cache and
+        concurrent writers can't leave orphaned documents behind
+    '''
+
+    _id = latest_id(cache_sub_key or cache_key)
     with Database(collection=collection) as db:
-        cache_mongo_id(db.insert_one(document).inserted_id, cache_key, cache_sub_key)
+        # Only reference fields of the replaced result are returned (never the result itself)
+        replaced = db.find_one_and_replace({'_id': _id}, document, {f'task_result.{Result_Reference.FIELD}': 1, 'task_result.key': 1, 'task_result.size': 1}, upsert=True)
+
+        # Drop the cached copy read by `Task_Manager.get_result()`
+        Document_Cache.invalidate(db, _id)
+
+    # Remove large results the replaced data pointed to from the result store
+    if replaced and replaced.get('task_result'):
+        Result_Store.release(replaced['task_result'], document.get('task_result'))
 
+    return _id
 
-def upsert_persistently_and_cache(collection:str, cache_key:str, document:dict, cache_sub_key=None):
-    ''' Update data stored persistently or insert if no data stored '''
 
-    cache = Cache()
-    if cache_sub_key:
-        _id = cache.get_dynamic_dict_value(cache_key, cache_sub_key) or ObjectId()
-    else:
-        _id = cache.get(cache_key) or ObjectId()
+def migrate_to_latest_id(collection:str, cache_key:str, name:str) -> int:
+    ''' Move the newest result stored for `name` before latest results had a deterministic `_id` to `latest_id()`
+        (unless a newer one is stored there) and remove the rest, which were orphaned by concurrent writers.
+        Returns the number of documents removed
+    '''
 
     with Database(collection=collection) as db:
-        db.delete_one({'_id': ObjectId(_id)})
-        cache_mongo_id(db.insert_one(document).inserted_id, cache_key, cache_sub_key)
+        legacy = {'task_name': name, '_id': {'$type': 'objectId'}}
+        newest = db.find_one(legacy, sort=[('_id', -1)])
+        if not newest:
+            return 0
+
+        newest.pop('_id')
+        db.update_one({'_id': latest_id(name)}, {'$setOnInsert': newest}, upsert=True)
+        removed = db.delete_many(legacy).deleted_count
+
+    # The ID of the latest result no longer needs to be cached
+    Cache(shared=True).clear_dynamic_dict_value(cache_key, name)
+    return removed
@@ -0,0 +1,187 @@
+''' Buffered bulk writes of task results '''
+
+# Database
+from ..database import Database
+from pymongo.errors import BulkWriteError
+
+# Cache
+from ..cache import Cache
+
+# Task Settings
+from ..config import RabbitMQ_Settings
+
+# Celery
+from celery.signals import worker_process_shutdown, worker_shutdown
+
+# Utilities
+import atexit, os, threading, time
+
+# Typing
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Debug
+import logging
+
+
+class Result_Writer:
+    ''' Buffers task results in a worker process and stores them in batches: one `insert_many` and one pipelined cache
+        update (IDs of the latest results plus any `on_stored` commands) per batch
+
+        A batch is written once `batch_size` results are buffered, when the oldest buffered result is `flush_seconds`
+        old and when the worker shuts down. At most `max_buffered` results are held. Adding more blocks until the
+        buffer is written. The ID of the latest result for a task only moves to a later ID (compared and set atomically in
+        the cache), so batches written out of order by different workers can't make `Task_Manager.get_result()` go back to
+        an older result
+    '''
+
+    PENDING = object()      # Returned by `Database_Task.success()` when a result will be announced once its batch is written
+
+    _writers:Dict[Tuple[int, str, str], 'Result_Writer'] = {}   # (process ID, collection, cache key) -> writer
+    _lock = threading.Lock()
+
+    def __init__(self, collection:str, cache_key:str, batch_size:int=None, flush_seconds:float=None, max_buffered:int=None):
+        self.collection = collection
+        self.cache_key = cache_key
+        self.batch_size = batch_size or RabbitMQ_Settings.TASK_RESULT_BATCH_SIZE
+        self.flush_seconds = flush_seconds or RabbitMQ_Settings.TASK_RESULT_FLUSH_SECONDS
+        self.max_buffered = max(self.batch_size, max_buffered or RabbitMQ_Settings.TASK_RESULT_BUFFER_SIZE)
+
+        self._buffer:List[Tuple[dict, str, Callable]] = []
+        self._oldest:float = None                       # time.monotonic() the oldest buffered result was added
+        self._buffer_lock = threading.Condition()
+        self._flush_lock = threading.Lock()             # Batches are written one at a time, in order
+        self._flusher:threading.Thread = None
+
+
+    @classmethod
+    def for_collection(cls, collection:str, cache_key:str) -> 'Result_Writer':
+        ''' The writer for a results collection in this process '''
+
+        key = (os.getpid(), collection, cache_key)     # Forked worker processes get their own writers
+        with cls._lock:
+            if key not in cls._writers:
+                cls._writers[key] = cls(collection, cache_key)
+
+            return cls._writers[key]
+
+
+    @staticmethod
+    def is_enabled() -> bool:
+        ''' Check if results are written in batches (`TASK_RESULT_BATCH_SIZE` is over 1) '''
+
+        return RabbitMQ_Settings.TASK_RESULT_BATCH_SIZE > 1
+
+
+    def add(self, document:dict, name:str, on_stored:Callable[[Cache, Optional[str], bool], None]=None):
+        ''' Buffer a result document (with an `_id`) for task `name`
+
+            `on_stored(cache, error, latest)` is called once the batch is written, with a `Cache` whose commands are sent with
+            the batch's cache update, the error if the result couldn't be stored and whether it became the task's latest result
+        '''
+
+        with self._buffer_lock:
+            while len(self._buffer) >= self.max_buffered:
+                self._buffer_lock.wait()
+
+            self._buffer.append((document, name, on_stored))
+            if self._oldest is None: self._oldest = time.monotonic()
+            full = len(self._buffer) >= self.batch_size
+            self._buffer_lock.notify_all()
+
+        if full:
+            self.flush()
+        elif self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_when_due, name='task-result-writer', daemon=True)
+                    self._flusher.start()
+
+
+    def _flush_when_due(self):
+        while True:
+            with self._buffer_lock:
+                while self._oldest is None:
+                    self._buffer_lock.wait()
+                wait = self._oldest + self.flush_seconds - time.monotonic()
+
+            if wait > 0:
+                time.sleep(wait); continue
+
+            try:
+                self.flush()
+            except Exception as e:
+                logging.warning(f'Failed to write task results: {e}')
+
+
+    def flush(self) -> int:
+        ''' Write every buffered result. Returns the number stored '''
+
+        with self._flush_lock:
+            with self._buffer_lock:
+                batch, self._buffer, self._oldest = self._buffer, [], None
+                self._buffer_lock.notify_all()
+
+            if not batch:
+                return 0
+
+            errors = self._insert([document for document, _, _ in batch])
+            try:
+                self._announce(batch, errors)
+            except Exception as e:
+                logging.warning(f'Failed to announce [{len(batch)}] stored task results: {e}')
+
+            return len(batch) - len(errors)
+
+
+    def _insert(self, documents:List[dict]) -> Dict[int, str]:
+        ''' Insert a batch. Returns errors by position in the batch '''
+
+        try:
+            with Database(collection=self.collection) as db:
+                db.insert_many(documents, ordered=False)
+            return {}
+        except BulkWriteError as e:
+            return {error['index']: error.get('errmsg', 'Write failed') for error in e.details.get('writeErrors', [])}
+        except Exception as e:
+            logging.warning(f'Failed to write [{len(documents)}] task results: {e}')
+            return {num: f'{type(e).__name__}: {e}' for num in range(len(documents))}
+
+
+    def _announce(self, batch:List[Tuple[dict, str, Callable]], errors:Dict[int, str]):
+        ''' Point the cache at the newest stored result of each task and run the `on_stored` callbacks, in one round trip '''
+
+        cache = Cache(shared=True)
+        newest = {}
+        for num, (document, name, _) in enumerate(batch):
+            if num not in errors: newest[name] = num
+
+        # Keep the current latest result if another worker stored a later one (ObjectIds sort by the time they were generated)
+        latest = {}
+        if newest:
+            updated = cache.cache_dynamic_dict_if_greater(self.cache_key, {name: str(batch[num][0]['_id']) for name, num in newest.items()})
+            latest = {name: newest[name] for name in updated}
+
+        with cache.batch(transaction=False) as pipe:
+            for num, (_, name, on_stored) in enumerate(batch):
+                if on_stored: on_stored(pipe, errors.get(num), latest.get(name) == num)
+
+
+    @classmethod
+    def flush_all(cls, **kwargs) -> int:
+        ''' Write the results buffered by every writer in this process. Returns the number stored '''
+
+        writers = [writer for (pid, _, _), writer in list(cls._writers.items()) if pid == os.getpid()]
+        stored = 0
+        for writer in writers:
+            try:
+                stored += writer.flush()
+            except Exception as e:
+                logging.warning(f'Failed to write task results for [{writer.collection}]: {e}')
+
+        return stored
+
+
+# Write buffered results before the worker exits
+atexit.register(Result_Writer.flush_all)
+worker_process_shutdown.connect(Result_Writer.flush_all, weak=False)
+worker_shutdown.connect(Result_Writer.flush_all, weak=False)